@@ -0,0 +1,83 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+# Thread-safe LRU cache bounded by entry count and, optionally, by total size
+# (as measured by `sizeof`) and entry age. Keys should include the data version
+# so that rewritten files never serve stale entries.
+class LRUCache:
+    def __init__(self, max_entries=128, max_bytes=None, ttl=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return value
+            self.entries[key] = (value, size, time.monotonic())
+            self.size += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    # Drops the entries whose key satisfies `match` and returns how many.
+    def discard(self, match):
+        with self.lock:
+            keys = [key for key in self.entries if match(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
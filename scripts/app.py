@@ -1,20 +1,295 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, stream_with_context
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import io
 import os
+import gzip
+import zlib
+from datetime import datetime, timezone
+from feature_store import load_summary_index, summary_file
+from storage import load_features, data_version, in_database
+import timeseries_db
+from api_cache import LRUCache
+import shared_frames
+from refresh_auth import refresh_allowed
+from batch_model import load_model_table, model_index_file, predict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 app = Flask(__name__)
 
-data_path = 'cleaned_data'
+cache_ttl = 300
+frame_cache = LRUCache(max_entries=64, max_bytes=256 * 1024 * 1024, ttl=cache_ttl,
+                       sizeof=lambda df: int(df.memory_usage(deep=True).sum()))
+json_cache = LRUCache(max_entries=256, max_bytes=256 * 1024 * 1024, ttl=cache_ttl)
+summary_cache = LRUCache(max_entries=2)
+model_cache = LRUCache(max_entries=2)
 
+summary_fields = ['start', 'end', 'rows', 'last_close', 'last_cumulative_return', 'last_rolling_volatility',
+                  'high_52w', 'low_52w']
+max_batch_symbols = 5000
 
-def load_data(stock):
-    file_path = os.path.join(data_path, f'cleaned_{stock}_TATA_data.csv')
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-        return df
-    else:
+resample_rules = {'D': 'D', 'W': 'W', 'M': 'ME', 'Q': 'QE', 'Y': 'YE'}
+ohlc_aggregations = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+orients = ['records', 'columns']
+
+stream_chunk_rows = 5000
+stream_formats = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+formats = ['json'] + list(stream_formats)
+encodings = (['zstd'] if zstandard is not None else []) + ['gzip']
+# Cached bodies are compressed once; streams are compressed on every request,
+# so they trade ratio for speed.
+cached_compress_level = 6
+stream_compress_level = 1
+
+
+# Frames are cached per (stock, data version): rerunning clean_data.py rewrites
+# the files, changes the version and so bypasses the old entries. Cached frames
+# are shared between requests (and, under serve.py, memory-mapped by all
+# workers) and must not be modified.
+def load_data(stock, version=None):
+    version = version or data_version(stock)
+    if version is None:
         return None
+    return frame_cache.get_or_compute((stock, version[0]),
+                                      lambda: shared_frames.load(stock, version[0], lambda: load_features(stock)))
+
+
+def to_records(df):
+    return df.assign(timestamp=df['timestamp'].astype(str)).to_dict(orient='records')
+
+
+# Column-oriented JSON ({column: [values]}) skips the per-row dicts of 'records'.
+def to_columns(df):
+    data = {col: df[col].tolist() for col in df.columns}
+    data['timestamp'] = df['timestamp'].astype(str).tolist()
+    return data
+
+
+def parse_query(args, columns):
+    query = {}
+    for name in ['start', 'end', 'cursor']:
+        if args.get(name):
+            try:
+                query[name] = pd.Timestamp(args[name])
+            except ValueError:
+                raise ValueError(f"Invalid date for '{name}': {args[name]}")
+    if args.get('columns'):
+        requested = [c for c in args['columns'].split(',') if c]
+        unknown = [c for c in requested if c not in columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        query['columns'] = ['timestamp'] + [c for c in requested if c != 'timestamp']
+    if args.get('limit'):
+        if not args['limit'].isdigit() or int(args['limit']) == 0:
+            raise ValueError("'limit' must be a positive integer")
+        query['limit'] = int(args['limit'])
+    if args.get('resample'):
+        if args['resample'] not in resample_rules:
+            raise ValueError(f"'resample' must be one of {', '.join(resample_rules)}")
+        query['resample'] = resample_rules[args['resample']]
+    query['orient'] = args.get('orient', 'records')
+    if query['orient'] not in orients:
+        raise ValueError(f"'orient' must be one of {', '.join(orients)}")
+    query['format'] = args.get('format', 'json')
+    if query['format'] not in formats:
+        raise ValueError(f"'format' must be one of {', '.join(formats)}")
+    return query
+
+
+# Frames are sorted by timestamp, so date bounds are found by binary search.
+def date_slice(df, start=None, end=None):
+    timestamps = df['timestamp'].to_numpy()
+    lo = 0 if start is None else np.searchsorted(timestamps, start.to_datetime64(), side='left')
+    hi = len(df) if end is None else np.searchsorted(timestamps, end.to_datetime64(), side='right')
+    return df.iloc[lo:hi]
+
+
+def resample_aggregations(columns):
+    return {col: ohlc_aggregations.get(col, 'last') for col in columns if col != 'timestamp'}
+
+
+# Periods without bars are dropped (a summed column would otherwise show them
+# as zeros).
+def downsample(df, rule):
+    resampler = df.resample(rule, on='timestamp')
+    resampled = resampler.agg(resample_aggregations(df.columns))
+    return resampled[resampler.size() > 0].reset_index()
+
+
+# Applies a parsed query: date range, resampling, column projection, then a
+# page of at most `limit` rows starting at `cursor`. Returns the page and the
+# cursor of the next page (None on the last page).
+def query_frame(df, query):
+    df = date_slice(df, query.get('start'), query.get('end'))
+    if 'resample' in query:
+        df = downsample(df, query['resample'])
+    if 'columns' in query:
+        df = df[query['columns']]
+    df = date_slice(df, query.get('cursor'))
+    next_cursor = None
+    if 'limit' in query and len(df) > query['limit']:
+        next_cursor = df['timestamp'].iloc[query['limit']].isoformat()
+        df = df.iloc[:query['limit']]
+    return df, next_cursor
+
+
+# query_frame run by the database: the range, cursor and limit become an
+# indexed range scan and resampling a GROUP BY, so only the page is read.
+# One row past the limit is fetched to find the next cursor.
+def query_database(stock, columns, query):
+    columns = query.get('columns', list(columns))
+    limit = query['limit'] + 1 if 'limit' in query else None
+    if 'resample' in query:
+        df = timeseries_db.resample_bars(stock, query['resample'], resample_aggregations(columns), query.get('start'),
+                                         query.get('end'), query.get('cursor'), limit)
+    else:
+        df = timeseries_db.page_bars(stock, columns, query.get('start'), query.get('end'), query.get('cursor'), limit)
+    next_cursor = None
+    if 'limit' in query and len(df) > query['limit']:
+        next_cursor = df['timestamp'].iloc[query['limit']].isoformat()
+        df = df.iloc[:query['limit']]
+    return df, next_cursor
+
+
+# query_database for a streamed format: the page's bars are fetched
+# stream_chunk_rows at a time while the response is sent. The next cursor goes
+# in a header, so it is looked up first. Resampled pages (a row per period)
+# are read whole.
+def stream_database(stock, columns, query):
+    if 'resample' in query:
+        df, next_cursor = query_database(stock, columns, query)
+        return frame_chunks(df), next_cursor
+    columns = query.get('columns', list(columns))
+    next_cursor = None
+    if 'limit' in query:
+        after = timeseries_db.bar_at(stock, query.get('start'), query.get('end'), query.get('cursor'), query['limit'])
+        next_cursor = None if after is None else after.isoformat()
+    chunks = timeseries_db.iter_bars(stock, columns, query.get('start'), query.get('end'), query.get('cursor'),
+                                     query.get('limit'), stream_chunk_rows)
+    return chunks, next_cursor
+
+
+def negotiate_encoding():
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=cached_compress_level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=cached_compress_level).compress(body)
+    return body
+
+
+def compressor(encoding):
+    if encoding == 'gzip':
+        return zlib.compressobj(stream_compress_level, zlib.DEFLATED, 31)
+    return zstandard.ZstdCompressor(level=stream_compress_level).compressobj()
+
+
+def compress_stream(chunks, encoding):
+    if encoding is None:
+        yield from chunks
+        return
+    stream = compressor(encoding)
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+def cached_json(key, build, encoding=None):
+    body = json_cache.get_or_compute(key, lambda: app.json.dumps(build()).encode())
+    if encoding is None:
+        return body
+    return json_cache.get_or_compute(key + (encoding,), lambda: compress(body, encoding))
+
+
+# A frame as the chunks the streamers take: at least one, empty for an empty
+# frame.
+def frame_chunks(df):
+    for start in range(0, max(len(df), 1), stream_chunk_rows):
+        yield df.iloc[start:start + stream_chunk_rows]
+
+
+def text_timestamps(chunk):
+    return chunk.assign(timestamp=chunk['timestamp'].astype(str))
+
+
+# Encoded like the JSON responses, so values round-trip: to_json would round
+# them to at most 15 significant digits.
+def stream_ndjson(chunks):
+    for chunk in chunks:
+        if len(chunk):
+            yield ''.join(app.json.dumps(record) + '\n' for record in to_records(chunk)).encode()
+
+
+def stream_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield text_timestamps(chunk).to_csv(index=False, header=header).encode()
+        header = False
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+# Arrow IPC stream with one record batch per chunk; timestamps stay typed.
+def stream_arrow(chunks):
+    sink = io.BytesIO()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            writer = pa.ipc.new_stream(sink, schema)
+        if len(chunk):
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+
+streamers = {'ndjson': stream_ndjson, 'csv': stream_csv, 'arrow': stream_arrow}
+
+
+# Streams `chunks` (frames of at most stream_chunk_rows rows) so that
+# per-request memory is bounded by the chunk size rather than the row count.
+def stream_response(chunks, fmt, encoding):
+    chunks = compress_stream(streamers[fmt](chunks), encoding)
+    return app.response_class(stream_with_context(chunks), mimetype=stream_formats[fmt])
+
+
+# Labels a body compressed with `encoding` (None when it was sent as is).
+def encoded_response(response, encoding=None):
+    response.vary.add('Accept-Encoding')
+    if encoding is not None and response.status_code == 200:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def conditional_response(response, version, encoding=None):
+    response.set_etag(version[0] if encoding is None else f'{version[0]}-{encoding}')
+    response.last_modified = datetime.fromtimestamp(version[1], tz=timezone.utc)
+    return encoded_response(response, encoding).make_conditional(request)
+
+
+def json_response(body):
+    return app.response_class(body, mimetype='application/json')
     
 
 @app.route('/')
@@ -24,12 +299,165 @@ def home():
 
 @app.route('/api/data/<stock>', methods=['GET'])
 def get_stock_data(stock):
-    df = load_data(stock)
-    if df is not None:
-        return jsonify(df.to_dict(orient='records'))
-    else:
+    version = data_version(stock)
+    if version is None:
         return jsonify({"error": "Data not found"}), 404
+    encoding = negotiate_encoding()
+    if request.if_none_match.contains(version[0] if encoding is None else f'{version[0]}-{encoding}'):
+        return conditional_response(json_response(b''), version, encoding)
+    if not request.args:
+        body = cached_json((stock, version[0], 'records'), lambda: to_records(load_data(stock, version)), encoding)
+        return conditional_response(json_response(body), version, encoding)
+
+    database = in_database(stock)
+    columns = timeseries_db.bar_columns() if database else load_data(stock, version).columns
+    try:
+        query = parse_query(request.args, columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    streamed = query['format'] in stream_formats
+    if database and streamed:
+        chunks, next_cursor = stream_database(stock, columns, query)
+    elif database:
+        page, next_cursor = query_database(stock, columns, query)
+    else:
+        page, next_cursor = query_frame(load_data(stock, version), query)
+        chunks = frame_chunks(page)
+    if streamed:
+        response = stream_response(chunks, query['format'], encoding)
+    else:
+        serialize = to_columns if query['orient'] == 'columns' else to_records
+        key = (stock, version[0], tuple(sorted(request.args.items())))
+        response = json_response(cached_json(key, lambda: serialize(page), encoding))
+    response = conditional_response(response, version, encoding)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def summary_version():
+    try:
+        stat = os.stat(summary_file)
+    except FileNotFoundError:
+        return None
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}', stat.st_mtime
+
+
+# The summary index written by clean_data.py, parsed once per file version.
+def load_summary(version):
+    return summary_cache.get_or_compute(version[0], load_summary_index)
+
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    version = summary_version()
+    if version is None:
+        return jsonify({"error": "Summary index not found"}), 404
+    encoding = negotiate_encoding()
+    body = cached_json(('summary', version[0]), lambda: load_summary(version), encoding)
+    return conditional_response(json_response(body), version, encoding)
+
+
+@app.route('/api/batch', methods=['GET'])
+def get_batch():
+    symbols = [s for s in request.args.get('symbols', '').split(',') if s]
+    if not symbols:
+        return jsonify({"error": "'symbols' is required"}), 400
+    if len(symbols) > max_batch_symbols:
+        return jsonify({"error": f"At most {max_batch_symbols} symbols per request"}), 400
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or summary_fields
+    unknown = [f for f in fields if f not in summary_fields]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    version = summary_version()
+    if version is None:
+        return jsonify({"error": "Summary index not found"}), 404
+    index = load_summary(version)
+    data = {s: {f: index[s][f] for f in fields} for s in symbols if s in index}
+    missing = [s for s in symbols if s not in index]
+    encoding = negotiate_encoding()
+    body = compress(app.json.dumps({'data': data, 'missing': missing}).encode(), encoding)
+    return conditional_response(json_response(body), version, encoding)
+
+
+def model_version():
+    try:
+        stat = os.stat(model_index_file)
+    except FileNotFoundError:
+        return None
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}', stat.st_mtime
+
+
+# The coefficient table written by batch_model.py, memory-mapped once per
+# version of its index file (which is written after the arrays).
+def load_model(version):
+    return model_cache.get_or_compute(version[0], load_model_table)
+
+
+# GET scores the last bar of each symbol; POST scores the feature rows given as
+# {"rows": {"<symbol>": {"<feature>": value, ...}, ...}}. Either way all
+# symbols are scored in a single product against the coefficient table.
+@app.route('/api/predict', methods=['GET', 'POST'])
+def get_predictions():
+    version = model_version()
+    if version is None:
+        return jsonify({"error": "Model table not found, run batch_model.py"}), 404
+    index, coefficients, latest = load_model(version)
+    features = index['columns'][1:]
+
+    if request.method == 'POST':
+        rows = (request.get_json(silent=True) or {}).get('rows')
+        if not isinstance(rows, dict) or not rows:
+            return jsonify({"error": "'rows' must map symbols to feature values"}), 400
+        symbols = list(rows)
+    else:
+        symbols = [s for s in request.args.get('symbols', '').split(',') if s]
+        if not symbols:
+            return jsonify({"error": "'symbols' is required"}), 400
+    if len(symbols) > max_batch_symbols:
+        return jsonify({"error": f"At most {max_batch_symbols} symbols per request"}), 400
+
+    found = [s for s in symbols if s in index['positions']]
+    missing = [s for s in symbols if s not in index['positions']]
+    positions = np.array([index['positions'][s] for s in found], dtype='int64')
+    if request.method == 'POST':
+        try:
+            x = np.array([[float(rows[s][f]) for f in features] for s in found], dtype='float64')
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": f"Each row needs numeric values for: {', '.join(features)}"}), 400
+    else:
+        x = latest[positions]
+    scores = predict(coefficients[positions], x.reshape(len(found), len(features)))
+    body = {'predictions': dict(zip(found, scores.tolist())), 'missing': missing,
+            'trained_at': index['trained_at']}
+    encoding = negotiate_encoding()
+    response = json_response(compress(app.json.dumps(body).encode(), encoding))
+    if request.method == 'POST':
+        return encoded_response(response, encoding)
+    return conditional_response(response, version, encoding)
+
+
+# Called by scheduler.py after a run with the tickers it rewrote. Their entries
+# would only be bypassed by the version check; dropping them frees the memory
+# now. Without tickers every cache is cleared. Only the scheduler may call it
+# (see refresh_auth.py).
+@app.route('/api/cache/refresh', methods=['POST'])
+def refresh_cache():
+    if not refresh_allowed(request):
+        return jsonify({"error": "Refresh not allowed"}), 403
+    tickers = (request.get_json(silent=True) or {}).get('tickers')
+    match = (lambda key: True) if not tickers else (lambda key: key[0] in tickers)
+    dropped = frame_cache.discard(match) + json_cache.discard(match)
+    summary_cache.clear()
+    model_cache.clear()
+    return jsonify({'dropped': dropped})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'frames': frame_cache.stats(), 'json': json_cache.stats()})
     
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
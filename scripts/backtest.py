@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from storage import load_features, list_tickers
+from batch_model import model_features, target
+
+
+metrics_file = 'metrics.json'
+file_suffix = '_TATA_data.csv'
+
+# Expanding-window walk-forward: the model is fitted on rows [0, end) and
+# scored on the next `fold_rows` rows, then the window grows by `fold_rows`.
+min_train_rows = 2 * (len(model_features) + 1)
+fold_rows = 5
+
+
+# Each fold is fitted from the R factor of [design | y] over its training
+# rows, grown by a QR of R stacked on the next fold's rows, so growing the
+# window is an update rather than a refit. The normal equations would square
+# the condition number of the nearly collinear OHLC columns (see
+# batch_model.fit_block). R has the singular values of the design, and its
+# pseudo-inverse gives lstsq's minimum-norm solution with the same cutoff.
+# Features are scaled with the first training window only, which conditions
+# the fit without using future data.
+def walk_forward(x, y, min_train=min_train_rows, step=fold_rows):
+    n = len(x)
+    mean = x[:min_train].mean(axis=0)
+    scale = x[:min_train].std(axis=0)
+    scale[scale == 0] = 1.0
+    design = np.column_stack([np.ones(n), (x - mean) / scale])
+    width = design.shape[1]
+
+    ends = np.arange(min_train, n, step)
+    factors = np.empty((len(ends), width + 1, width + 1))
+    r = np.linalg.qr(np.column_stack([design[:min_train], y[:min_train]]), mode='r')
+    for fold, end in enumerate(ends):
+        if fold:
+            rows = np.column_stack([design[ends[fold - 1]:end], y[ends[fold - 1]:end]])
+            r = np.linalg.qr(np.vstack([r, rows]), mode='r')
+        factors[fold, :len(r)] = r
+        factors[fold, len(r):] = 0
+    cutoff = np.finfo('float64').eps * np.maximum(ends, width)
+    coefficients = np.einsum('fij,fj->fi', np.linalg.pinv(factors[:, :width, :width], rcond=cutoff),
+                             factors[:, :width, width])
+
+    rows = np.arange(min_train, n)
+    fold = (rows - min_train) // step
+    errors = np.einsum('ri,ri->r', design[rows], coefficients[fold]) - y[rows]
+    fold_mse = np.bincount(fold, weights=errors ** 2) / np.bincount(fold)
+    return ends, fold_mse, errors
+
+
+def backtest_ticker(ticker, min_train=min_train_rows, step=fold_rows):
+    start = time.perf_counter()
+    df = load_features(ticker, columns=['timestamp'] + model_features + [target])
+    if df is None:
+        raise ValueError('Data not found')
+    df = df.dropna()
+    if len(df) <= min_train:
+        raise ValueError(f'{len(df)} rows, need more than {min_train}')
+    ends, fold_mse, errors = walk_forward(df[model_features].to_numpy('float64'),
+                                          df[target].to_numpy('float64'), min_train, step)
+    timestamps = df['timestamp'].dt.strftime('%Y-%m-%d').to_numpy()
+    return {
+        'processing_status': 'Completed',
+        'min_train': min_train,
+        'fold_rows': step,
+        'folds': len(ends),
+        'fold_start': timestamps[ends].tolist(),
+        'fold_mse': fold_mse.tolist(),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mae': float(np.mean(np.abs(errors))),
+        'backtest_time': time.perf_counter() - start
+    }
+
+
+def backtest_chunk(chunk, min_train=min_train_rows, step=fold_rows):
+    results = {}
+    for ticker in chunk:
+        try:
+            results[ticker] = backtest_ticker(ticker, min_train, step)
+        except Exception as e:
+            results[ticker] = {'processing_status': 'Failed', 'error_message': str(e) or type(e).__name__}
+    return results
+
+
+def run_backtests(tickers, workers=None, chunksize=16, min_train=min_train_rows, step=fold_rows):
+    chunks = [tickers[i:i + chunksize] for i in range(0, len(tickers), chunksize)]
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(backtest_chunk, chunk, min_train, step) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.update(future.result())
+            except Exception as e:
+                error = {'processing_status': 'Failed', 'error_message': str(e) or type(e).__name__}
+                results.update({ticker: error for ticker in chunk})
+    folds = sum(r.get('folds', 0) for r in results.values())
+    print(f"Backtested {len(tickers)} tickers ({folds} folds) in {time.perf_counter() - start:.2f} s")
+    return results
+
+
+# Results go under 'backtest' in each ticker's metrics.json entry, next to the
+# processing metrics written by clean_data.py.
+def merge_into_metrics(results, metrics):
+    for ticker, result in results.items():
+        metrics.setdefault(f'{ticker}{file_suffix}', {})['backtest'] = result
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of the close-price model.')
+    parser.add_argument('tickers', nargs='*', help='default: every ticker in the feature store')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument('--min-train', type=int, default=min_train_rows, help='rows in the first training window')
+    parser.add_argument('--step', type=int, default=fold_rows, help='rows scored per fold')
+    args = parser.parse_args()
+
+    results = run_backtests(args.tickers or list_tickers(), args.workers, args.chunksize, args.min_train, args.step)
+    metrics = {}
+    if os.path.exists(metrics_file):
+        with open(metrics_file, 'r') as f:
+            metrics = json.load(f)
+    with open(metrics_file, 'w') as f:
+        json.dump(merge_into_metrics(results, metrics), f)
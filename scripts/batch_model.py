@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+from storage import load_features, list_tickers
+
+
+model_path = 'models'
+coefficient_file = os.path.join(model_path, 'coefficients.npy')
+latest_file = os.path.join(model_path, 'latest_features.npy')
+model_index_file = os.path.join(model_path, 'coefficients.json')
+
+# Same problem as clean_data.train_predictive_model: close regressed on these
+# features with an intercept, evaluated on a 20% hold-out split.
+model_features = ['open', 'high', 'low', 'volume', '20_day_moving_avg', 'rolling_volatility']
+target = 'close'
+test_size = 0.2
+random_state = 42
+block_tickers = 256
+# fit_block pads every ticker of a block to the longest one and keeps a few
+# float64 copies of that (tickers, rows, features) array: 1M padded rows is
+# about 56 MB per copy.
+block_rows = 1_000_000
+
+
+# Train/test rows exactly as train_test_split(test_size=0.2, random_state=42)
+# picks them.
+def split_indices(n):
+    n_test = int(np.ceil(test_size * n))
+    permutation = np.random.RandomState(random_state).permutation(n)
+    return permutation[n_test:], permutation[:n_test]
+
+
+# Fits every ticker of a block at once. Rows are padded to the longest ticker
+# and masked out, features are centered and scaled per ticker, and the whole
+# block is solved with one stacked SVD pseudo-inverse (the normal equations lose
+# too much precision on the nearly collinear OHLC columns).
+# Returns (coefficients [intercept, features...], test MSE) per ticker.
+def fit_block(xs, ys):
+    count, length, width = len(xs), max(len(x) for x in xs), xs[0].shape[1]
+    x = np.zeros((count, length, width))
+    y = np.zeros((count, length))
+    train = np.zeros((count, length))
+    test = np.zeros((count, length))
+    for i, (xi, yi) in enumerate(zip(xs, ys)):
+        x[i, :len(xi)] = xi
+        y[i, :len(yi)] = yi
+        train_rows, test_rows = split_indices(len(xi))
+        train[i, train_rows] = 1
+        test[i, test_rows] = 1
+
+    train_count = train.sum(axis=1)
+    x_mean = np.einsum('bn,bnf->bf', train, x) / train_count[:, None]
+    y_mean = (train * y).sum(axis=1) / train_count
+    xc = (x - x_mean[:, None, :]) * train[:, :, None]
+    yc = (y - y_mean[:, None]) * train
+    scale = np.sqrt(np.einsum('bnf,bnf->bf', xc, xc))
+    scale[scale == 0] = 1.0
+    xc /= scale[:, None, :]
+
+    cutoff = np.finfo('float64').eps * max(length, width)
+    beta = np.einsum('bfn,bn->bf', np.linalg.pinv(xc, rcond=cutoff), yc) / scale
+    intercept = y_mean - (beta * x_mean).sum(axis=1)
+
+    residual = intercept[:, None] + np.einsum('bnf,bf->bn', x, beta) - y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = (residual ** 2 * test).sum(axis=1) / test.sum(axis=1)
+    return np.column_stack([intercept, beta]), mse
+
+
+def load_training_data(ticker):
+    df = load_features(ticker, columns=model_features + [target])
+    if df is None:
+        return None
+    df = df.dropna()
+    if len(df) < 2:
+        return None
+    return df[model_features].to_numpy('float64'), df[target].to_numpy('float64')
+
+
+# Tickers in blocks for fit_block, shortest first so that similar lengths share
+# a block and the padding stays small. A block is closed at block_tickers
+# tickers or when padding it to its longest ticker would exceed block_rows;
+# a ticker longer than that is fitted on its own.
+def blocks(lengths):
+    order = np.argsort(lengths, kind='stable')
+    block = []
+    for i in order:
+        if block and (len(block) == block_tickers or (len(block) + 1) * lengths[i] > block_rows):
+            yield block
+            block = []
+        block.append(int(i))
+    if block:
+        yield block
+
+
+def train_all(tickers=None):
+    tickers = list_tickers() if tickers is None else tickers
+    start = time.perf_counter()
+    data = {}
+    for ticker in tickers:
+        loaded = load_training_data(ticker)
+        if loaded is not None:
+            data[ticker] = loaded
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trained = sorted(data)
+    coefficients = np.zeros((len(trained), len(model_features) + 1))
+    mse = np.full(len(trained), np.nan)
+    for rows in blocks([len(data[t][0]) for t in trained]):
+        block = [trained[i] for i in rows]
+        coefficients[rows], mse[rows] = fit_block([data[t][0] for t in block], [data[t][1] for t in block])
+    fit_time = time.perf_counter() - start
+
+    latest = np.array([data[t][0][-1] for t in trained]).reshape(len(trained), len(model_features))
+    save_model_table(trained, coefficients, latest, mse, [len(data[t][0]) for t in trained])
+    print(f"Trained {len(trained)} models in {fit_time:.3f} s (loading {load_time:.2f} s), saved to {coefficient_file}")
+    return {t: {'mse': None if np.isnan(mse[i]) else float(mse[i]), 'rows': len(data[t][0])}
+            for i, t in enumerate(trained)}
+
+
+def write_array(array, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+# coefficients.npy is the (ticker x [intercept, features...]) table and
+# latest_features.npy the feature row of each ticker's last bar; the JSON index,
+# written last, maps tickers to rows.
+def save_model_table(tickers, coefficients, latest, mse, rows):
+    os.makedirs(model_path, exist_ok=True)
+    write_array(coefficients, coefficient_file)
+    write_array(latest, latest_file)
+    index = {
+        'tickers': tickers,
+        'columns': ['intercept'] + model_features,
+        'mse': [None if np.isnan(m) else float(m) for m in mse],
+        'rows': rows,
+        'trained_at': datetime.now(timezone.utc).isoformat()
+    }
+    tmp_path = f'{model_index_file}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, model_index_file)
+
+
+def load_model_table():
+    with open(model_index_file, 'r') as f:
+        index = json.load(f)
+    index['positions'] = {ticker: i for i, ticker in enumerate(index['tickers'])}
+    return index, np.load(coefficient_file, mmap_mode='r'), np.load(latest_file, mmap_mode='r')
+
+
+# One row of features per row of coefficients.
+def predict(coefficients, features):
+    coefficients = np.asarray(coefficients)
+    return coefficients[:, 0] + np.einsum('ij,ij->i', coefficients[:, 1:], features)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the close-price model of every ticker in one batch.')
+    parser.add_argument('tickers', nargs='*', help='default: every ticker in the feature store')
+    args = parser.parse_args()
+    train_all(args.tickers or None)
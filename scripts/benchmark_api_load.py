@@ -0,0 +1,120 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from benchmark_feature_store import synthetic_features
+from feature_store import write_features
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+modes = [
+    ('json (current)', '', None),
+    ('json columns', 'orient=columns', None),
+    ('ndjson', 'format=ndjson', None),
+    ('csv', 'format=csv', None),
+    ('arrow', 'format=arrow', None),
+    ('json + gzip', '', 'gzip'),
+    ('ndjson + gzip', 'format=ndjson', 'gzip'),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# VmHWM is the peak resident set size of the process (Linux only).
+def memory_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def fetch(url, encoding):
+    headers = {'Accept-Encoding': encoding or 'identity'}
+    start = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+        size = len(response.read())
+    return time.perf_counter() - start, size
+
+
+def wait_for_server(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def run_mode(data_dir, label, query, encoding, requests, concurrency):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=script_dir)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], cwd=data_dir, env=env)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        wait_for_server(base + '/', process)
+        # Load the frame into the server's cache first so that the peak below
+        # only measures per-request serialization memory.
+        urllib.request.urlopen(f'{base}/api/data/BENCH?limit=1').read()
+        idle_kb = memory_kb(process.pid, 'VmRSS')
+        url = f'{base}/api/data/BENCH' + (f'?{query}' if query else '')
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(lambda _: fetch(url, encoding), range(requests)))
+        elapsed = time.perf_counter() - start
+        peak_kb = memory_kb(process.pid, 'VmHWM')
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies = sorted(r[0] for r in results)
+    size = results[0][1]
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+    memory = 'n/a' if peak_kb is None else f'{(peak_kb - idle_kb) / 1024:7.1f} MB'
+    print(f"{label:>15}: {requests / elapsed:7.1f} req/s, p50 {p50:8.1f} ms, p95 {p95:8.1f} ms, "
+          f"body {size / 1e6:7.2f} MB, peak RSS over idle {memory}")
+
+
+def serve(port):
+    import logging
+    from werkzeug.serving import make_server
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the /api/data endpoint in each output mode.')
+    parser.add_argument('--days', type=int, default=200_000)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            df = synthetic_features(args.days, 0)
+            write_features(df, 'BENCH', root=os.path.join(tmp, 'feature_store'))
+            print(f"{args.days} rows, {args.requests} requests per mode, concurrency {args.concurrency}")
+            for label, query, encoding in modes:
+                run_mode(tmp, label, query, encoding, args.requests, args.concurrency)
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from benchmark_feature_store import synthetic_features
+from feature_store import write_features
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+# Runs in a fresh interpreter inside the synthetic universe: times the import
+# of dashboard.py (the cold start), the first access of one ticker and, with
+# `eager`, loading every ticker the way the dashboard used to at import time.
+def child(eager):
+    import time
+    import resource
+    start = time.perf_counter()
+    import dashboard
+    result = {'import': time.perf_counter() - start}
+    tickers = dashboard.dfs.tickers()
+    start = time.perf_counter()
+    dashboard.dfs[tickers[0]]
+    result['first_access'] = time.perf_counter() - start
+    if eager:
+        start = time.perf_counter()
+        for ticker in tickers:
+            dashboard.dfs[ticker]
+        result['load_all'] = time.perf_counter() - start
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result['loaded'] = len(dashboard.dfs.loaded())
+    print(json.dumps(result))
+
+
+def measure(data_dir, eager):
+    env = dict(os.environ, PYTHONPATH=script_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--child'] + (['--eager'] if eager else [])
+    output = subprocess.run(command, cwd=data_dir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(tickers, days):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'feature_store')
+        df = synthetic_features(days, 0)
+        for i in range(tickers):
+            write_features(df, f'T{i:05d}', root=root)
+        lazy = measure(tmp, eager=False)
+        eager = measure(tmp, eager=True)
+    print(f"{tickers:>6} tickers x {days} rows: cold start {lazy['import']:.2f} s, "
+          f"first ticker {lazy['first_access'] * 1000:.1f} ms, peak RSS {lazy['peak_rss_mb']:.0f} MB "
+          f"({lazy['loaded']} loaded) | loading all {eager['load_all']:.2f} s, "
+          f"peak RSS {eager['peak_rss_mb']:.0f} MB ({eager['loaded']} kept by the LRU)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure dashboard cold start against universe size.')
+    parser.add_argument('--tickers', type=int, nargs='+', default=[4, 100, 1000])
+    parser.add_argument('--days', type=int, default=2500)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.eager)
+    else:
+        for n in args.tickers:
+            run(n, args.days)
@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from feature_store import write_features, load_features
+
+
+def synthetic_features(days, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    df = pd.DataFrame({
+        'timestamp': pd.bdate_range('2000-01-03', periods=days).strftime('%Y-%m-%d'),
+        'open': close * (1 + rng.normal(0, 0.002, days)),
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': rng.integers(1_000_000, 20_000_000, days),
+    })
+    for col in ['daily_pct_change', 'cumulative_return', '20_day_moving_avg', 'rolling_volatility',
+                'mean_price', 'median_price', 'std_price', 'var_price', 'normalized_close', 'scaled_volume']:
+        df[col] = rng.normal(0, 1, days)
+    return df
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(tickers, days, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_dir = os.path.join(tmp, 'cleaned_data')
+        store_dir = os.path.join(tmp, 'feature_store')
+        os.makedirs(csv_dir)
+        names = [f'T{i:04d}' for i in range(tickers)]
+        for i, name in enumerate(names):
+            df = synthetic_features(days, i)
+            df.to_csv(os.path.join(csv_dir, f'cleaned_{name}_TATA_data.csv'), index=False)
+            write_features(df, name, root=store_dir)
+
+        last = pd.Timestamp(df['timestamp'].iloc[-1])
+        month_start = last - pd.Timedelta(days=30)
+
+        def csv_full():
+            for name in names:
+                pd.read_csv(os.path.join(csv_dir, f'cleaned_{name}_TATA_data.csv'), parse_dates=['timestamp'])
+
+        def csv_close_month():
+            for name in names:
+                df = pd.read_csv(os.path.join(csv_dir, f'cleaned_{name}_TATA_data.csv'), parse_dates=['timestamp'])
+                df.loc[df['timestamp'] >= month_start, ['timestamp', 'close']]
+
+        def store_full():
+            for name in names:
+                load_features(name, root=store_dir)
+
+        def store_close_month():
+            for name in names:
+                load_features(name, columns=['timestamp', 'close'], start=month_start, root=store_dir)
+
+        csv_bytes = sum(os.path.getsize(os.path.join(csv_dir, f)) for f in os.listdir(csv_dir))
+        store_bytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(store_dir) for f in files)
+
+        print(f"{tickers} tickers x {days} days")
+        print(f"on-disk size: csv {csv_bytes / 1e6:.1f} MB, store {store_bytes / 1e6:.1f} MB")
+        for label, csv_fn, store_fn in [('full history', csv_full, store_full),
+                                        ('close, last month', csv_close_month, store_close_month)]:
+            csv_time = timed(csv_fn, repeat)
+            store_time = timed(store_fn, repeat)
+            print(f"{label:>18}: csv {csv_time * 1000:8.1f} ms, store {store_time * 1000:8.1f} ms, "
+                  f"speedup {csv_time / store_time:5.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare cleaned CSV reads against the feature store.')
+    parser.add_argument('--tickers', type=int, default=50)
+    parser.add_argument('--days', type=int, default=252 * 10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.tickers, args.days, args.repeat)
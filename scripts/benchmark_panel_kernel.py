@@ -0,0 +1,43 @@
+import argparse
+import time
+import numpy as np
+from clean_data import add_features
+from panel_kernel import add_panel_features, compute_panel_features, stack_panel, feature_columns
+from synthetic_data import synthetic_ohlcv
+
+
+def run(tickers, days):
+    frames = [synthetic_ohlcv(days, i) for i in range(tickers)]
+    pandas_frames = [df.copy() for df in frames]
+
+    start = time.perf_counter()
+    for df in pandas_frames:
+        add_features(df)
+    pandas_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    numpy_frames = add_panel_features(frames)
+    numpy_time = time.perf_counter() - start
+
+    panel = stack_panel(frames)
+    out = np.empty((tickers, days, len(feature_columns)))
+    start = time.perf_counter()
+    compute_panel_features(panel, out=out)
+    kernel_time = time.perf_counter() - start
+
+    max_error = max(
+        np.nanmax(np.abs(a[feature_columns].to_numpy() - b[feature_columns].to_numpy()) / (1 + np.abs(a[feature_columns].to_numpy())))
+        for a, b in zip(pandas_frames, numpy_frames))
+    print(f"{tickers:>5} tickers x {days} days: pandas {pandas_time * 1000:9.1f} ms, "
+          f"numpy {numpy_time * 1000:8.1f} ms ({pandas_time / numpy_time:5.1f}x), "
+          f"kernel only {kernel_time * 1000:7.1f} ms ({pandas_time / kernel_time:6.1f}x), "
+          f"max rel. error {max_error:.1e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the pandas feature path against the NumPy panel kernel.')
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 100, 5000])
+    parser.add_argument('--days', type=int, default=252)
+    args = parser.parse_args()
+    for tickers in args.tickers:
+        run(tickers, args.days)
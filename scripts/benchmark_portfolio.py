@@ -0,0 +1,104 @@
+import argparse
+import functools
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import timeseries_db
+from benchmark_feature_store import synthetic_features
+from portfolio import PortfolioAnalytics, window
+
+
+def synthetic_bars(days, seed):
+    df = synthetic_features(days, seed)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['daily_pct_change'] = df['close'].pct_change()
+    df['cumulative_return'] = (1 + df['daily_pct_change']).cumprod()
+    return df
+
+
+def next_bar(df, seed):
+    rng = np.random.default_rng(seed)
+    last = df.iloc[-1]
+    change = rng.normal(0, 0.01)
+    row = df.iloc[[-1]].copy()
+    row['timestamp'] = last['timestamp'] + pd.offsets.BDay(1)
+    row['close'] = last['close'] * (1 + change)
+    row['daily_pct_change'] = change
+    row['cumulative_return'] = last['cumulative_return'] * (1 + change)
+    return row
+
+
+# What the Analysis page would compute without the engine, on every change:
+# load each ticker, pivot the returns, and derive everything from the panel.
+def pandas_analytics(names, db):
+    frames = {name: timeseries_db.load_features(name, ['timestamp', 'daily_pct_change', 'cumulative_return'], path=db)
+              for name in names}
+    panel = pd.concat({name: df.set_index('timestamp')['daily_pct_change'] for name, df in frames.items()},
+                      axis=1, sort=True)
+    recent = panel.iloc[-window:].fillna(0)
+    correlation = recent.corr()
+    volatility = recent.std() * np.sqrt(252)
+    cumulative = pd.Series({name: df['cumulative_return'].iloc[-1] for name, df in frames.items()})
+    equity = (1 + panel.mean(axis=1).fillna(0)).cumprod()
+    return correlation, volatility, cumulative, equity
+
+
+def run(tickers, days, appends):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'stocks.db')
+        names = [f'T{i:05d}' for i in range(tickers)]
+        frames = {}
+        for i, name in enumerate(names):
+            frames[name] = synthetic_bars(days, i)
+            timeseries_db.write_bars(frames[name], name, path=db)
+        reader = functools.partial(timeseries_db.load_since, path=db)
+        versioner = lambda name: (timeseries_db.data_version(name, path=db) or (None,))[0]
+
+        engine = PortfolioAnalytics(reader=reader)
+        start = time.perf_counter()
+        engine.update(names, versioner)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pandas_analytics(names, db)
+        pandas_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine.rankings()
+        engine.correlations_with(names[0])
+        engine.correlation(names[:30])
+        engine.rolling_correlation(names[0])
+        engine.equity_curve()
+        query_time = time.perf_counter() - start
+
+        append_times = []
+        for step in range(appends):
+            for i, name in enumerate(names):
+                row = next_bar(frames[name], step * tickers + i)
+                frames[name] = pd.concat([frames[name], row], ignore_index=True)
+                timeseries_db.write_bars(row, name, replace=False, path=db)
+            start = time.perf_counter()
+            engine.update(names, versioner)
+            append_times.append(time.perf_counter() - start)
+
+        fresh = PortfolioAnalytics(reader=engine.reader)
+        start = time.perf_counter()
+        fresh.update(names, versioner)
+        rebuild_time = time.perf_counter() - start
+        assert np.allclose(engine.gram, fresh.gram) and np.allclose(engine.equity[:engine.rows], fresh.equity[:fresh.rows])
+
+        print(f"{tickers:>6} tickers x {days} days: build {build_time * 1000:8.1f} ms, pandas {pandas_time * 1000:8.1f} ms, "
+              f"page queries {query_time * 1000:6.1f} ms, append a day {np.median(append_times) * 1000:7.1f} ms "
+              f"(rebuild {rebuild_time * 1000:8.1f} ms, {rebuild_time / np.median(append_times):5.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the cross-ticker analytics engine against pandas and against rebuilding.')
+    parser.add_argument('--tickers', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--appends', type=int, default=3, help='days appended to every ticker')
+    args = parser.parse_args()
+    for n in args.tickers:
+        run(n, args.days, args.appends)
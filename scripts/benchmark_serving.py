@@ -0,0 +1,115 @@
+import argparse
+import http.client
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+import numpy as np
+from benchmark_api_load import free_port, wait_for_server
+from benchmark_feature_store import synthetic_features
+from feature_store import write_features
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_pids(master):
+    try:
+        with open(f'/proc/{master}/task/{master}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+# Proportional set size: pages shared between workers are split among them,
+# so the sum over the workers is their real footprint.
+def pss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+# Runs in a client process: requests random windows of random tickers over one
+# keep-alive connection until `duration` is up. Returns the latencies and the
+# number of failed requests.
+def client(args):
+    port, tickers, days, duration, seed = args
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, failures = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = rng.randrange(0, days - 250, 25)
+        path = (f'/api/data/T{rng.randrange(tickers):04d}?columns=close,volume&limit=250'
+                f'&start={np.datetime64("2000-01-03") + start}')
+        began = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                failures += 1
+            latencies.append(time.perf_counter() - began)
+        except (OSError, http.client.HTTPException):
+            failures += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    return latencies, failures
+
+
+def run(data_dir, workers, shared, tickers, days, clients, duration, reload):
+    port = free_port()
+    command = [sys.executable, os.path.join(script_dir, 'serve.py'), 'api', '--workers', str(workers),
+               '--port', str(port), '--preload', str(tickers)]
+    if not shared:
+        command.append('--no-shared')
+    server = subprocess.Popen(command, cwd=data_dir, env=dict(os.environ, PYTHONPATH=script_dir),
+                              stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(f'http://127.0.0.1:{port}/', server, timeout=120)
+        with Pool(clients) as pool:
+            # Warm every worker's caches before measuring.
+            pool.map(client, [(port, tickers, days, 2, -i) for i in range(clients)])
+            pending = pool.map_async(client, [(port, tickers, days, duration, i) for i in range(clients)])
+            if reload:
+                time.sleep(duration / 2)
+                server.send_signal(signal.SIGHUP)
+            results = pending.get()
+        footprint = sum(pss_mb(pid) for pid in worker_pids(server.pid))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    latencies = np.concatenate([r[0] for r in results]) * 1000
+    failures = sum(r[1] for r in results)
+    print(f"{workers:>3} workers, {'shared' if shared else 'per-worker'} frames: "
+          f"{len(latencies) / duration:8.1f} requests/s, p50 {np.percentile(latencies, 50):6.2f} ms, "
+          f"p99 {np.percentile(latencies, 99):7.2f} ms, worker PSS {footprint:6.0f} MB, "
+          f"{failures} failed{' (reloaded mid-run)' if reload else ''}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test serve.py against its worker count.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--days', type=int, default=252 * 40)
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client processes')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--reload', action='store_true', help='send SIGHUP halfway through each run')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.tickers} tickers x {args.days} days, {args.clients} clients")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.tickers):
+            write_features(synthetic_features(args.days, i), f'T{i:04d}', root=os.path.join(tmp, 'feature_store'))
+        for n in args.workers:
+            for shared in (True, False):
+                run(tmp, n, shared, args.tickers, args.days, args.clients, args.duration, args.reload)
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from synthetic_data import synthetic_ohlcv, to_raw_feed
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+file = 'SYN00000_TATA_data.csv'
+
+
+# Runs in a fresh interpreter, so the peak RSS is that of one cleaning run:
+# in memory, or streamed with `chunk_mb` blocks.
+def child(output, chunk_mb):
+    import time
+    import contextlib
+    import io
+    import clean_data
+    from profiler import peak_rss_mb
+    clean_data.output_path = output
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, metrics = clean_data.clean_and_process_data(file, stream_chunk_mb=chunk_mb)
+    print(json.dumps({'time': time.perf_counter() - start,
+                      'peak_rss_mb': peak_rss_mb(),
+                      'chunks': metrics.get('stream_chunks', 1)}))
+
+
+def measure(data_dir, output, chunk_mb=None):
+    env = dict(os.environ, PYTHONPATH=script_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--child', output]
+    if chunk_mb:
+        command += ['--stream', '--chunk-mb', str(chunk_mb)]
+    result = subprocess.run(command, cwd=data_dir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Largest difference between the two cleaned files relative to the value, per
+# column, read a block of rows at a time. Expect rolling_volatility to lead:
+# pandas updates the window sums incrementally over the whole series, which
+# drifts on very long histories, while the streamed windows restart per block.
+def max_difference(path_a, path_b, rows=500_000):
+    worst, same_text = None, True
+    for a, b in zip(pd.read_csv(path_a, chunksize=rows), pd.read_csv(path_b, chunksize=rows)):
+        same_text &= bool((a['timestamp'] == b['timestamp']).all()) and list(a.dtypes) == list(b.dtypes)
+        x, y = a.iloc[:, 1:].astype('float64'), b.iloc[:, 1:].astype('float64')
+        difference = ((x - y).abs() / np.maximum(1, x.abs())).max()
+        worst = difference if worst is None else np.maximum(worst, difference)
+    return worst, same_text
+
+
+def run(bars, chunk_mb):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'data'))
+        raw = to_raw_feed(synthetic_ohlcv(bars, 0, 0.01, 0.005, freq='min'))
+        raw.to_csv(os.path.join(tmp, 'data', file), index=False)
+        size = os.path.getsize(os.path.join(tmp, 'data', file)) / 2 ** 20
+        del raw
+        whole = measure(tmp, 'whole')
+        streamed = measure(tmp, 'streamed', chunk_mb)
+        difference, same_text = max_difference(os.path.join(tmp, 'whole', f'cleaned_{file}'),
+                                               os.path.join(tmp, 'streamed', f'cleaned_{file}'))
+    print(f"{bars:>10} bars ({size:.0f} MB raw): in memory {whole['time']:.1f} s, peak RSS {whole['peak_rss_mb']:.0f} MB "
+          f"| streamed in {streamed['chunks']} x {chunk_mb} MB {streamed['time']:.1f} s, "
+          f"peak RSS {streamed['peak_rss_mb']:.0f} MB | max relative difference {difference.max():.1e} "
+          f"({difference.idxmax()}), "
+          f"timestamps and dtypes {'identical' if same_text else 'DIFFER'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare peak memory of in-memory and streamed cleaning.')
+    parser.add_argument('--bars', type=int, nargs='+', default=[250_000, 1_000_000, 3_000_000])
+    parser.add_argument('--chunk-mb', type=float, default=16)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--stream', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.chunk_mb if args.stream else None)
+    else:
+        for n in args.bars:
+            run(n, args.chunk_mb)
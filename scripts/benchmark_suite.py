@@ -0,0 +1,220 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from synthetic_data import write_universe
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+baseline_file = os.path.join('benchmarks', 'baseline.json')
+
+# Run in this order, each in a fresh interpreter: the clean step writes the
+# feature store, models and metrics.json the later steps read.
+benchmarks = ['clean', 'train', 'api', 'dashboard']
+
+# Compared against the baseline: a change beyond the tolerance in the worse
+# direction is reported as a regression.
+higher_is_worse = {'p50_ms': True, 'p95_ms': True, 'throughput': False, 'peak_rss_mb': True}
+
+
+def measure(latencies, work, unit):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'calls': len(latencies),
+        'throughput': work / (latencies.sum() / 1000),
+        'unit': f'{unit}/s',
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+def timed_calls(items, call):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        call(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_clean():
+    import clean_data
+    files = sorted(clean_data.discover_files().items())
+    metrics = {}
+    latencies = []
+    for stock_name, file in files:
+        start = time.perf_counter()
+        _, metrics[file] = clean_data.clean_and_process_data(file)
+        latencies.append(time.perf_counter() - start)
+    with open('metrics.json', 'w') as f:
+        json.dump(metrics, f)
+    rows = sum(m['initial_shape'][0] for m in metrics.values())
+    return {'clean_and_process_data': measure(latencies, rows, 'rows')}
+
+
+def bench_train():
+    import clean_data
+    from feature_store import list_tickers, load_features
+    os.makedirs(clean_data.model_path, exist_ok=True)
+    frames = {ticker: load_features(ticker) for ticker in list_tickers()}
+    latencies = timed_calls(frames, lambda ticker: clean_data.train_predictive_model(frames[ticker], ticker))
+    return {'train_predictive_model': measure(latencies, sum(len(df) for df in frames.values()), 'rows')}
+
+
+def bench_api():
+    import app
+    from feature_store import list_tickers
+    client = app.app.test_client()
+    tickers = list_tickers()
+    get = lambda url: client.get(url).close()
+    return {
+        'api data (cold)': measure(timed_calls([f'/api/data/{t}' for t in tickers], get), len(tickers), 'requests'),
+        'api data (warm)': measure(timed_calls([f'/api/data/{t}' for t in tickers], get), len(tickers), 'requests'),
+        'api data (query)': measure(timed_calls([f'/api/data/{t}?columns=close&resample=W' for t in tickers], get),
+                                    len(tickers), 'requests')
+    }
+
+
+# Dash requests as the browser sends them for a change of `trigger`.
+def callback_request(dependency, values, trigger):
+    outputs = [{'id': o.split('.')[0], 'property': o.split('.')[1]}
+               for o in dependency['output'].strip('.').split('...')]
+    return {
+        'output': dependency['output'],
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': [{'id': i['id'], 'property': i['property'], 'value': values.get(i['id'])} for i in dependency['inputs']],
+        'changedPropIds': [trigger],
+        'state': []
+    }
+
+
+def bench_dashboard():
+    import dashboard
+    client = dashboard.app.server.test_client()
+    dependencies = {d['inputs'][0]['id']: d for d in client.get('/_dash-dependencies').get_json()}
+    tickers = dashboard.dfs.tickers()
+
+    def call(dropdown):
+        def post(ticker):
+            body = callback_request(dependencies[dropdown], {dropdown: ticker, 'viewport-width': 1200}, f'{dropdown}.value')
+            response = client.post('/_dash-update-component', json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f'{dropdown} callback failed with {response.status_code}')
+            response.close()
+        return post
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {
+            'dashboard charts (cold)': timed_calls(tickers, call('stock-dropdown')),
+            'dashboard charts (warm)': timed_calls(tickers, call('stock-dropdown')),
+            'dashboard processing': timed_calls(tickers, call('processing-stock-dropdown')),
+            'dashboard analysis': timed_calls(tickers, call('analysis-stock-dropdown'))
+        }
+    return {name: measure(latencies, len(tickers), 'callbacks') for name, latencies in results.items()}
+
+
+# Runs in the benchmark's interpreter; everything the code under test prints
+# is swallowed so the last line of output is the JSON result.
+def child(name):
+    import resource
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = globals()[f'bench_{name}']()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for result in results.values():
+        result['peak_rss_mb'] = peak
+    print(json.dumps(results))
+
+
+def run_child(data_dir, name):
+    env = dict(os.environ, PYTHONPATH=script_dir)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name],
+                            cwd=data_dir, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f'{name} benchmark failed:\n{output.stderr}')
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def run(config):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_universe(config['tickers'], config['days'], os.path.join(tmp, 'data'),
+                       config['missing_rate'], config['duplicate_rate'])
+        results = {}
+        for name in benchmarks:
+            results.update(run_child(tmp, name))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, result in results.items():
+        base = baseline['results'].get(case)
+        if base is None:
+            continue
+        for metric, worse_if_higher in higher_is_worse.items():
+            if not base.get(metric):
+                continue
+            change = result[metric] / base[metric] - 1
+            if (change if worse_if_higher else -change) > tolerance:
+                regressions.append(f"{case}: {metric} {base[metric]:.2f} -> {result[metric]:.2f} ({change:+.0%})")
+    return regressions
+
+
+def report(results, baseline=None):
+    for case, r in results.items():
+        line = (f"{case:>26}: {r['throughput']:10.1f} {r['unit']:<12} p50 {r['p50_ms']:8.2f} ms, "
+                f"p95 {r['p95_ms']:8.2f} ms, p99 {r['p99_ms']:8.2f} ms, peak RSS {r['peak_rss_mb']:6.0f} MB")
+        base = baseline['results'].get(case) if baseline else None
+        if base:
+            line += f" (p50 {r['p50_ms'] / base['p50_ms'] - 1:+.0%} vs baseline)"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline, API and dashboard on synthetic data.')
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--days', type=int, default=252 * 10)
+    parser.add_argument('--missing-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.005)
+    parser.add_argument('--baseline', default=baseline_file, help='results to compare against, if the file exists')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before flagging')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        sys.exit(0)
+
+    config = {'tickers': args.tickers, 'days': args.days,
+              'missing_rate': args.missing_rate, 'duplicate_rate': args.duplicate_rate}
+    print(f"{args.tickers} tickers x {args.days} days, missing rate {args.missing_rate}, duplicate rate {args.duplicate_rate}")
+    results = run(config)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print(f"Baseline was recorded with {baseline['config']}, not comparing")
+            baseline = None
+    report(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%}")
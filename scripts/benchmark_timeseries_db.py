@@ -0,0 +1,61 @@
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+import app
+import timeseries_db
+from benchmark_feature_store import synthetic_features, timed
+from downsample import period_totals
+from feature_store import write_features, load_features
+
+
+def run(tickers, bars, freq, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, 'feature_store')
+        db = os.path.join(tmp, 'stocks.db')
+        names = [f'T{i:04d}' for i in range(tickers)]
+        load_time = 0.0
+        for i, name in enumerate(names):
+            df = synthetic_features(bars, i)
+            df['timestamp'] = pd.date_range('2000-01-03', periods=bars, freq=freq)
+            write_features(df, name, root=store_dir)
+            start = time.perf_counter()
+            timeseries_db.write_bars(df, name, path=db)
+            load_time += time.perf_counter() - start
+
+        last = df['timestamp'].iloc[-1]
+        window = (last - pd.Timedelta(days=1), last)
+        ohlc = app.resample_aggregations(df.columns)
+
+        # Each query reads what the API or the dashboard reads for it: the
+        # store has to load the columns of the whole history, the database
+        # scans the range in its index.
+        queries = [
+            ('close, last day',
+             lambda name: load_features(name, ['timestamp', 'close'], *window, root=store_dir),
+             lambda name: timeseries_db.page_bars(name, ['timestamp', 'close'], *window, path=db)),
+            ('weekly OHLCV, 1000 rows',
+             lambda name: app.downsample(load_features(name, root=store_dir), 'W').head(1000),
+             lambda name: timeseries_db.resample_bars(name, 'W', ohlc, limit=1000, path=db)),
+            ('volume by period',
+             lambda name: period_totals(load_features(name, ['timestamp', 'volume'], root=store_dir), 'volume'),
+             lambda name: timeseries_db.period_totals(name, 'volume', path=db)),
+        ]
+        print(f"{tickers} tickers x {bars} bars ({freq}): bulk load {tickers * bars / load_time:,.0f} rows/s, "
+              f"database {os.path.getsize(db) / 1e6:.0f} MB")
+        for label, store_fn, db_fn in queries:
+            store_time = timed(lambda: [store_fn(name) for name in names], repeat)
+            db_time = timed(lambda: [db_fn(name) for name in names], repeat)
+            print(f"{label:>24}: store {store_time * 1000:8.1f} ms, database {db_time * 1000:8.1f} ms, "
+                  f"speedup {store_time / db_time:5.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare feature store reads against indexed database queries.')
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--bars', type=int, default=250_000)
+    parser.add_argument('--freq', default='min', help="bar frequency, e.g. 'min' or 'B'")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.tickers, args.bars, args.freq, args.repeat)
@@ -7,123 +7,862 @@ import os
 import joblib 
 import time
 import json
+import argparse
+import glob
+import signal
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from feature_store import (write_features, append_features, summarize, load_summary_index, write_summary_index,
+                           FeatureWriter, year_start, summary_entry, scale_columns, scalers_file)
+import panel_kernel
+import csv_blocks
+import timeseries_db
+import storage
+import batch_model
+import backtest
+from profiler import (StageProfiler, active_profiler, with_profiler, stage, profiled, run_id, write_records,
+                      reset_peak_rss, peak_rss_mb, rss_mb, combine_records)
 
 
 input_path = 'data'
 output_path = 'cleaned_data'
 model_path = 'models'
+state_path = 'state'
 
-csv_files = {
-    'JNJ': 'JNJ_TATA_data.csv',
-    'TSLA': 'TSLA_TATA_data.csv',
-    'TTM': 'TTM_TATA_data.csv',
-    'WMT': 'WMT_TATA_data.csv'
-}
+rolling_window = 20
 
-metrics ={}
+bar_columns = ['open', 'high', 'low', 'close', 'volume']
 
-def clean_and_process_data(file):
-    start_time = time.time()
+# Streaming mode reads the raw file in blocks of about this many MB.
+stream_chunk_mb = 64
 
-    df = pd.read_csv(os.path.join(input_path, file))
+file_suffix = '_TATA_data.csv'
 
-    initial_shape = df.shape
+# Stages summed into the cleaning_time and transformation_time metrics.
+cleaning_stages = ['read', 'quality', 'sort', 'fill', 'dedup']
+transformation_stages = ['features', 'scaling']
 
-    missing_before = df.isnull().sum().sum()
-    duplicates_before = df.duplicated().sum()
+model_features = ['open', 'high', 'low', 'volume', '20_day_moving_avg', 'rolling_volatility']
 
-    df.ffill(inplace=True)
-    df.bfill(inplace=True)
+# Low-memory mode parses straight into these dtypes. Volume is read as float64
+# because gaps are NaN, and narrowed to uint32 once they are filled.
+compact_dtypes = {'open': 'float32', 'high': 'float32', 'low': 'float32', 'close': 'float32', 'volume': 'float64'}
 
-    df.drop_duplicates(inplace=True)
 
-    missing_after = df.isnull().sum().sum()
-    duplicates_after = df.duplicated().sum()
+def discover_files(path=input_path):
+    files = sorted(glob.glob(os.path.join(path, f'*{file_suffix}')))
+    return {os.path.basename(f)[:-len(file_suffix)]: os.path.basename(f) for f in files}
 
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    df.sort_values('timestamp', inplace=True)
 
+def add_features(df):
+    with stage('returns', rows=len(df)):
+        df['daily_pct_change'] = df['close'].pct_change()
+        df['cumulative_return'] = (1 + df['daily_pct_change']).cumprod()
+    with stage('rolling', rows=len(df)):
+        df['20_day_moving_avg'] = df['close'].rolling(window=rolling_window).mean()
+        df['rolling_volatility'] = df['close'].rolling(window=rolling_window).std()
 
-    df['daily_pct_change'] = df['close'].pct_change()
-    df['cumulative_return'] = (1 + df['daily_pct_change']).cumprod()
-    df['20_day_moving_avg'] = df['close'].rolling(window=20).mean()
-    df['rolling_volatility'] = df['close'].rolling(window=20).std()
+    with stage('price_stats', rows=len(df)):
+        df['mean_price'] = df[['open', 'high', 'low', 'close']].mean(axis=1)
+        df['median_price'] = df[['open', 'high', 'low', 'close']].median(axis=1)
+        df['std_price'] = df[['open', 'high', 'low', 'close']].std(axis=1)
+        df['var_price'] = df[['open', 'high', 'low', 'close']].var(axis=1)
+    return df
 
-    df['mean_price'] = df[['open', 'high', 'low', 'close']].mean(axis=1)
-    df['median_price'] = df[['open', 'high', 'low', 'close']].median(axis=1)
-    df['std_price'] = df[['open', 'high', 'low', 'close']].std(axis=1)
-    df['var_price'] = df[['open', 'high', 'low', 'close']].var(axis=1)
 
+# Same features as add_features, with the four OHLC statistics computed from one
+# (rows, 4) array instead of four separate column slices.
+def add_compact_features(df):
+    with stage('returns', rows=len(df)):
+        df['daily_pct_change'] = df['close'].pct_change()
+        df['cumulative_return'] = (1 + df['daily_pct_change']).cumprod()
+    with stage('rolling', rows=len(df)):
+        rolling = df['close'].rolling(window=rolling_window)
+        df['20_day_moving_avg'] = rolling.mean()
+        df['rolling_volatility'] = rolling.std()
+
+    with stage('price_stats', rows=len(df)):
+        ohlc = df[['open', 'high', 'low', 'close']].to_numpy()
+        if np.isnan(ohlc).any():
+            # A column with no values at all: keep pandas' NaN-skipping stats.
+            ohlc = df[['open', 'high', 'low', 'close']]
+            df['mean_price'] = ohlc.mean(axis=1)
+            df['median_price'] = ohlc.median(axis=1)
+            df['std_price'] = ohlc.std(axis=1)
+            df['var_price'] = ohlc.var(axis=1)
+            return df
+        # float64 accumulation: the spread is small next to the price level.
+        ordered = np.sort(ohlc, axis=1)
+        variance = ohlc.var(axis=1, ddof=1, dtype='float64')
+        df['mean_price'] = ohlc.mean(axis=1, dtype='float64')
+        df['median_price'] = (ordered[:, 1] + ordered[:, 2]) / 2
+        df['std_price'] = np.sqrt(variance)
+        df['var_price'] = variance
+    return df
 
-    normalization_start_time = time.time()
-    df['normalized_close'] = StandardScaler().fit_transform(df[['close']])
-    df['scaled_volume'] = MinMaxScaler().fit_transform(df[['volume']])
-    normalization_end_time = time.time()
 
-    df.dropna(inplace=True)
+def narrow_volume(volume):
+    if volume.isna().any() or volume.min() < 0 or volume.max() > np.iinfo('uint32').max:
+        return volume
+    return volume.astype('uint32')
 
-    final_shape = df.shape
 
+# The numpy engine runs the panel kernel on a one-ticker panel: every ticker
+# is cleaned, profiled and timed out on its own in process_chunk, so the
+# kernel's speed-up across tickers (add_panel_features) is not used here.
+def compute_features(df, engine='pandas'):
+    with stage('features', rows=len(df)):
+        if engine == 'numpy':
+            return panel_kernel.add_features(df, rolling_window)
+        return add_features(df)
+
+
+# Features of the bars after the first `context` rows of `frame`, which are
+# earlier bars that only seed pct_change and the rolling windows. The running
+# product continues the cumulative return from `cumulative_return`.
+def extend_features(frame, context, cumulative_return, engine='pandas'):
+    compute_features(frame, engine)
+    growth = pd.concat([pd.Series([cumulative_return]), 1 + frame['daily_pct_change'].iloc[context:]])
+    frame.loc[context:, 'cumulative_return'] = growth.cumprod().to_numpy()[1:]
+    return frame.iloc[context:]
+
+
+# The database gets the full-precision rows, replacing the ticker's; the CSV
+# stays as the export format. Incremental runs use append_output instead.
+def save_output(df, file, scaler):
     output_file = os.path.join(output_path, f'cleaned_{file}')
     os.makedirs(output_path, exist_ok=True)
     df.to_csv(output_file, index=False)
     print(f"Cleaned data saved to {output_file}")
+    write_features(df, file.split('_')[0], scalers=scaler_params(scaler))
+    timeseries_db.write_bars(df, file.split('_')[0], scalers=scaler_params(scaler))
+
+
+# Text lengths of the timestamp formats to_csv writes, by timestamp_precision.
+csv_timestamp_lengths = {10: 0, 19: 1, 23: 2, 26: 3}
+
+
+# Adds an incremental run's bars to the feature store and the database without
+# rewriting the bars already there; the stores derive the scaled columns from
+# the current scalers on read. The scalers move with every run, so the cleaned
+# CSV is re-exported from the database, one fetch chunk at a time, to match
+# what a full recompute writes.
+def append_output(df, file, scaler):
+    stock_name = file.split('_')[0]
+    output_file = os.path.join(output_path, f'cleaned_{file}')
+    first = pd.read_csv(output_file, nrows=1)
+    precision = max(csv_timestamp_lengths[len(first['timestamp'].iloc[0])], timestamp_precision(df['timestamp']))
+    integer_columns = [col for col in first.columns if pd.api.types.is_integer_dtype(first[col])]
+    df = df[list(first.columns)].astype({col: 'int64' for col in integer_columns})
+    append_features(df, stock_name, scalers=scaler_params(scaler))
+    timeseries_db.write_bars(df, stock_name, replace=False, scalers=scaler_params(scaler))
+    with open(f'{output_file}.tmp', 'w', newline='') as out:
+        header = True
+        for chunk in timeseries_db.iter_bars(stock_name, list(first.columns)):
+            chunk = chunk.astype({col: 'int64' for col in integer_columns})
+            chunk.assign(timestamp=format_timestamps(chunk['timestamp'], precision)).to_csv(
+                out, index=False, header=header)
+            header = False
+    os.replace(f'{output_file}.tmp', output_file)
+    print(f"Cleaned data re-exported to {output_file}")
+
+
+def state_file(stock_name):
+    return os.path.join(state_path, f'{stock_name}_state.json')
+
+
+def load_state(stock_name):
+    if not os.path.exists(state_file(stock_name)):
+        return None
+    with open(state_file(stock_name), 'r') as f:
+        return json.load(f)
+
+
+# Everything needed to extend the features of a ticker without its history:
+# the last rolling_window - 1 cleaned bars, the cumulative-return running product
+# and the running close mean/M2 and volume min/max behind the two scalers.
+def save_state(stock_name, df, scaler):
+    tail = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(rolling_window - 1).copy()
+    tail['timestamp'] = tail['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    last_cumulative = df['cumulative_return'].iloc[-1]
+    state = {
+        'last_timestamp': tail['timestamp'].iloc[-1],
+        'cumulative_return': 1.0 if pd.isna(last_cumulative) else float(last_cumulative),
+        'tail': tail.to_dict(orient='list'),
+        'scaler': scaler
+    }
+    os.makedirs(state_path, exist_ok=True)
+    with open(state_file(stock_name), 'w') as f:
+        json.dump(state, f)
+
+
+def scaler_stats(close, volume):
+    mean = float(close.mean())
+    return {
+        'count': int(len(close)),
+        'mean': mean,
+        'm2': float(((close - mean) ** 2).sum()),
+        'volume_min': float(volume.min()),
+        'volume_max': float(volume.max())
+    }
+
+
+def merge_scaler_stats(a, b):
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    return {
+        'count': count,
+        'mean': a['mean'] + delta * b['count'] / count,
+        'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / count,
+        'volume_min': min(a['volume_min'], b['volume_min']),
+        'volume_max': max(a['volume_max'], b['volume_max'])
+    }
+
+
+# Same transforms as StandardScaler/MinMaxScaler, including their handling of
+# a zero variance or zero range column, as the stores' (base column, centre,
+# scale) parameters.
+def scaler_params(scaler):
+    std = float(np.sqrt(scaler['m2'] / scaler['count']))
+    volume_range = scaler['volume_max'] - scaler['volume_min']
+    return {
+        'normalized_close': ('close', scaler['mean'], std if std > 0 else 1.0),
+        'scaled_volume': ('volume', scaler['volume_min'], volume_range if volume_range > 0 else 1.0)
+    }
 
-    end_time = time.time()
 
-    metrics[file] = {
+def apply_scalers(df, scaler):
+    return scale_columns(df, scaler_params(scaler))
+
+
+@with_profiler
+def clean_and_process_data(file, engine='pandas', low_memory=False, stream_chunk_mb=None):
+    if stream_chunk_mb:
+        return clean_and_process_streaming(file, engine, stream_chunk_mb)
+    if low_memory:
+        return clean_and_process_compact(file)
+    profiler = active_profiler()
+    first_stage = len(profiler.records)
+    start_time = time.perf_counter()
+
+    with stage('read') as record:
+        df = pd.read_csv(os.path.join(input_path, file))
+        record['rows'] = len(df)
+
+    initial_shape = df.shape
+
+    with stage('quality', rows=len(df)):
+        missing_before = df.isnull().sum().sum()
+        duplicates_before = df.duplicated().sum()
+
+    # Sort before filling so ffill carries the previous bar forward, as the
+    # incremental path does; the raw feeds are stored newest first.
+    with stage('sort', rows=len(df)):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df.sort_values('timestamp', inplace=True, kind='stable')
+
+    with stage('fill', rows=len(df)):
+        df.ffill(inplace=True)
+        df.bfill(inplace=True)
+
+    with stage('dedup', rows=len(df)):
+        df.drop_duplicates(inplace=True)
+
+        missing_after = df.isnull().sum().sum()
+        duplicates_after = df.duplicated().sum()
+
+    compute_features(df, engine)
+
+
+    with stage('scaling', rows=len(df)):
+        df['normalized_close'] = StandardScaler().fit_transform(df[['close']])
+        df['scaled_volume'] = MinMaxScaler().fit_transform(df[['volume']])
+        scaler = scaler_stats(df['close'], df['volume'])
+
+    with stage('state'):
+        save_state(file.split('_')[0], df, scaler)
+
+    df.dropna(inplace=True)
+
+    final_shape = df.shape
+
+    with stage('write', rows=len(df)):
+        save_output(df, file, scaler)
+
+    end_time = time.perf_counter()
+
+    file_metrics = {
         'initial_shape': initial_shape,
         'final_shape': final_shape,
         'missing_before':int(missing_before),
         'missing_after': int(missing_after),
         'duplicates_before': int(duplicates_before),
         'duplicates_after': int(duplicates_after),
-        'cleaning_time': normalization_start_time - start_time,
-        'transformation_time': normalization_end_time - normalization_start_time,
+        'cleaning_time': profiler.wall(*cleaning_stages, since=first_stage),
+        'transformation_time': profiler.wall(*transformation_stages, since=first_stage),
         'total_processing_time': end_time - start_time,
         'processing_status': 'Success'
     }
-    return df
+    return df, file_metrics
+
+
+# Low-memory mode: compact dtypes from the parser on, quality counts from a
+# single isna() and duplicated() scan, the OHLC statistics from one shared
+# array and the scalers computed in place rather than fitted on a 2-D copy.
+@with_profiler
+def clean_and_process_compact(file):
+    profiler = active_profiler()
+    first_stage = len(profiler.records)
+    start_time = time.perf_counter()
+
+    with stage('read') as record:
+        df = pd.read_csv(os.path.join(input_path, file), dtype=compact_dtypes, parse_dates=['timestamp'])
+        record['rows'] = len(df)
+
+    initial_shape = df.shape
+
+    with stage('sort', rows=len(df)):
+        df.sort_values('timestamp', inplace=True, kind='stable')
+
+    # After ffill/bfill only columns that were empty to begin with still have
+    # gaps, so one scan gives both the before and after counts.
+    with stage('quality', rows=len(df)):
+        missing = df.isna().sum()
+        missing_before = int(missing.sum())
+        empty_columns = int((missing == len(df)).sum()) if len(df) else 0
+
+    with stage('fill', rows=len(df)):
+        df.ffill(inplace=True)
+        df.bfill(inplace=True)
+        df['volume'] = narrow_volume(df['volume'])
+
+    # Duplicates are counted on the filled rows, i.e. the rows that are dropped;
+    # none are left afterwards.
+    with stage('dedup', rows=len(df)):
+        duplicated = df.duplicated()
+        duplicates = int(duplicated.sum())
+        if duplicates:
+            df = df[~duplicated.to_numpy()]
+
+    with stage('features', rows=len(df)):
+        add_compact_features(df)
+
+    with stage('scaling', rows=len(df)):
+        scaler = scaler_stats(df['close'], df['volume'])
+        apply_scalers(df, scaler)
+
+    with stage('state'):
+        save_state(file.split('_')[0], df, scaler)
+
+    df.dropna(inplace=True)
+
+    with stage('write', rows=len(df)):
+        save_output(df, file, scaler)
+
+    file_metrics = {
+        'initial_shape': initial_shape,
+        'final_shape': df.shape,
+        'missing_before': missing_before,
+        'missing_after': empty_columns * (initial_shape[0] - duplicates),
+        'duplicates_before': duplicates,
+        'duplicates_after': 0,
+        'cleaning_time': profiler.wall(*cleaning_stages, since=first_stage),
+        'transformation_time': profiler.wall(*transformation_stages, since=first_stage),
+        'total_processing_time': time.perf_counter() - start_time,
+        'processing_status': 'Success',
+        'low_memory': True
+    }
+    return df, file_metrics
+
+
+# Text form to_csv gives a whole timestamp column: dates only, whole seconds,
+# or milli/microseconds when any value needs them. Streamed batches are
+# formatted with the precision of the whole file so they match.
+def timestamp_precision(timestamps):
+    if (timestamps == timestamps.dt.normalize()).all():
+        return 0
+    micros = timestamps.dt.microsecond
+    if (micros == 0).all():
+        return 1
+    return 2 if (micros % 1000 == 0).all() else 3
+
+
+def format_timestamps(timestamps, precision):
+    if precision < 2:
+        return timestamps.dt.strftime('%Y-%m-%d %H:%M:%S' if precision else '%Y-%m-%d')
+    text = timestamps.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return text.str[:-3] if precision == 2 else text
+
+
+# Cleans and features a ticker's bars batch by batch, oldest first, carrying
+# what the whole-frame path sees at a batch boundary: the last filled bar for
+# ffill, the leading bars still waiting for a bfill value, the rolling-window
+# tail and the cumulative-return product. The scalers need whole-history
+# statistics, so featured rows are spooled unscaled and the statistics merged
+# as batches go by.
+class StreamCleaner:
+    def __init__(self, spool_file, engine='pandas'):
+        self.spool_file = spool_file
+        self.engine = engine
+        self.writer = None
+        self.counts = dict.fromkeys(['missing_before', 'missing_after', 'duplicates_before', 'duplicates_after'], 0)
+        self.integer_columns = None
+        self.precision = 0
+        self.last_filled = None
+        self.pending = []
+        self.last_rows = None
+        self.cumulative_return = 1.0
+        self.scaler = None
+        self.rows = 0
+        self.last_timestamp = None
+
+    # `batch` is raw bars in timestamp order, with all bars of a timestamp in
+    # the same batch (so duplicates never straddle two).
+    def add(self, batch, timestamps):
+        with stage('quality', rows=len(batch)):
+            self.counts['missing_before'] += int(batch.isnull().sum().sum())
+            self.counts['duplicates_before'] += int(batch.duplicated().sum())
+            integer = {col for col in bar_columns if pd.api.types.is_integer_dtype(batch[col])}
+            self.integer_columns = integer if self.integer_columns is None else self.integer_columns & integer
+        batch['timestamp'] = timestamps.to_numpy()
+        batch = batch.astype({col: 'float64' for col in bar_columns})
+
+        with stage('fill', rows=len(batch)):
+            if self.last_filled is not None:
+                batch = pd.concat([self.last_filled, batch], ignore_index=True).ffill().iloc[1:]
+            else:
+                batch = batch.ffill()
+            self.last_filled = batch.iloc[-1:]
+            # bfill only reaches the bars before a column's first value, so
+            # bars are held until every column has had one.
+            self.pending.append(batch)
+            if batch.iloc[-1].isna().any():
+                return
+            batch = pd.concat(self.pending, ignore_index=True).bfill()
+            self.pending = []
+        self.process(batch)
+
+    def finish(self):
+        if self.pending:
+            with stage('fill'):
+                batch = pd.concat(self.pending, ignore_index=True).bfill()
+                self.pending = []
+            self.process(batch)
+        if self.writer is not None:
+            self.writer.close()
+
+    def process(self, batch):
+        with stage('dedup', rows=len(batch)):
+            batch = batch.drop_duplicates()
+            self.counts['missing_after'] += int(batch.isnull().sum().sum())
+            self.counts['duplicates_after'] += int(batch.duplicated().sum())
+
+        if self.last_rows is None:
+            frame, context = batch.reset_index(drop=True), 0
+        else:
+            context = len(self.last_rows)
+            frame = pd.concat([self.last_rows[['timestamp'] + bar_columns], batch], ignore_index=True)
+        added = extend_features(frame, context, self.cumulative_return, self.engine)
+        valid = added['cumulative_return'].dropna()
+        if len(valid):
+            self.cumulative_return = float(valid.iloc[-1])
+        self.last_rows = pd.concat([self.last_rows, added]).tail(rolling_window - 1)
+
+        with stage('scaling', rows=len(added)):
+            stats = scaler_stats(added['close'], added['volume'])
+            self.scaler = stats if self.scaler is None else merge_scaler_stats(self.scaler, stats)
+
+        with stage('spool', rows=len(added)):
+            added = added.dropna()
+            if added.empty:
+                return
+            table = pa.Table.from_pandas(added, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.spool_file, table.schema)
+            self.writer.write_table(table.cast(self.writer.schema))
+            self.rows += len(added)
+            self.precision = max(self.precision, timestamp_precision(added['timestamp']))
+            self.last_timestamp = added['timestamp'].iloc[-1]
+
+    # Scales the spooled rows and writes the cleaned CSV and the feature store
+    # one row group at a time. Returns the summary index entry.
+    def write(self, file):
+        stock_name = file.split('_')[0]
+        output_file = os.path.join(output_path, f'cleaned_{file}')
+        os.makedirs(output_path, exist_ok=True)
+        cutoff = year_start(self.last_timestamp)
+        first = last = None
+        high, low = -np.inf, np.inf
+        scalers = scaler_params(self.scaler)
+        with (open(f'{output_file}.tmp', 'w', newline='') as out, FeatureWriter(stock_name, scalers=scalers) as features,
+              timeseries_db.BarWriter(stock_name, scalers=scalers) as bars):
+            # One row group (one spooled batch) at a time: iter_batches reads ahead.
+            spool = pq.ParquetFile(self.spool_file)
+            for group in range(spool.num_row_groups):
+                df = apply_scalers(spool.read_row_group(group).to_pandas(), self.scaler)
+                df = df.astype({col: 'int64' for col in self.integer_columns})
+                features.write(df)
+                bars.write(df)
+                df.assign(timestamp=format_timestamps(df['timestamp'], self.precision)).to_csv(
+                    out, index=False, header=first is None)
+                recent = df[df['timestamp'] > cutoff]
+                if len(recent):
+                    high, low = max(high, recent['high'].max()), min(low, recent['low'].min())
+                first = df['timestamp'].iloc[0] if first is None else first
+                last = df.iloc[-1]
+        os.replace(f'{output_file}.tmp', output_file)
+        print(f"Cleaned data saved to {output_file}")
+        return summary_entry(first, last['timestamp'], self.rows, last, high, low), len(df.columns)
+
+
+# Raw bars in timestamp order, one block of about block_bytes at a time. The
+# blocks are read starting from the end of the file that holds the oldest bar
+# (the raw feeds are newest first) and stable-sorted, and the bars sharing a
+# block's last timestamp are held back for the next block, so ties keep their
+# file order as in the whole-frame sort. The file has to be sorted at the
+# block level: a bar older than an earlier block's bars is an error.
+def chronological_blocks(raw_file, block_bytes):
+    edges = pd.to_datetime(csv_blocks.edge_rows(raw_file, usecols=['timestamp'])['timestamp'])
+    reverse = len(edges) > 1 and edges.iloc[0] > edges.iloc[-1]
+    held = None
+    for block in csv_blocks.read_blocks(raw_file, block_bytes, reverse):
+        if held is not None:
+            block = pd.concat([block, held] if reverse else [held, block], ignore_index=True)
+        with stage('sort', rows=len(block)):
+            timestamps = pd.to_datetime(block['timestamp'])
+            order = np.argsort(timestamps.to_numpy(), kind='stable')
+            block, timestamps = block.iloc[order].reset_index(drop=True), timestamps.iloc[order].reset_index(drop=True)
+        if held is not None and timestamps.iloc[0] < held_timestamp:
+            raise ValueError(f'{os.path.basename(raw_file)} is not sorted by timestamp; run without --stream')
+        held_timestamp = timestamps.iloc[-1]
+        keep = (timestamps < held_timestamp).to_numpy()
+        held = block[~keep]
+        if keep.any():
+            yield block[keep].reset_index(drop=True), timestamps[keep].reset_index(drop=True)
+    if held is not None and len(held):
+        yield held.reset_index(drop=True), pd.to_datetime(held['timestamp']).reset_index(drop=True)
+
+
+# Streaming mode for histories too long to load: memory is bounded by the
+# block size rather than the file. Produces the same output as
+# clean_and_process_data to floating-point tolerance, since the rolling
+# windows and scaler statistics are accumulated per block.
+@with_profiler
+def clean_and_process_streaming(file, engine='pandas', chunk_mb=stream_chunk_mb):
+    profiler = active_profiler()
+    first_stage = len(profiler.records)
+    start_time = time.perf_counter()
+    raw_file = os.path.join(input_path, file)
+
+    os.makedirs(output_path, exist_ok=True)
+    spool, spool_file = tempfile.mkstemp(suffix='.parquet', dir=output_path)
+    os.close(spool)
+    try:
+        cleaner = StreamCleaner(spool_file, engine)
+        blocks = chronological_blocks(raw_file, int(chunk_mb * 2 ** 20))
+        raw_rows = raw_columns = chunks = 0
+        while True:
+            with stage('read') as record:
+                item = next(blocks, None)
+                record['rows'] = None if item is None else len(item[0])
+            if item is None:
+                break
+            batch, timestamps = item
+            raw_rows, raw_columns, chunks = raw_rows + len(batch), batch.shape[1], chunks + 1
+            cleaner.add(batch, timestamps)
+        cleaner.finish()
+        if cleaner.rows == 0:
+            raise ValueError('no rows left after cleaning')
+
+        with stage('state'):
+            save_state(file.split('_')[0], cleaner.last_rows, cleaner.scaler)
+        with stage('write', rows=cleaner.rows):
+            summary, columns = cleaner.write(file)
+    finally:
+        os.remove(spool_file)
+
+    profiler.records[first_stage:] = combine_records(profiler.records[first_stage:])
+    file_metrics = {
+        'initial_shape': (raw_rows, raw_columns),
+        'final_shape': (cleaner.rows, columns),
+        **cleaner.counts,
+        'cleaning_time': profiler.wall(*cleaning_stages, since=first_stage),
+        'transformation_time': profiler.wall(*transformation_stages, since=first_stage),
+        'total_processing_time': time.perf_counter() - start_time,
+        'processing_status': 'Success',
+        'stream_chunks': chunks,
+        'summary': summary
+    }
+    return None, file_metrics
+
+
+# Whether a ticker's history is stored in the form an incremental run appends
+# to; histories written before the database or before the scaled columns were
+# derived on read are rebuilt once.
+def appendable(stock_name, file):
+    return (load_state(stock_name) is not None and os.path.exists(os.path.join(output_path, f'cleaned_{file}'))
+            and os.path.exists(scalers_file(stock_name)) and bool(timeseries_db.load_scalers(stock_name)))
+
+
+# The summary index entry of a ticker from the database: its extent, and the
+# last 52 weeks for the high and low. Returns the entry and the column count.
+def stored_summary(stock_name):
+    first, last, rows = timeseries_db.ticker_extent(stock_name)
+    cutoff = year_start(last)
+    year = timeseries_db.load_features(stock_name, start=cutoff)
+    year = year[year['timestamp'] > cutoff]
+    return summary_entry(first, last, rows, year.iloc[-1], year['high'].max(), year['low'].min()), year.shape[1]
+
+
+# Extends a ticker with the raw bars newer than its state, reading only the
+# state and writing only the new bars, so the cost follows the number of new
+# bars rather than the length of the history. Like the streaming mode it
+# returns no frame: process_chunk reads the stored history back when the
+# model is trained.
+@with_profiler
+def incremental_update(file, engine='pandas', low_memory=False, stream_chunk_mb=None):
+    stock_name = file.split('_')[0]
+    if not appendable(stock_name, file):
+        return clean_and_process_data(file, engine, low_memory, stream_chunk_mb)
+    state = load_state(stock_name)
+
+    profiler = active_profiler()
+    first_stage = len(profiler.records)
+    start_time = time.perf_counter()
+
+    with stage('read') as record:
+        raw = pd.read_csv(os.path.join(input_path, file))
+        raw['timestamp'] = pd.to_datetime(raw['timestamp'])
+        new = raw[raw['timestamp'] > pd.Timestamp(state['last_timestamp'])]
+        record['rows'] = len(raw)
+
+    if new.empty:
+        summary, columns = stored_summary(stock_name)
+        file_metrics = {
+            'initial_shape': new.shape,
+            'final_shape': (summary['rows'], columns),
+            'missing_before': 0,
+            'missing_after': 0,
+            'duplicates_before': 0,
+            'duplicates_after': 0,
+            'cleaning_time': 0.0,
+            'transformation_time': 0.0,
+            'total_processing_time': time.perf_counter() - start_time,
+            'processing_status': 'Up to date',
+            'new_rows': 0,
+            'summary': summary
+        }
+        return None, file_metrics
+
+    initial_shape = new.shape
+    with stage('quality', rows=len(new)):
+        missing_before = new.isnull().sum().sum()
+        duplicates_before = new.duplicated().sum()
+
+    with stage('sort', rows=len(new)):
+        context = pd.DataFrame(state['tail'])
+        context['timestamp'] = pd.to_datetime(context['timestamp'])
+        frame = pd.concat([context, new.sort_values('timestamp', kind='stable')], ignore_index=True)
+    with stage('fill', rows=len(frame)):
+        frame.ffill(inplace=True)
+        frame.bfill(inplace=True)
+    with stage('dedup', rows=len(frame)):
+        frame = pd.concat([frame.iloc[:len(context)], frame.iloc[len(context):].drop_duplicates()], ignore_index=True)
+
+        missing_after = frame.iloc[len(context):].isnull().sum().sum()
+        duplicates_after = frame.iloc[len(context):].duplicated().sum()
+
+    added = extend_features(frame, len(context), state['cumulative_return'], engine)
+
+    # Both scalers depend on whole-history statistics: the running stats are
+    # merged, and the stores derive the scaled columns of every bar from them.
+    with stage('scaling', rows=len(added)):
+        scaler = merge_scaler_stats(state['scaler'], scaler_stats(added['close'], added['volume']))
+        df = apply_scalers(added.dropna(), scaler)
+
+    with stage('state'):
+        save_state(stock_name, frame, scaler)
+
+    with stage('write', rows=len(df)):
+        append_output(df, file, scaler)
+
+    with stage('summary'):
+        summary, columns = stored_summary(stock_name)
+
+    end_time = time.perf_counter()
+
+    file_metrics = {
+        'initial_shape': initial_shape,
+        'final_shape': (summary['rows'], columns),
+        'missing_before': int(missing_before),
+        'missing_after': int(missing_after),
+        'duplicates_before': int(duplicates_before),
+        'duplicates_after': int(duplicates_after),
+        'cleaning_time': profiler.wall(*cleaning_stages, since=first_stage),
+        'transformation_time': profiler.wall(*transformation_stages, since=first_stage),
+        'total_processing_time': end_time - start_time,
+        'processing_status': 'Success',
+        'new_rows': len(added),
+        'summary': summary
+    }
+    return None, file_metrics
 
 
 def train_predictive_model(df, stock_name):
 
-    features = ['open', 'high', 'low', 'volume', '20_day_moving_avg', 'rolling_volatility']
-    x = df[features]
+    x = df[model_features]
     y = df['close']
 
     x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=42)
 
 
-    model = LinearRegression()
-    model.fit(x_train, y_train)
+    with stage('model_fit', rows=len(x_train)):
+        model = LinearRegression()
+        model.fit(x_train, y_train)
     
     save_model(model, stock_name)
 
    
 
-    y_pred = model.predict(x_test)
-    mse = mean_squared_error(y_test, y_pred)
+    with stage('model_evaluate', rows=len(x_test)):
+        y_pred = model.predict(x_test)
+        mse = mean_squared_error(y_test, y_pred)
     print(f"Mean Squared Error: {mse} ")
+    return mse
+
+
+@profiled('model_save')
 def save_model(model, stock_name):
     model_file = os.path.join(model_path, f'{stock_name}_stock_price_predictor.pkl')
     joblib.dump(model, model_file)
     print(f"Predictive model saved to {model_file}")
 
-os.makedirs(model_path, exist_ok=True)
-
 
-for stock_name, file in csv_files.items():
-    try:
-        df = clean_and_process_data(file)
-        train_predictive_model(df, stock_name)
-    except Exception as e:
-        metrics[file] = {
-            'processing_status': 'Failed',
-            'error_message': str(e)
-        }
-with open('metrics.json', 'w') as f:
-    json.dump(metrics, f)
-print(metrics)
 
+def _raise_timeout(signum, frame):
+    raise TimeoutError('processing timed out')
+
+
+# Runs in a worker process. Each ticker is isolated: a failure or a timeout is
+# recorded in its metrics (with no summary) and the rest of the chunk carries on.
+def process_chunk(chunk, incremental=False, timeout=None, engine='pandas', train=True, trace_memory=False,
+                  low_memory=False, stream_chunk_mb=None):
+    process = incremental_update if incremental else clean_and_process_data
+    use_alarm = timeout is not None and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+    results = []
+    for stock_name, file in chunk:
+        summary = None
+        profiler = StageProfiler(trace_memory)
+        df = None
+        start_rss = rss_mb()
+        reset_peak_rss()
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            with profiler:
+                df, file_metrics = process(file, engine, low_memory, stream_chunk_mb)
+                # A streamed ticker is never in memory whole: it brings its own
+                # summary and is left to --batch-train. An incremental run
+                # brings its summary too, and the model is refit on the stored
+                # history when there were new bars.
+                if df is None and train and file_metrics.get('new_rows'):
+                    df = storage.load_features(stock_name, ['timestamp', 'close'] + model_features)
+                if df is not None and train:
+                    train_predictive_model(df, stock_name)
+            summary = file_metrics.pop('summary') if 'summary' in file_metrics else summarize(df)
+        except Exception as e:
+            file_metrics = {
+                'processing_status': 'Failed',
+                'error_message': str(e) or type(e).__name__
+            }
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        file_metrics['stages'] = profiler.records
+        file_metrics['peak_rss_mb'] = peak_rss_mb()
+        if start_rss is not None:
+            file_metrics['peak_rss_increase_mb'] = file_metrics['peak_rss_mb'] - start_rss
+        results.append((stock_name, file, file_metrics, summary))
+    return results
+
+
+def run_pipeline(files, workers=None, chunksize=1, timeout=None, incremental=False, engine='pandas', train=True,
+                 trace_memory=False, low_memory=False, stream_chunk_mb=None):
+    items = sorted(files.items())
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    metrics = {}
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_chunk, chunk, incremental, timeout, engine, train, trace_memory, low_memory,
+                                   stream_chunk_mb) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                error = {'processing_status': 'Failed', 'error_message': str(e) or type(e).__name__}
+                results = [(stock_name, file, error, None) for stock_name, file in chunk]
+            for stock_name, file, file_metrics, summary in results:
+                metrics[file] = file_metrics
+                if summary is not None:
+                    summaries[stock_name] = summary
+    return metrics, summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean the raw stock data, build features and train the predictors.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process bars newer than the saved per-ticker state')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='number of tickers handed to a worker per task')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='per-ticker time limit in seconds')
+    parser.add_argument('--engine', choices=['pandas', 'numpy'], default='pandas',
+                        help='feature engine: pandas or the NumPy panel kernel (run on one ticker at a time)')
+    parser.add_argument('--batch-train', action='store_true',
+                        help='fit all tickers in one batch into models/coefficients.npy instead of one pickle each')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='compact dtypes and fewer temporaries when cleaning (full runs)')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the raw files in blocks, for histories too large to load (full runs)')
+    parser.add_argument('--chunk-mb', type=float, default=stream_chunk_mb,
+                        help='block size of --stream in MB')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the tracemalloc peak of every stage (slower)')
+    parser.add_argument('--backtest', action='store_true',
+                        help='walk-forward backtest every ticker and store its error curve in metrics.json')
+    args = parser.parse_args()
+
+    os.makedirs(model_path, exist_ok=True)
+
+    files = discover_files()
+    metrics, summaries = run_pipeline(files, workers=args.workers, chunksize=args.chunksize,
+                                      timeout=args.timeout, incremental=args.incremental, engine=args.engine,
+                                      train=not args.batch_train, trace_memory=args.trace_memory,
+                                      low_memory=args.low_memory,
+                                      stream_chunk_mb=args.chunk_mb if args.stream else None)
+    run = run_id()
+    for stock_name, file in files.items():
+        write_records(metrics[file].get('stages', []), run=run, ticker=stock_name, incremental=args.incremental)
+    if args.batch_train:
+        # Failed tickers are fitted on their previously stored features.
+        models = batch_model.train_all(sorted(files))
+        for stock_name, file in files.items():
+            if stock_name in models:
+                metrics[file]['model_mse'] = models[stock_name]['mse']
+    if args.backtest:
+        backtest.merge_into_metrics(backtest.run_backtests(sorted(files), workers=args.workers), metrics)
+    with open('metrics.json', 'w') as f:
+        json.dump(metrics, f)
+
+    # Failed tickers keep their previous summary; removed tickers are dropped.
+    summary_index = {k: v for k, v in load_summary_index().items() if k in files}
+    summary_index.update(summaries)
+    write_summary_index(summary_index)
+    print(metrics)
@@ -0,0 +1,49 @@
+import io
+import os
+import pandas as pd
+
+
+# Splits the data lines of a CSV into blocks of about `block_bytes`, each
+# starting at the beginning of a line. Returns the header line and the block
+# offsets, the last offset being the end of the file.
+def block_offsets(path, block_bytes):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        offsets = [f.tell()]
+        while offsets[-1] + block_bytes < size:
+            f.seek(offsets[-1] + block_bytes - 1)
+            f.readline()
+            offsets.append(f.tell())
+    if offsets[-1] < size:
+        offsets.append(size)
+    return header, offsets
+
+
+# Parses the file one block at a time, last block first with `reverse`, so
+# only one block's lines are in memory. `kwargs` go to pd.read_csv.
+def read_blocks(path, block_bytes, reverse=False, **kwargs):
+    header, offsets = block_offsets(path, block_bytes)
+    spans = list(zip(offsets[:-1], offsets[1:]))
+    with open(path, 'rb') as f:
+        for start, end in (spans[::-1] if reverse else spans):
+            f.seek(start)
+            yield pd.read_csv(io.BytesIO(header + f.read(end - start)), **kwargs)
+
+
+# The first and last data rows, read from both ends of the file without
+# scanning it.
+def edge_rows(path, **kwargs):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        first = f.readline()
+        start = f.tell()
+        position, tail = size, b''
+        while position > start and b'\n' not in tail.rstrip():
+            step = min(65536, position - start)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    lines = [line.rstrip(b'\r\n') for line in [first] + tail.rstrip().splitlines()[-1:] if line.strip()]
+    return pd.read_csv(io.BytesIO(header + b'\n'.join(lines)), **kwargs)
@@ -1,32 +1,403 @@
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
+import time
+started = time.perf_counter()
+
 import os
 import json
+import argparse
+import threading
+import functools
+import importlib
+import pandas as pd
+from dash import Dash, dcc, html, Input, Output, ctx, no_update
 from dash.exceptions import PreventUpdate
+from flask import request, jsonify
+from api_cache import LRUCache
+from data_registry import DataRegistry
+from downsample import decimate, histogram, chunked_histogram, period_totals
+from portfolio import PortfolioAnalytics
+from profiler import profile_file, read_records
+from refresh_auth import refresh_allowed
+from storage import in_database
+import timeseries_db
+
+
+# Stands in for a module until one of its attributes is used, so plotting
+# libraries are imported when the first figure is built instead of at startup.
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.name), attr)
 
-with open('metrics.json', 'r') as f:
-    processing_metrics = json.load(f)
+
+px = LazyModule('plotly.express')
+go = LazyModule('plotly.graph_objects')
 
 app = Dash(__name__, external_stylesheets=['/assets/style.css'], suppress_callback_exceptions=True)
 
 data_path = 'cleaned_data'
 asset_path = 'assets'
 input_path = 'data'
-stock_files = {
-    'JNJ': 'cleaned_JNJ_TATA_data.csv',
-    'TSLA': 'cleaned_TSLA_TATA_data.csv',
-    'TTM': 'cleaned_TTM_TATA_data.csv',
-    'WMT': 'cleaned_WMT_TATA_data.csv',
+metrics_file = 'metrics.json'
+
+# Tickers are discovered from the database and the feature store and loaded on
+# first use; see data_registry.py.
+dfs = DataRegistry()
+# Aligned returns of every ticker for the Analysis page's cross-ticker views;
+# see portfolio.py.
+portfolio = PortfolioAnalytics()
+default_stock = 'JNJ'
+ingestion_tickers = 10
+prewarm_tickers = 20
+profile_runs = 30
+ranking_rows = 5
+heatmap_tickers = 30
+# Raw files are read this many rows at a time, so a long history never has
+# to fit in memory for its histogram.
+raw_chunk_rows = 1_000_000
+
+figure_cache = LRUCache(max_entries=1024)
+# Calls, total, max and last duration of every callback. Each call is also
+# printed with --log-callbacks.
+callback_timings = {}
+log_callbacks = False
+
+# Time-series charts are decimated to about one point per pixel of the browser
+# width (rounded so that nearby widths share cache entries).
+default_points = 1000
+min_points = 200
+max_points = 4000
+
+
+# Figures and derived tables are memoized per (ticker, view, data version), so
+# switching back to a ticker serves the cached figure instead of rebuilding it.
+def memoized(stock, view, build, version=None):
+    key = (stock, view, version or dfs.version(stock))
+    return figure_cache.get_or_compute(key, build)
+
+
+def read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def metrics_version():
+    try:
+        stat = os.stat(metrics_file)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# metrics.json is read on first use and again whenever the pipeline rewrites it.
+def processing_metrics():
+    version = metrics_version()
+    if version is None:
+        return {}
+    return memoized(None, 'processing_metrics', lambda: read_json(metrics_file), version=version)
+
+
+def profile_version():
+    try:
+        stat = os.stat(profile_file)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Stage records of every clean_data.py run (see profiler.py), parsed once per
+# version of the log.
+def profile_records():
+    version = profile_version()
+    if version is None:
+        return pd.DataFrame()
+    return memoized(None, 'profile_records', lambda: pd.DataFrame(read_records(profile_file)), version=version)
+
+
+def stage_breakdown_figure(stock, stages):
+    df = pd.DataFrame(stages)
+    df = df[~df['stage'].str.contains('.', regex=False)]
+    df = df.melt(id_vars='stage', value_vars=['wall', 'cpu'], var_name='time', value_name='seconds')
+    return px.bar(df, x='seconds', y='stage', color='time', barmode='group', orientation='h',
+                  title=f'{stock} Stage Breakdown (last run)')
+
+
+def stage_trend_figure(stock):
+    df = profile_records()
+    if df.empty:
+        return None
+    df = df[(df['ticker'] == stock) & ~df['stage'].str.contains('.', regex=False)]
+    df = df[df['run'].isin(sorted(df['run'].unique())[-profile_runs:])]
+    return px.bar(df, x='run', y='wall', color='stage', title=f'{stock} Stage Wall Time per Run')
+
+
+def stock_options():
+    return [{'label': stock, 'value': stock} for stock in dfs.tickers()]
+
+
+def default_ticker():
+    tickers = dfs.tickers()
+    return default_stock if default_stock in tickers or not tickers else tickers[0]
+
+
+def timed_callback(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            timing = callback_timings.setdefault(func.__name__, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            timing['calls'] += 1
+            timing['total_ms'] += elapsed
+            timing['max_ms'] = max(timing['max_ms'], elapsed)
+            timing['last_ms'] = elapsed
+            if log_callbacks:
+                print(f"{func.__name__} took {elapsed:.1f} ms (cache hit rate {figure_cache.stats()['hit_rate']:.0%})")
+    return wrapper
+
+
+def target_points(width):
+    if not width:
+        return default_points
+    return int(min(max_points, max(min_points, round(width / 100) * 100)))
+
+
+def date_window(df, start, end):
+    timestamps = df['timestamp'].to_numpy()
+    lo = max(0, timestamps.searchsorted(pd.Timestamp(start).to_datetime64(), side='left') - 1)
+    hi = timestamps.searchsorted(pd.Timestamp(end).to_datetime64(), side='right') + 1
+    return df.iloc[lo:hi]
+
+
+def histogram_figure(values, name, title):
+    return bins_figure(histogram(values), name, title)
+
+
+def bins_figure(bins, name, title):
+    figure = px.bar(bins, x='bin_center', y='count', title=title, labels={'bin_center': name})
+    figure.update_traces(width=(bins['bin_end'] - bins['bin_start']).to_numpy())
+    figure.update_layout(bargap=0)
+    return figure
+
+
+def raw_close_histogram(raw_file):
+    return chunked_histogram(lambda: (chunk['close'] for chunk in pd.read_csv(raw_file, usecols=['close'], chunksize=raw_chunk_rows)))
+
+
+# Summed by the database when the ticker is in it.
+def volume_totals(stock, df):
+    if in_database(stock):
+        return timeseries_db.period_totals(stock, 'volume')
+    return period_totals(df, 'volume')
+
+
+# A zoomed range is an indexed range query of the chart's columns when the
+# ticker is in the database, a slice of the loaded frame otherwise.
+def zoom_window(stock, view, start, end):
+    if in_database(stock):
+        return timeseries_db.load_window(stock, chart_series[view], start, end)
+    return date_window(dfs[stock], start, end)
+
+
+def moving_avg_figure(stock, df):
+    figure = go.Figure()
+    figure.add_trace(go.Scatter(x=df['timestamp'], y=df['close'], mode='lines', name='Close Price'))
+    figure.add_trace(go.Scatter(x=df['timestamp'], y=df['20_day_moving_avg'], mode='lines', name='20-Day MA'))
+    figure.update_layout(title=f'{stock} Moving Averages')
+    return figure
+
+
+chart_builders = {
+    'price': lambda stock, df: px.line(df, x='timestamp', y='close', title=f'{stock} Stock Price Over Time'),
+    'volume': lambda stock, df: px.bar(df, x='timestamp', y='volume', title=f'{stock} Trading Volume Over Time'),
+    'moving_avg': moving_avg_figure,
+    'daily_pct': lambda stock, df: px.line(df, x='timestamp', y='daily_pct_change', title=f'{stock} Daily Percentage Change'),
+    'cumulative_return': lambda stock, df: px.line(df, x='timestamp', y='cumulative_return', title=f'{stock} Cumulative Return'),
+    'rolling_volatility': lambda stock, df: px.line(df, x='timestamp', y='rolling_volatility', title=f'{stock} Rolling Volatility'),
+    'returns_histogram': lambda stock, df: histogram_figure(df['daily_pct_change'], 'daily_pct_change', f'{stock} Histogram of Returns'),
+    'volume_pie': lambda stock, df: px.pie(volume_totals(stock, df), values='volume', names='period', title=f'{stock} Volume Distribution'),
+}
+
+# Columns each time-series chart plots, and how they are decimated: LTTB keeps
+# the shape of lines, min/max per bucket keeps the spikes of bars.
+chart_series = {
+    'price': ['close'],
+    'volume': ['volume'],
+    'moving_avg': ['close', '20_day_moving_avg'],
+    'daily_pct': ['daily_pct_change'],
+    'cumulative_return': ['cumulative_return'],
+    'rolling_volatility': ['rolling_volatility'],
 }
+decimation_methods = {'volume': 'minmax'}
+
+# Graph ids of the time-series charts, in the order of update_charts' outputs.
+zoomable_charts = {
+    'price-chart': 'price',
+    'volume-chart': 'volume',
+    'moving-avg-chart': 'moving_avg',
+    'daily-pct-chart': 'daily_pct',
+    'cumulative-return-chart': 'cumulative_return',
+    'rolling-volatility-chart': 'rolling_volatility',
+}
+
 
-dfs = {stock: pd.read_csv(os.path.join(data_path, file)) for stock, file in stock_files.items()}
+# Full-range figures are memoized per point budget; zoomed ranges are built on
+# demand from the rows inside the range.
+def chart(stock, view, points=default_points, x_range=None):
+    def build():
+        if view in chart_series and x_range is not None:
+            df = zoom_window(stock, view, *x_range)
+        else:
+            df = dfs[stock]
+        if view in chart_series:
+            df = decimate(df, chart_series[view], points, decimation_methods.get(view, 'lttb'))
+        figure = chart_builders[view](stock, df)
+        figure.update_layout(uirevision=stock)
+        if x_range is not None:
+            figure.update_xaxes(range=list(x_range))
+        return figure
+    if x_range is not None:
+        return build()
+    return memoized(stock, (view, points), build)
+
+
+# Returns the zoomed x range from a relayoutData event, None when the chart was
+# reset to the full range, and False for events that do not change the range.
+def zoom_range(relayout):
+    if not relayout:
+        return False
+    if 'xaxis.range[0]' in relayout:
+        return relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    if 'xaxis.range' in relayout:
+        return tuple(relayout['xaxis.range'])
+    if relayout.get('xaxis.autorange'):
+        return None
+    return False
+
+
+def analysis_stats(stock):
+    def build():
+        df = dfs[stock]
+        summary_stats = df.describe().T
+        summary_stats['mean'] = summary_stats['mean'].apply(lambda x: round(x, 2) if isinstance(x, (int, float)) else x)
+        return {
+            'correlation_matrix': df.select_dtypes(include=[float, int]).corr(),
+            'summary_columns': list(df.describe().columns),
+            'summary_stats': summary_stats,
+            'top': df.loc[df['cumulative_return'].idxmax()],
+            'under': df.loc[df['cumulative_return'].idxmin()]
+        }
+    return memoized(stock, 'analysis_stats', build)
+
+
+# The panel is brought up to date on each visit to the Analysis page; its
+# figures and tables are cached per revision, which only changes with the data.
+def portfolio_version():
+    return 'portfolio', portfolio.update(dfs.tickers(), dfs.version)
+
+
+def portfolio_overview():
+    version = portfolio_version()
+    rankings = memoized(None, 'portfolio_rankings', portfolio.rankings, version=version)
+    equity = memoized(None, 'portfolio_equity', lambda: px.line(decimate(portfolio.equity_curve(), ['equity'], default_points),
+                                                                 x='timestamp', y='equity', title='Equal-Weight Portfolio Equity Curve'),
+                      version=version)
+    return version, rankings, equity
+
+
+def ranking_table(df, rank):
+    return html.Table([
+        html.Thead(html.Tr([html.Th(col) for col in ['Rank', 'Stock', 'Cumulative Return', 'Volatility (annualized)']])),
+        html.Tbody([
+            html.Tr([
+                html.Td(row[rank]),
+                html.Td(row['ticker']),
+                html.Td(f"{row['cumulative_return']:.2f}"),
+                html.Td('-' if pd.isna(row['volatility']) else f"{row['volatility']:.1%}")
+            ]) for _, row in df.iterrows()
+        ])
+    ])
 
 
+def portfolio_section(stock):
+    version, rankings, equity = portfolio_overview()
+    if rankings.empty:
+        return [html.H4('Portfolio'), html.P('No return data available.')]
+    by_volatility = rankings.dropna(subset=['volatility']).sort_values('volatility_rank')
+    content = [
+        html.H4(f'Portfolio of {len(rankings)} Stocks'),
+        dcc.Graph(figure=equity),
+        html.H4('Top Performing Stocks'),
+        ranking_table(rankings.head(ranking_rows), 'return_rank'),
+        html.H4('Underperforming Stocks'),
+        ranking_table(rankings.tail(ranking_rows).iloc[::-1], 'return_rank'),
+        html.H4(f'Most Volatile Stocks (last {portfolio.window} bars)'),
+        ranking_table(by_volatility.head(ranking_rows), 'volatility_rank'),
+        html.H4('Least Volatile Stocks'),
+        ranking_table(by_volatility.tail(ranking_rows).iloc[::-1], 'volatility_rank'),
+    ]
+    if stock not in portfolio.index:
+        return content
+    row = rankings[rankings['ticker'] == stock].iloc[0]
+    volatility_rank = '-' if pd.isna(row['volatility_rank']) else row['volatility_rank']
+    peers = memoized(stock, 'portfolio_peers', lambda: portfolio.correlations_with(stock), version=version)
+    heatmap = memoized(stock, 'portfolio_heatmap',
+                       lambda: px.imshow(portfolio.correlation([stock] + list(peers.index[:heatmap_tickers - 1])), zmin=-1, zmax=1,
+                                         title=f'Correlation of {stock} and its Closest Peers (last {portfolio.window} bars)'),
+                       version=version)
+    rolling = memoized(stock, 'portfolio_rolling',
+                       lambda: px.line(decimate(portfolio.rolling_correlation(stock).dropna(), ['correlation'], default_points),
+                                       x='timestamp', y='correlation',
+                                       title=f'{stock} Rolling {portfolio.window}-bar Correlation with the Portfolio'),
+                       version=version)
+    return content + [
+        html.P(f"{stock} ranks {row['return_rank']} of {len(rankings)} by cumulative return and {volatility_rank} by volatility."),
+        html.H4('Cross-Stock Correlation'),
+        dcc.Graph(figure=heatmap),
+        dcc.Graph(figure=rolling),
+    ]
+
+
+# Builds the cached views of the first tickers in the background, so the
+# first dropdown changes are already served from the cache.
+def prewarm():
+    start = time.perf_counter()
+    portfolio_overview()
+    for stock in dfs.tickers()[:prewarm_tickers]:
+        df = dfs[stock]
+        if df is None or df.empty:
+            continue
+        for view in chart_builders:
+            chart(stock, view)
+        ingestion_section(stock)
+        analysis_stats(stock)
+        memoized(stock, 'analysis_heatmap', lambda: px.imshow(analysis_stats(stock)['correlation_matrix'], title='Correlation Heatmap'))
+        memoized(stock, 'analysis_scatter', lambda: px.scatter(df, x='volume', y='close', title=f'{stock} Volume vs. Closing Price'))
+    print(f"Figure cache prewarmed in {time.perf_counter() - start:.2f} s")
+
+
+# Walk-forward error curve written by backtest.py.
+def backtest_section(stock):
+    result = processing_metrics().get(f'{stock}_TATA_data.csv', {}).get('backtest')
+    if not result or result.get('processing_status') != 'Completed':
+        return [html.H4('Walk-forward Backtest'),
+                html.P('Backtest not available, run backtest.py or clean_data.py --backtest.')]
+    curve = lambda: px.line(pd.DataFrame({'fold_start': pd.to_datetime(result['fold_start']), 'mse': result['fold_mse']}),
+                            x='fold_start', y='mse', title=f'{stock} Out-of-sample MSE per Fold')
+    return [
+        html.H4('Walk-forward Backtest'),
+        html.P(f"{result['folds']} folds of {result['fold_rows']} rows after {result['min_train']} training rows: "
+               f"RMSE {result['rmse']:.4f}, MAE {result['mae']:.4f}, computed in {result['backtest_time'] * 1000:.1f} ms"),
+        dcc.Graph(figure=memoized(stock, 'backtest', curve, version=metrics_version()))
+    ]
+
 
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
+    dcc.Store(id='viewport-width'),
     html.Div([
         html.Img(src='/assets/company_logo.png', className='header-img'),
         html.H1("Stock Market Dashboard", className='header-title'),
@@ -37,7 +408,8 @@ app.layout = html.Div([
         dcc.Link('Data Ingestion', href='/data-ingestion', className='nav-link'),
         dcc.Link('Data Processing', href='/data-processing', className='nav-link'),
         dcc.Link('Data Visualization', href='/data-visualization', className='nav-link'),
-        dcc.Link('Analysis', href='/analysis', className='nav-link')
+        dcc.Link('Analysis', href='/analysis', className='nav-link'),
+        dcc.Link('Profiling', href='/profiling', className='nav-link')
     ], className='nav'),
 
     html.Div(id='content', className='content'),
@@ -49,56 +421,60 @@ app.layout = html.Div([
 ])
 
 
+def ingestion_section(stock):
+    return memoized(stock, 'ingestion_section', lambda: build_ingestion_section(stock, dfs[stock]))
+
+
+def build_ingestion_section(stock, df):
+    data_range = f"{df['timestamp'].min()} to {df['timestamp'].max()}"
+    data_volume = df.shape[0]
+    data_preview = df.head().to_dict('records')
+
+    missing_values = df.isnull().sum().sum()
+    missing_percentage = (df.isnull().sum() / len(df)) * 100
+    duplicates = df.duplicated().sum()
+    data_quality = f"Missing Values: {missing_values}, Missing Percentage: {missing_percentage.sum(): .2f}%, Duplicates: {duplicates}"
+    ingestion_status = "Completed"
+
+    dist_chart = px.bar(decimate(df, ['volume'], default_points, 'minmax'), x='timestamp', y='volume', title=f'{stock} Volume Distribution')
+
+    trend_chart = px.line(decimate(df, ['daily_pct_change'], default_points), x='timestamp', y='daily_pct_change', title=f'{stock} Daily Percentage Change')
+
+    return html.Div([
+        html.H3(f'Data Ingestion Content for {stock}'),
+        html.P(f'Data Source: Alpha Vantage API'),
+        html.P(f'Data Range: {data_range}'),
+        html.P(f'Data Volume: {data_volume} records ingestion'),
+        html.P(f'Data Quality: {data_quality}'),
+        html.P(f'Ingestion Status: {ingestion_status}'),
+        html.H4('Data Preview'),
+        html.Table([
+            html.Thead(
+                html.Tr([html.Th(col) for col in df.columns])
+            ),
+            html.Tbody([
+                html.Tr([
+                    html.Td(data[col]) for col in data
+                ])for data in data_preview
+            ])
+        ]),
+        html.H4('Data Distribution'),
+        dcc.Graph(figure=dist_chart),
+        html.H4('Data Trends'),
+        dcc.Graph(figure=trend_chart)
+    ])
+
+
 @app.callback(Output('content', 'children'),
               [Input('url', 'pathname')])
+@timed_callback
 def display_page(pathname):
     if pathname == '/data-ingestion':
-        stock_list = ['JNJ', 'TSLA', 'TTM', 'WMT']
         content = []
 
-        for stock in stock_list:
-            if stock in dfs:
-                df = dfs[stock]
-                if df.empty:
-                    continue
-
-                data_range = f"{df['timestamp'].min()} to {df['timestamp'].max()}"
-                data_volume = df.shape[0]
-                data_preview = df.head().to_dict('records')
-
-                missing_values = df.isnull().sum().sum()
-                missing_percentage = (df.isnull().sum() / len(df)) * 100
-                duplicates = df.duplicated().sum()
-                data_quality = f"Missing Values: {missing_values}, Missing Percentage: {missing_percentage.sum(): .2f}%, Duplicates: {duplicates}"
-                ingestion_status = "Completed"
-
-                dist_chart = px.bar(df, x='timestamp', y='volume', title=f'{stock} Volume Distribution')
-
-                trend_chart = px.line(df, x='timestamp', y='daily_pct_change', title=f'{stock} Daily Percentage Change')
-
-                content.append(html.Div([
-                    html.H3(f'Data Ingestion Content for {stock}'),
-                    html.P(f'Data Source: Alpha Vantage API'),
-                    html.P(f'Data Range: {data_range}'),
-                    html.P(f'Data Volume: {data_volume} records ingestion'),
-                    html.P(f'Data Quality: {data_quality}'),
-                    html.P(f'Ingestion Status: {ingestion_status}'),
-                    html.H4('Data Preview'),
-                    html.Table([
-                        html.Thead(
-                            html.Tr([html.Th(col) for col in df.columns])
-                        ),
-                        html.Tbody([
-                            html.Tr([
-                                html.Td(data[col]) for col in data
-                            ])for data in data_preview
-                        ])
-                    ]),
-                    html.H4('Data Distribution'),
-                    dcc.Graph(figure=dist_chart),
-                    html.H4('Data Trends'),
-                    dcc.Graph(figure=trend_chart)
-                ]))
+        for stock in dfs.tickers()[:ingestion_tickers]:
+            if dfs[stock] is not None and not dfs[stock].empty:
+                content.append(ingestion_section(stock))
         return html.Div(content)
     
 
@@ -107,8 +483,8 @@ def display_page(pathname):
            html.Div([
                dcc.Dropdown(
                    id='processing-stock-dropdown',
-                   options=[{'label': stock, 'value': stock} for stock in stock_files.keys()],
-                   value='JNJ'
+                   options=stock_options(),
+                   value=default_ticker()
                )
            ], style={'width': '50%', 'margin': '20px auto'}),
            html.Div(id='processing-content')
@@ -118,19 +494,30 @@ def display_page(pathname):
             html.Div([
                 dcc.Dropdown(
                     id='analysis-stock-dropdown',
-                    options=[{'label': stock, 'value': stock} for stock in stock_files.keys()],
-                    value='JNJ'
+                    options=stock_options(),
+                    value=default_ticker()
                 )
             ],style={'width': '50%', 'margin': '20px auto'}),
             html.Div(id='analysis-content')
         ])
+    elif pathname == '/profiling':
+        return html.Div([
+            html.Div([
+                dcc.Dropdown(
+                    id='profiling-stock-dropdown',
+                    options=stock_options(),
+                    value=default_ticker()
+                )
+            ], style={'width': '50%', 'margin': '20px auto'}),
+            html.Div(id='profiling-content')
+        ])
     elif pathname == '/data-visualization':
         return html.Div([
             html.Div([
                 dcc.Dropdown(
                     id='stock-dropdown',
-                    options=[{'label': stock, 'value': stock} for stock in stock_files.keys()],
-                    value='JNJ'
+                    options=stock_options(),
+                    value=default_ticker()
                 )
             ], style={'width': '50%', 'margin': '20px auto'}),
 
@@ -181,14 +568,18 @@ def display_page(pathname):
         Output('processing-content', 'children'),
         Input('processing-stock-dropdown', 'value')
 )
+@timed_callback
 def update_processing_content(stock):
-    if f'{stock}_TATA_data.csv' not in processing_metrics:
-        return html.div([html.H3("Metrics data not available")])
-    
-    metrics = processing_metrics[f'{stock}_TATA_data.csv']
+    metrics = processing_metrics().get(f'{stock}_TATA_data.csv')
+    raw_file = os.path.join(input_path, f'{stock}_TATA_data.csv')
+    if metrics is None or dfs[stock] is None or not os.path.exists(raw_file):
+        return html.Div([html.H3("Metrics data not available")])
 
-    data_distribution_before = px.histogram(pd.read_csv(os.path.join(input_path, f'{stock}_TATA_data.csv')), x='close', title=f'{stock} Close Price Distribution (Before Processing)')
-    data_distribution_after = px.histogram(dfs[stock], x='close', title=f'{stock} Close Price Distribution (After Processing)')
+    # The raw file is only re-read when it changes on disk.
+    raw_stat = os.stat(raw_file)
+    data_distribution_before = memoized(stock, 'processing_before', lambda: bins_figure(raw_close_histogram(raw_file), 'close', f'{stock} Close Price Distribution (Before Processing)'),
+                                        version=(raw_stat.st_size, raw_stat.st_mtime_ns))
+    data_distribution_after = memoized(stock, 'processing_after', lambda: histogram_figure(dfs[stock]['close'], 'close', f'{stock} Close Price Distribution (After Processing)'))
 
     heatmap_data = pd.DataFrame({
         'Stage': ['Missing Values', 'Duplicates', 'New Features', 'Normalized Data'],
@@ -196,7 +587,9 @@ def update_processing_content(stock):
     })
     
     
-    heatmap = px.bar(heatmap_data, x='Stage', y='Value', title='Data Quality Heatmap')
+    # Built from metrics.json rather than the data, so keyed on its version.
+    heatmap = memoized(stock, 'processing_heatmap', lambda: px.bar(heatmap_data, x='Stage', y='Value', title='Data Quality Heatmap'),
+                       version=metrics_version())
     return html.Div([
         html.H3('Data Processing Content'),
         html.P(f'Data Cleaning: Number of missing values removed: {metrics["missing_before"] - metrics["missing_after"]}, Number of duplicate records removed: {metrics["duplicates_before"] - metrics["duplicates_after"]}'),
@@ -214,41 +607,70 @@ def update_processing_content(stock):
         html.H4('Data Quality Heatmap'),
         dcc.Graph(figure=heatmap)
     ])
+@app.callback(
+        Output('profiling-content', 'children'),
+        Input('profiling-stock-dropdown', 'value')
+)
+@timed_callback
+def update_profiling_content(stock):
+    stages = processing_metrics().get(f'{stock}_TATA_data.csv', {}).get('stages')
+    if not stages:
+        return html.Div([html.H3("Profiling data not available")])
+
+    breakdown = memoized(stock, 'profile_breakdown', lambda: stage_breakdown_figure(stock, stages), version=metrics_version())
+    trend = memoized(stock, 'profile_trend', lambda: stage_trend_figure(stock), version=profile_version())
+    content = [
+        html.H3(f'Pipeline Profile for {stock}'),
+        dcc.Graph(figure=breakdown),
+        html.Table([
+            html.Thead(html.Tr([html.Th(col) for col in ['Stage', 'Wall (ms)', 'CPU (ms)', 'Peak Memory (KB)', 'Rows/sec']])),
+            html.Tbody([
+                html.Tr([
+                    html.Td(record['stage']),
+                    html.Td(f"{record['wall'] * 1000:.1f}"),
+                    html.Td(f"{record['cpu'] * 1000:.1f}"),
+                    html.Td('-' if record['peak_memory'] is None else f"{record['peak_memory'] / 1024:.0f}"),
+                    html.Td('-' if record['rows_per_sec'] is None else f"{record['rows_per_sec']:,.0f}")
+                ]) for record in stages
+            ])
+        ])
+    ]
+    if trend is not None:
+        content.append(dcc.Graph(figure=trend))
+    return html.Div(content)
+
+
 @app.callback(
         Output('analysis-content', 'children'),
         Input('analysis-stock-dropdown', 'value')
 )
+@timed_callback
 def update_analysis_content(stock):
     df = dfs[stock]
 
-    if df.empty:
+    if df is None or df.empty:
         raise PreventUpdate
     
     if 'timestamp' not in df.columns or 'cumulative_return' not in df.columns:
         return html.Div([html.H3("Required columns are missing")])
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
 
-    numeric_df = df.select_dtypes(include=[float, int])
-    if numeric_df.empty:
+    if df.select_dtypes(include=[float, int]).empty:
         return html.Div([html.H3("No numeric data available for correlation analysis")])
-    
-    correlation_matrix = numeric_df.corr()
-    
-    summary_stats = df.describe().T
-    summary_stats['mean'] = summary_stats['mean'].apply(lambda x: round(x, 2) if isinstance(x, (int, float)) else x)
 
-    heatmap = px.imshow(correlation_matrix, title='Correlation Heatmap')
+    stats = analysis_stats(stock)
+    summary_stats = stats['summary_stats']
 
-    line_chart = px.line(df, x='timestamp', y='close', title=f'{stock} Closing Price Over Time')
-    scatter_plot = px.scatter(df, x='volume', y='close', title=f'{stock} Volume vs. Closing Price')
-    top_performing_stock = df.loc[df['cumulative_return'].idxmax()]
-    underperforming_stock = df.loc[df['cumulative_return'].idxmin()]
+    heatmap = memoized(stock, 'analysis_heatmap', lambda: px.imshow(stats['correlation_matrix'], title='Correlation Heatmap'))
+
+    scatter_plot = memoized(stock, 'analysis_scatter', lambda: px.scatter(df, x='volume', y='close', title=f'{stock} Volume vs. Closing Price'))
+    top_performing_stock = stats['top']
+    underperforming_stock = stats['under']
 
     content = [
         html.H3(f'Analysis Content for {stock}'),
         html.H4('Summary Statistics'),
         html.Table([
-            html.Thead(html.Tr([html.Th(col) for col in df.describe().columns])),
+            html.Thead(html.Tr([html.Th(col) for col in stats['summary_columns']])),
             html.Tbody([
                 html.Tr([html.Td(summary_stats.loc[col, 'mean']) for col in summary_stats.index])
 
@@ -256,15 +678,15 @@ def update_analysis_content(stock):
         ]),
         html.P(f'Data Range: {df["timestamp"].min()} to {df["timestamp"].max()}'),
         html.P(f'Data Volume: {df.shape[0]} records'),
-        html.H4('Correlation Heatmap'),
+        html.H4('Feature Correlation Heatmap'),
         dcc.Graph(figure=heatmap),
         html.H4('Closing Price Over Time'),
         dcc.Graph(figure=scatter_plot),
-        html.H4('Top Performing Stock'),
-        html.P(f"Top performing stock is {top_performing_stock['timestamp']} with cumulative return {top_performing_stock['cumulative_return']: .2f}"),
-        html.H4('Underperforming stock'),
-        html.P(f"Underperforming stock is {underperforming_stock['timestamp']} with cumulative return {underperforming_stock['cumulative_return']: .2f}")
-    ]
+        html.H4('Best Day'),
+        html.P(f"{stock} reached its highest cumulative return on {top_performing_stock['timestamp']}: {top_performing_stock['cumulative_return']: .2f}"),
+        html.H4('Worst Day'),
+        html.P(f"{stock} reached its lowest cumulative return on {underperforming_stock['timestamp']}: {underperforming_stock['cumulative_return']: .2f}")
+    ] + portfolio_section(stock) + backtest_section(stock)
     return html.Div(content)
 
 @app.callback(
@@ -277,30 +699,68 @@ def update_analysis_content(stock):
      Output('returns-histogram', 'figure'),
      Output('volume-pie-chart', 'figure'),
      Output('last-update', 'children')],
-    [Input('stock-dropdown', 'value')]
+    [Input('stock-dropdown', 'value'),
+     Input('viewport-width', 'data')] +
+    [Input(chart_id, 'relayoutData') for chart_id in zoomable_charts]
 )
-def update_charts(stock):
+@timed_callback
+def update_charts(stock, width, *relayouts):
     df = dfs[stock]
 
-    if df.empty:
+    if df is None or df.empty:
         return[dcc.Graph(), dcc.Graph(), dcc.Graph(), dcc.Graph(), dcc.Graph(), dcc.Graph(), dcc.Graph(), dcc.Graph(), html.P("No Data Available")]
 
-    price_chart = px.line(df, x='timestamp', y='close', title=f'{stock} Stock Price Over Time')
-    volume_chart = px.bar(df, x='timestamp', y='volume', title=f'{stock} Trading Volume Over Time')
-    moving_avg_chart = go.Figure()
-    moving_avg_chart.add_trace(go.Scatter(x=df['timestamp'], y=df['close'], mode='lines', name='Close Price'))
-    moving_avg_chart.add_trace(go.Scatter(x=df['timestamp'], y=df['20_day_moving_avg'], mode='lines', name='20-Day MA'))
-    moving_avg_chart.update_layout(title=f'{stock} Moving Averages')
-    daily_pct_chart = px.line(df, x='timestamp', y='daily_pct_change', title=f'{stock} Daily Percentage Change')
-    cumulative_return_chart = px.line(df, x='timestamp', y='cumulative_return', title=f'{stock} Cumulative Return')
-    rolling_volatility_chart = px.line(df, x='timestamp', y='rolling_volatility', title=f'{stock} Rolling Volatility')
-    returns_histogram = px.histogram(df, x='daily_pct_change', title=f'{stock} Histogram of Returns')
-    volume_pie_chart = px.pie(df, values='volume', names='timestamp', title=f'{stock} Volume Distribution')
+    points = target_points(width)
+
+    # A zoom or reset on one chart only re-queries that chart, at full detail
+    # for the visible range.
+    if ctx.triggered_id in zoomable_charts:
+        position = list(zoomable_charts).index(ctx.triggered_id)
+        x_range = zoom_range(relayouts[position])
+        if x_range is False:
+            raise PreventUpdate
+        outputs = [no_update] * 9
+        outputs[position] = chart(stock, zoomable_charts[ctx.triggered_id], points, x_range)
+        return outputs
+
+    price_chart = chart(stock, 'price', points)
+    volume_chart = chart(stock, 'volume', points)
+    moving_avg_chart = chart(stock, 'moving_avg', points)
+    daily_pct_chart = chart(stock, 'daily_pct', points)
+    cumulative_return_chart = chart(stock, 'cumulative_return', points)
+    rolling_volatility_chart = chart(stock, 'rolling_volatility', points)
+    returns_histogram = chart(stock, 'returns_histogram')
+    volume_pie_chart = chart(stock, 'volume_pie')
     last_update = f"Last Update: {df['timestamp'].max()}"
 
     return (price_chart, volume_chart, moving_avg_chart, daily_pct_chart, cumulative_return_chart, rolling_volatility_chart, returns_histogram, volume_pie_chart, last_update)
 
+app.clientside_callback(
+    "function(pathname) { return window.innerWidth; }",
+    Output('viewport-width', 'data'),
+    Input('url', 'pathname')
+)
+
+
+# Called by scheduler.py after a run with the tickers it rewrote, so open pages
+# pick up the new data on their next callback. Without tickers everything is
+# dropped. Only the scheduler may call it (see refresh_auth.py).
+@app.server.route('/refresh', methods=['POST'])
+def refresh():
+    if not refresh_allowed(request):
+        return jsonify({'error': 'Refresh not allowed'}), 403
+    tickers = (request.get_json(silent=True) or {}).get('tickers')
+    frames = dfs.refresh(tickers or None)
+    figures = figure_cache.discard(lambda key: not tickers or key[0] in tickers)
+    return jsonify({'frames': frames, 'figures': figures})
+
+
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    parser = argparse.ArgumentParser(description='Run the stock dashboard.')
+    parser.add_argument('--log-callbacks', action='store_true', help="print every callback's duration")
+    log_callbacks = parser.parse_args().log_callbacks
+    print(f"Dashboard ready in {time.perf_counter() - started:.2f} s, {len(dfs.tickers())} tickers discovered")
+    threading.Thread(target=prewarm, daemon=True).start()
+    app.run(debug=True)
 
                       
\ No newline at end of file
@@ -0,0 +1,95 @@
+import time
+import threading
+from api_cache import LRUCache
+import shared_frames
+from storage import load_features, data_version, list_tickers
+
+
+def frame_bytes(entry):
+    df = entry[1]
+    return int(df.memory_usage(index=True).sum()) if df is not None else 0
+
+
+# Lazy view of the stored bars (see storage.py) for long-running processes. A
+# ticker's frame is loaded on first access and kept in an LRU bounded by
+# memory; its data_version is re-checked at most every `check_interval` seconds
+# and the frame is reloaded when the data changed. Indexing works like the dict of
+# frames it replaces (missing tickers give None).
+class DataRegistry:
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_entries=256, check_interval=2.0,
+                 loader=load_features, versioner=data_version, lister=list_tickers):
+        self.frames = LRUCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=frame_bytes)
+        self.check_interval = check_interval
+        self.loader = loader
+        self.versioner = versioner
+        self.lister = lister
+        self.checked = {}
+        self.listing = (None, [])
+        self.loads = 0
+        self.reloads = 0
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+
+    def tickers(self):
+        checked_at, tickers = self.listing
+        if checked_at is None or time.monotonic() - checked_at > self.check_interval:
+            tickers = self.lister()
+            self.listing = (time.monotonic(), tickers)
+        return tickers
+
+    def version(self, ticker):
+        entry = self.checked.get(ticker)
+        if entry is None or time.monotonic() - entry[1] > self.check_interval:
+            info = self.versioner(ticker)
+            entry = (info[0] if info else None, time.monotonic())
+            self.checked[ticker] = entry
+        return entry[0]
+
+    def get(self, ticker):
+        version = self.version(ticker)
+        if version is None:
+            return None
+        cached = self.frames.get(ticker)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # One load at a time, so concurrent callbacks asking for the same cold
+        # ticker read its files once.
+        with self.lock:
+            cached = self.frames.get(ticker)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            start = time.perf_counter()
+            df = shared_frames.load(ticker, version, lambda: self.loader(ticker))
+            self.load_time += time.perf_counter() - start
+            self.loads += 1
+            if cached is not None:
+                self.reloads += 1
+            self.frames.put(ticker, (version, df))
+            return df
+
+    # Forgets the checked versions and the frames of `tickers` (all of them by
+    # default), so the next access sees new data without waiting for
+    # check_interval. Returns the number of frames dropped.
+    def refresh(self, tickers=None):
+        self.listing = (None, [])
+        for ticker in list(self.checked) if tickers is None else tickers:
+            self.checked.pop(ticker, None)
+        return self.frames.discard(lambda ticker: tickers is None or ticker in tickers)
+
+    def __getitem__(self, ticker):
+        return self.get(ticker)
+
+    def __contains__(self, ticker):
+        return ticker in self.tickers()
+
+    def __iter__(self):
+        return iter(self.tickers())
+
+    def loaded(self):
+        return list(self.frames.entries)
+
+    def stats(self):
+        stats = self.frames.stats()
+        stats.update({'tickers': len(self.tickers()), 'loads': self.loads,
+                      'reloads': self.reloads, 'load_time': self.load_time})
+        return stats
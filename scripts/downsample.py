@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+
+# Largest-Triangle-Three-Buckets: keeps the first and last points and, from each
+# of the n_out - 2 buckets in between, the point forming the largest triangle
+# with the point kept from the previous bucket and the mean of the next bucket.
+# Returns the indices of the kept points.
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept = np.empty(n_out, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[next_lo:next_hi].mean()
+        next_y = np.nanmean(y[next_lo:next_hi]) if np.isfinite(y[next_lo:next_hi]).any() else y[previous]
+        area = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + (int(np.nanargmax(area)) if np.isfinite(area).any() else 0)
+        kept[i + 1] = previous
+    return kept
+
+
+# Keeps the minimum and maximum of each of n_out // 2 equal-count buckets, so
+# spikes survive (used for bar charts, where LTTB's averaging hides extremes).
+def minmax(y, n_out):
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype='float64'), nan=0.0)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    width = np.diff(edges)
+    # Equal-count buckets padded to the widest one, reduced in a single pass.
+    index = edges[:-1, None] + np.minimum(np.arange(width.max()), width[:, None] - 1)
+    values = y[index]
+    kept = np.concatenate([index[np.arange(buckets), values.argmin(axis=1)],
+                           index[np.arange(buckets), values.argmax(axis=1)]])
+    return np.unique(kept)
+
+
+def decimate(df, columns, n_out, method='lttb'):
+    if len(df) <= n_out:
+        return df
+    if method == 'minmax':
+        kept = np.unique(np.concatenate([minmax(df[col].to_numpy(), n_out) for col in columns]))
+    else:
+        x = df['timestamp'].to_numpy().astype('int64')
+        kept = np.unique(np.concatenate([lttb(x, df[col].to_numpy(), n_out // len(columns)) for col in columns]))
+    return df.iloc[kept]
+
+
+# Histogram computed server side: the figure gets `bins` bars instead of the
+# raw values.
+def histogram(values, bins=50):
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:],
+                         'bin_center': (edges[:-1] + edges[1:]) / 2, 'count': counts})
+
+
+# histogram() over values too many to load at once. `chunks` returns a fresh
+# iterator of value chunks and is called twice: once for the range, once for
+# the counts. The bins are the same as histogram() of all the values.
+def chunked_histogram(chunks, bins=50):
+    low, high = np.inf, -np.inf
+    for values in chunks():
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if len(values):
+            low, high = min(low, values.min()), max(high, values.max())
+    if low > high:
+        low, high = 0.0, 1.0
+    counts = np.zeros(bins, dtype='int64')
+    for values in chunks():
+        values = np.asarray(values, dtype='float64')
+        counts += np.histogram(values[np.isfinite(values)], bins=bins, range=(low, high))[0]
+    edges = np.histogram_bin_edges([], bins=bins, range=(low, high))
+    return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:],
+                         'bin_center': (edges[:-1] + edges[1:]) / 2, 'count': counts})
+
+
+periods = ['D', 'W', 'M', 'Q', 'Y']
+
+
+# Sums `column` over the finest calendar period that yields at most
+# `max_buckets` groups; used instead of one pie slice per timestamp.
+def period_totals(df, column, max_buckets=24):
+    timestamps = pd.to_datetime(df['timestamp'])
+    for period in periods:
+        groups = timestamps.dt.to_period(period)
+        if groups.nunique() <= max_buckets or period == periods[-1]:
+            totals = df[column].groupby(groups).sum()
+            return pd.DataFrame({'period': totals.index.astype(str), column: totals.to_numpy()})
@@ -0,0 +1,290 @@
+import os
+import shutil
+import hashlib
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+store_path = 'feature_store'
+csv_path = 'cleaned_data'
+summary_file = os.path.join(csv_path, 'summary_index.json')
+
+int_columns = ['volume']
+
+
+# Layout: feature_store/ticker=<T>/year=<YYYY>/part-0.parquet, and
+# feature_store/ticker=<T>/scalers.json when the ticker has scaled columns.
+def ticker_dir(ticker, root=store_path):
+    return os.path.join(root, f'ticker={ticker}')
+
+
+def scalers_file(ticker, root=store_path):
+    return os.path.join(ticker_dir(ticker, root), 'scalers.json')
+
+
+def partition_file(ticker, year, root=store_path):
+    return os.path.join(ticker_dir(ticker, root), f'year={year}', 'part-0.parquet')
+
+
+def list_tickers(root=store_path):
+    tickers = set()
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            if name.startswith('ticker='):
+                tickers.add(name[len('ticker='):])
+    if os.path.isdir(csv_path):
+        for name in os.listdir(csv_path):
+            if name.startswith('cleaned_') and name.endswith('_TATA_data.csv'):
+                tickers.add(name[len('cleaned_'):-len('_TATA_data.csv')])
+    return sorted(tickers)
+
+
+def compact_schema(df):
+    fields = []
+    for col in df.columns:
+        if col == 'timestamp':
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif col in int_columns:
+            fields.append(pa.field(col, pa.int64()))
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            fields.append(pa.field(col, pa.float32()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def to_table(df):
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return pa.Table.from_pandas(df, schema=compact_schema(df), preserve_index=False)
+
+
+# Scaled columns are not stored in the partitions but derived on load as
+# (base - centre) / scale, with `scalers` mapping each one to (base column,
+# centre, scale): they are whole-history scalers, so appending bars would
+# otherwise mean rewriting every partition.
+def scale_columns(df, scalers):
+    for col, (base, centre, scale) in scalers.items():
+        df[col] = (df[base].astype('float64') - centre) / scale
+    return df
+
+
+def load_scalers(ticker, root=store_path):
+    if not os.path.exists(scalers_file(ticker, root)):
+        return {}
+    with open(scalers_file(ticker, root), 'r') as f:
+        return json.load(f)
+
+
+def _write_scalers(scalers, ticker, root):
+    if scalers:
+        os.makedirs(ticker_dir(ticker, root), exist_ok=True)
+        with open(scalers_file(ticker, root), 'w') as f:
+            json.dump(scalers, f)
+
+
+def _unscaled(df, scalers):
+    return df.drop(columns=[col for col in scalers or {} if col in df.columns])
+
+
+def _write_partition(df, ticker, year, root):
+    path = partition_file(ticker, year, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(to_table(df), path)
+
+
+def write_features(df, ticker, root=store_path, scalers=None):
+    if os.path.isdir(ticker_dir(ticker, root)):
+        shutil.rmtree(ticker_dir(ticker, root))
+    df = _unscaled(df, scalers)
+    timestamps = pd.to_datetime(df['timestamp'])
+    for year, part in df.groupby(timestamps.dt.year):
+        _write_partition(part, ticker, year, root)
+    _write_scalers(scalers, ticker, root)
+
+
+# write_features() for a ticker produced in batches, oldest first: each batch
+# is appended to its year's partition, and only that partition's file is open.
+class FeatureWriter:
+    def __init__(self, ticker, root=store_path, scalers=None):
+        self.ticker = ticker
+        self.root = root
+        self.scalers = scalers
+        self.year = None
+        self.writer = None
+        if os.path.isdir(ticker_dir(ticker, root)):
+            shutil.rmtree(ticker_dir(ticker, root))
+        _write_scalers(scalers, ticker, root)
+
+    def write(self, df):
+        df = _unscaled(df, self.scalers)
+        timestamps = pd.to_datetime(df['timestamp'])
+        for year, part in df.groupby(timestamps.dt.year):
+            table = to_table(part)
+            if year != self.year:
+                self.close()
+                path = partition_file(self.ticker, year, self.root)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.writer = pq.ParquetWriter(path, table.schema)
+                self.year = year
+            self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Adds bars to a ticker's store, rewriting only the partitions of their years,
+# and replaces its scalers.
+def append_features(df, ticker, root=store_path, scalers=None):
+    df = _unscaled(df, scalers)
+    timestamps = pd.to_datetime(df['timestamp'])
+    for year, part in df.groupby(timestamps.dt.year):
+        path = partition_file(ticker, year, root)
+        if os.path.exists(path):
+            existing = pq.read_table(path, memory_map=True).to_pandas()
+            part = pd.concat([existing, part], ignore_index=True)
+            part['timestamp'] = pd.to_datetime(part['timestamp'])
+            part = part.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+        _write_partition(part, ticker, year, root)
+    _write_scalers(scalers, ticker, root)
+
+
+def _partition_years(ticker, root):
+    years = []
+    for name in os.listdir(ticker_dir(ticker, root)):
+        if name.startswith('year='):
+            years.append(int(name[len('year='):]))
+    return sorted(years)
+
+
+def data_files(ticker, root=store_path):
+    if os.path.isdir(ticker_dir(ticker, root)):
+        files = [partition_file(ticker, year, root) for year in _partition_years(ticker, root)]
+        return files + [scalers_file(ticker, root)]
+    file_path = os.path.join(csv_path, f'cleaned_{ticker}_TATA_data.csv')
+    return [file_path] if os.path.exists(file_path) else []
+
+
+# Cheap version stamp of a ticker's files (paths, sizes and mtimes), used as a
+# cache key. Returns (version, last modified time) or None when there is no data.
+def data_version(ticker, root=store_path):
+    stats = []
+    for path in data_files(ticker, root):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stats.append((path, stat.st_size, stat.st_mtime_ns))
+    if not stats:
+        return None
+    version = hashlib.md5(repr(stats).encode()).hexdigest()[:16]
+    return version, max(s[2] for s in stats) / 1e9
+
+
+def _date_filters(start, end):
+    filters = []
+    if start is not None:
+        filters.append(('timestamp', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('timestamp', '<=', pd.Timestamp(end)))
+    return filters or None
+
+
+def _load_csv(ticker, columns, start, end):
+    file_path = os.path.join(csv_path, f'cleaned_{ticker}_TATA_data.csv')
+    if not os.path.exists(file_path):
+        return None
+    usecols = None if columns is None else list(dict.fromkeys(['timestamp'] + list(columns)))
+    df = pd.read_csv(file_path, usecols=usecols, parse_dates=['timestamp'])
+    if start is not None:
+        df = df[df['timestamp'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['timestamp'] <= pd.Timestamp(end)]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+def load_features(ticker, columns=None, start=None, end=None, root=store_path):
+    if not os.path.isdir(ticker_dir(ticker, root)):
+        return _load_csv(ticker, columns, start, end)
+
+    # Partition pruning on year, then row-group predicate pushdown on timestamp.
+    years = _partition_years(ticker, root)
+    if start is not None:
+        years = [y for y in years if y >= pd.Timestamp(start).year]
+    if end is not None:
+        years = [y for y in years if y <= pd.Timestamp(end).year]
+
+    scalers = load_scalers(ticker, root)
+    if columns is not None:
+        scalers = {col: params for col, params in scalers.items() if col in columns}
+        read_columns = list(dict.fromkeys(scalers[col][0] if col in scalers else col for col in columns))
+    else:
+        read_columns = None
+    tables = []
+    for year in years:
+        path = partition_file(ticker, year, root)
+        # Only the boundary years need a row filter; inner years are read whole.
+        start_inside = start is None or pd.Timestamp(start) <= pd.Timestamp(year, 1, 1)
+        end_inside = end is None or pd.Timestamp(end) >= pd.Timestamp(year, 12, 31, 23, 59, 59)
+        if start_inside and end_inside:
+            tables.append(pq.ParquetFile(path, memory_map=True).read(columns=read_columns))
+        else:
+            tables.append(pq.read_table(path, columns=read_columns,
+                                        filters=_date_filters(start, end), memory_map=True))
+    if not tables:
+        return pd.DataFrame(columns=None if columns is None else list(columns))
+    df = scale_columns(pa.concat_tables(tables).to_pandas().reset_index(drop=True), scalers)
+    return df if columns is None else df[list(columns)]
+
+
+# One row of the summary index: what a watchlist needs about a ticker without
+# opening its files.
+def summarize(df):
+    timestamps = pd.to_datetime(df['timestamp'])
+    year = df[timestamps > year_start(timestamps.iloc[-1])]
+    return summary_entry(timestamps.iloc[0], timestamps.iloc[-1], len(df), df.iloc[-1],
+                         year['high'].max(), year['low'].min())
+
+
+def year_start(end):
+    return end - pd.DateOffset(weeks=52)
+
+
+def summary_entry(start, end, rows, last, high_52w, low_52w):
+    return {
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'rows': int(rows),
+        'last_close': float(last['close']),
+        'last_cumulative_return': float(last['cumulative_return']),
+        'last_rolling_volatility': float(last['rolling_volatility']),
+        'high_52w': float(high_52w),
+        'low_52w': float(low_52w)
+    }
+
+
+def load_summary_index(path=summary_file):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_summary_index(index, path=summary_file):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sorted(index.items())), f)
+    os.replace(tmp_path, path)
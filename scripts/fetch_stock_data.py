@@ -1,94 +1,332 @@
-# import os  
-# import pandas as pd
-# import requests
-# import time
-# from datetime import datetime, timedelta
-# from io import StringIO
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+import aiohttp
+import pandas as pd
+
+
+base_url = 'https://www.alphavantage.co/query'
+data_path = 'data'
+checkpoint_file = os.path.join(data_path, 'fetch_checkpoint.json')
+manifest_file = os.path.join(data_path, 'manifest.json')
 
+max_requests_per_minute = 5
+max_requests_per_day = 500
+max_concurrency = 5
+max_retries = 4
+backoff_base = 2.0
+backoff_cap = 60.0
+chunk_size = 64 * 1024
+compact_rows = 100
 
 
+class QuotaExceeded(Exception):
+    pass
 
 
+class RetryableError(Exception):
+    pass
+
+
+# Token bucket where every spent token comes back exactly `period` seconds
+# after it was taken, so no window of `period` seconds ever sees more than
+# `limit` requests. `history` seeds the bucket from a previous run.
+class TokenBucket:
+    def __init__(self, limit, period, history=(), clock=time.time):
+        self.limit = limit
+        self.period = period
+        self.clock = clock
+        self.spent = deque(t for t in sorted(history) if t > clock() - period)
 
+    def _refill(self, now):
+        while self.spent and self.spent[0] <= now - self.period:
+            self.spent.popleft()
+
+    def wait_time(self):
+        now = self.clock()
+        self._refill(now)
+        if len(self.spent) < self.limit:
+            return 0.0
+        return self.spent[0] + self.period - now
 
-# def fetch_stock_data(key_job, ticker, start_date, end_date, output_size = 'compact'):
-#     url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={ticker}&outputsize={output_size}&apikey={key_job}&datatype=csv"
-#     try:
-#         response = requests.get(url)
-#         response.raise_for_status()  
-#         data = pd.read_csv(StringIO(response.text))
-#         if data.empty:
-#             print(f"No data returned for {ticker}.")
-#             return None
-        
-#         data['timestamp'] = pd.to_datetime(data['timestamp'])
-#         start_date = pd.to_datetime(start_date)
-#         end_date = pd.to_datetime(end_date)
-
-
-
-#         data = data[(data['timestamp'] >= start_date) & (data['timestamp'] <= end_date)]
-
-#         if data.empty:
-#             print(f"No data within the date range for {ticker}.")
-#             return None
-
-
-#         return data
-#     except requests.exceptions.RequestException as e:
-#         print(f"Error fetching data for {ticker}: {e}")
-#         return None
-
-
-
-
-# def rate_limited_fetch(key_job, tickers, output_size='compact'):
-#     request_counter = 0
-#     max_requests_per_minute = 5
-#     max_requests_per_day = 500
-#     start_time = datetime.now()
-
-#     end_date = datetime.now().date()
-#     start_date = end_date - timedelta(days=60)
-
-
-#     for ticker in tickers:
-#         if request_counter >= max_requests_per_day:
-#             print("Reached daily API request limit. Please try again tomorrow.")
-#             break
-
-
-
-#         data = fetch_stock_data(key_job, ticker, start_date, end_date, output_size)
-#         if data is not None:
-#             save_path = os.path.join('data', f'{ticker}_TATA_data.csv')
-#             os.makedirs(os.path.dirname(save_path), exist_ok=True)  
-#             data.to_csv(save_path, index=False)
-#             print(f"Data for {ticker} fetched and saved to {save_path}")
-
-                  
-
-
-
-#         request_counter += 1
-#         time.sleep(15)
-
-#         if datetime.now().date() != start_time.date():
-#             request_counter = 0
-#             start_time = datetime.now()
-
-
-
-# if __name__ == "__main__":
-#     key_job = os.getenv('key_job')
-#     if not key_job:
-#         raise ValueError('Please set the key_job environment variable')
-#     else:
-#         print(f'API key is set : {key_job}')
-    
-
-#     tickers = ['TTM', 'TSLA', 'JNJ', 'WMT']
-#     output_size = 'compact'
-
-
-#     rate_limited_fetch(key_job, tickers, output_size)
\ No newline at end of file
+    def take(self):
+        self.spent.append(self.clock())
+
+
+class RateLimiter:
+    def __init__(self, per_minute=max_requests_per_minute, per_day=max_requests_per_day, history=(), wait_for_day=False):
+        self.minute = TokenBucket(per_minute, 60, history)
+        self.day = TokenBucket(per_day, 24 * 60 * 60, history)
+        self.wait_for_day = wait_for_day
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                day_wait = self.day.wait_time()
+                if day_wait > 0 and not self.wait_for_day:
+                    raise QuotaExceeded(f'daily request limit reached, next slot in {day_wait:.0f}s')
+                wait = max(day_wait, self.minute.wait_time())
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.minute.take()
+            self.day.take()
+
+    def history(self):
+        return list(self.day.spent)
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path=checkpoint_file):
+    if not os.path.exists(path):
+        return {'completed': [], 'requests': []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=checkpoint_file):
+    write_json(checkpoint, path)
+
+
+def load_manifest(path=manifest_file):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=manifest_file):
+    write_json(manifest, path)
+
+
+def data_file(ticker, save_dir=data_path):
+    return os.path.join(save_dir, f'{ticker}_TATA_data.csv')
+
+
+def manifest_entry(df):
+    timestamps = pd.to_datetime(df['timestamp'])
+    return {
+        'start': timestamps.min().strftime('%Y-%m-%d'),
+        'end': timestamps.max().strftime('%Y-%m-%d'),
+        'rows': int(len(df))
+    }
+
+
+# Date range already on disk for a ticker. Files fetched before the manifest
+# existed are scanned once and recorded.
+def covered_range(manifest, ticker, save_dir=data_path):
+    if ticker not in manifest and os.path.exists(data_file(ticker, save_dir)):
+        df = pd.read_csv(data_file(ticker, save_dir), usecols=['timestamp'])
+        if not df.empty:
+            manifest[ticker] = manifest_entry(df)
+    return manifest.get(ticker)
+
+
+# The daily series is complete up to the previous business day; today's bar is
+# only published after the close.
+def last_expected_session(today=None):
+    return pd.Timestamp(today or pd.Timestamp.now()).normalize() - pd.offsets.BDay(1)
+
+
+def choose_output_size(entry, today=None):
+    if entry is None:
+        return 'full'
+    end = pd.Timestamp(entry['end'])
+    expected = last_expected_session(today)
+    # 'checked' covers tickers whose feed lags or skipped a session: they were
+    # already asked for everything up to that date.
+    if max(end, pd.Timestamp(entry.get('checked', entry['end']))) >= expected:
+        return None
+    missing = len(pd.bdate_range(end + pd.offsets.BDay(1), expected))
+    return 'compact' if missing < compact_rows else 'full'
+
+
+# Merges a download into the ticker's file, deduplicated on timestamp (newer
+# download wins) and kept newest first like the API returns it.
+def merge_download(download_path, save_path):
+    df = pd.read_csv(download_path)
+    if os.path.exists(save_path):
+        df = pd.concat([df, pd.read_csv(save_path)], ignore_index=True)
+    df = df.drop_duplicates(subset='timestamp', keep='first')
+    df = df.iloc[pd.to_datetime(df['timestamp']).argsort(kind='stable')[::-1]]
+    tmp_path = f'{save_path}.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, save_path)
+    os.remove(download_path)
+    return manifest_entry(df)
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+
+def request_params(key_job, ticker, output_size):
+    return {
+        'function': 'TIME_SERIES_DAILY',
+        'symbol': ticker,
+        'outputsize': output_size,
+        'apikey': key_job,
+        'datatype': 'csv'
+    }
+
+
+# Streams the CSV body straight into `save_path` through a temporary file. Alpha
+# Vantage answers quota and symbol errors with a 200 JSON body, so the first
+# chunk is checked before anything is written.
+async def stream_to_file(response, save_path):
+    tmp_path = f'{save_path}.part'
+    first = True
+    try:
+        with open(tmp_path, 'wb') as f:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if first:
+                    if chunk.lstrip().startswith(b'{'):
+                        body = chunk + await response.content.read()
+                        message = json.loads(body)
+                        if 'Error Message' in message:
+                            raise ValueError(message['Error Message'])
+                        raise RetryableError(next(iter(message.values()), 'API returned no data'))
+                    first = False
+                f.write(chunk)
+        if first:
+            raise RetryableError('empty response')
+        os.replace(tmp_path, save_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def fetch_stock_data(session, limiter, key_job, ticker, output_size='compact', url=base_url, save_dir=data_path):
+    save_path = data_file(ticker, save_dir)
+    download_path = f'{save_path}.download'
+    os.makedirs(save_dir, exist_ok=True)
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            async with session.get(url, params=request_params(key_job, ticker, output_size)) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise RetryableError(f'HTTP {response.status}')
+                response.raise_for_status()
+                await stream_to_file(response, download_path)
+            return save_path, await asyncio.to_thread(merge_download, download_path, save_path)
+        except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Retrying {ticker} in {delay:.1f}s after error: {e}")
+            await asyncio.sleep(delay)
+
+
+# output_size 'auto' requests only what is missing per ticker: tickers that are
+# current are skipped, small gaps use 'compact' (last 100 bars) and new tickers
+# or long gaps use 'full'.
+async def rate_limited_fetch(key_job, tickers, output_size='auto', url=base_url, save_dir=data_path,
+                             concurrency=max_concurrency, per_minute=max_requests_per_minute,
+                             per_day=max_requests_per_day, checkpoint_path=checkpoint_file,
+                             manifest_path=manifest_file, today=None):
+    checkpoint = load_checkpoint(checkpoint_path)
+    done = set(checkpoint['completed'])
+    pending = [t for t in tickers if t not in done]
+    if len(pending) < len(tickers):
+        print(f"Resuming: {len(tickers) - len(pending)} tickers already fetched")
+
+    manifest = load_manifest(manifest_path)
+    queue = asyncio.Queue()
+    for ticker in pending:
+        size = output_size
+        if size == 'auto':
+            size = choose_output_size(covered_range(manifest, ticker, save_dir), today)
+        if size is None:
+            print(f"{ticker} is up to date ({manifest[ticker]['end']}), skipping")
+            continue
+        queue.put_nowait((ticker, size))
+    save_manifest(manifest, manifest_path)
+
+    limiter = RateLimiter(per_minute, per_day, checkpoint['requests'])
+    failed = {}
+    # Tickers that may succeed on a later run: cut off by the daily quota or
+    # still failing transiently after every retry. Other errors (unknown
+    # symbols, client errors) are final and do not keep the run resumable.
+    unfinished = set()
+
+    async def worker(session):
+        while True:
+            try:
+                ticker, size = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                save_path, entry = await fetch_stock_data(session, limiter, key_job, ticker, size, url, save_dir)
+                print(f"Data for {ticker} ({size}) merged into {save_path}: {entry['start']} to {entry['end']}")
+                entry['checked'] = last_expected_session(today).strftime('%Y-%m-%d')
+                manifest[ticker] = entry
+                save_manifest(manifest, manifest_path)
+                checkpoint['completed'].append(ticker)
+            except QuotaExceeded as e:
+                print(f"{e}. Run again later to resume.")
+                failed[ticker] = str(e)
+                unfinished.add(ticker)
+                while not queue.empty():
+                    skipped = queue.get_nowait()[0]
+                    failed[skipped] = str(e)
+                    unfinished.add(skipped)
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                print(f"Error fetching data for {ticker}, will retry on the next run: {e}")
+                failed[ticker] = str(e)
+                unfinished.add(ticker)
+            except Exception as e:
+                print(f"Error fetching data for {ticker}: {e}")
+                failed[ticker] = str(e)
+            checkpoint['requests'] = limiter.history()
+            save_checkpoint(checkpoint, checkpoint_path)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+
+    # A run that got through every ticker, even if some failed for good,
+    # starts from scratch next time; the request log is kept so the daily
+    # quota carries over.
+    if not unfinished:
+        checkpoint['completed'] = []
+        save_checkpoint(checkpoint, checkpoint_path)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fetch daily stock data from Alpha Vantage.')
+    parser.add_argument('tickers', nargs='*', default=['TTM', 'TSLA', 'JNJ', 'WMT'])
+    parser.add_argument('--output-size', choices=['auto', 'compact', 'full'], default='auto',
+                        help="'auto' fetches only the missing date range of each ticker")
+    parser.add_argument('--url', default=base_url, help='API endpoint, e.g. a local stub server')
+    parser.add_argument('--concurrency', type=int, default=max_concurrency)
+    parser.add_argument('--per-minute', type=int, default=max_requests_per_minute)
+    parser.add_argument('--per-day', type=int, default=max_requests_per_day)
+    parser.add_argument('--fresh', action='store_true', help='ignore the checkpoint of an interrupted run')
+    args = parser.parse_args()
+
+    key_job = os.getenv('key_job')
+    if not key_job:
+        raise ValueError('Please set the key_job environment variable')
+
+    if args.fresh and os.path.exists(checkpoint_file):
+        checkpoint = load_checkpoint()
+        checkpoint['completed'] = []
+        save_checkpoint(checkpoint)
+
+    asyncio.run(rate_limited_fetch(key_job, args.tickers, args.output_size, args.url,
+                                   concurrency=args.concurrency, per_minute=args.per_minute,
+                                   per_day=args.per_day))
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+
+panel_fields = ['open', 'high', 'low', 'close', 'volume']
+feature_columns = ['daily_pct_change', 'cumulative_return', '20_day_moving_avg', 'rolling_volatility',
+                   'mean_price', 'median_price', 'std_price', 'var_price']
+
+
+# Rolling windows are summed over blocks of this many days. Within a block the
+# prices are shifted by the block's own mean, so the prefix sums stay small
+# however long and high-priced the history is.
+block_days = 4096
+
+
+# Rolling mean and sample std of `values` (tickers, days) into `mean` and
+# `std`, like pandas' rolling(window) with its default min_periods: a window
+# with any NaN gives NaN, and the windows after it are unaffected.
+def rolling_mean_std(values, window, mean, std):
+    tickers, days = values.shape
+    mean[:, :window - 1] = np.nan
+    std[:, :window - 1] = np.nan
+    for start in range(window - 1, days, block_days):
+        end = min(start + block_days, days)
+        block = values[:, start - window + 1:end]
+        valid = ~np.isnan(block)
+        count = valid.sum(axis=1, keepdims=True)
+        offset = np.divide(np.where(valid, block, 0).sum(axis=1, keepdims=True), count,
+                           out=np.zeros((tickers, 1)), where=count > 0)
+        shifted = np.where(valid, block - offset, 0)
+        sums = np.zeros((tickers, block.shape[1] + 1))
+        squares = np.zeros((tickers, block.shape[1] + 1))
+        counts = np.zeros((tickers, block.shape[1] + 1), dtype='int64')
+        np.cumsum(shifted, axis=1, out=sums[:, 1:])
+        np.cumsum(shifted * shifted, axis=1, out=squares[:, 1:])
+        np.cumsum(valid, axis=1, out=counts[:, 1:])
+        window_sum = sums[:, window:] - sums[:, :-window]
+        window_squares = squares[:, window:] - squares[:, :-window]
+        full = counts[:, window:] - counts[:, :-window] == window
+        variance = np.maximum((window_squares - window_sum * window_sum / window) / (window - 1), 0)
+        mean[:, start:end] = np.where(full, window_sum / window + offset, np.nan)
+        std[:, start:end] = np.where(full, np.sqrt(variance), np.nan)
+
+
+# Mean, median, sample std and variance across the OHLC fields into
+# out[..., 0:4], skipping NaN like pandas' row-wise statistics.
+def ohlc_stats(ohlc, out):
+    missing = np.isnan(ohlc)
+    if not missing.any():
+        np.mean(ohlc, axis=2, out=out[:, :, 0])
+        ordered = np.sort(ohlc, axis=2)
+        np.add(ordered[:, :, 1], ordered[:, :, 2], out=out[:, :, 1])
+        out[:, :, 1] /= 2
+        np.var(ohlc, axis=2, ddof=1, out=out[:, :, 3])
+        np.sqrt(out[:, :, 3], out=out[:, :, 2])
+        return
+    count = (~missing).sum(axis=2)
+    mean = np.divide(np.where(missing, 0, ohlc).sum(axis=2), count, out=np.full(count.shape, np.nan),
+                     where=count > 0)
+    # NaN sorts last, so the valid values are the first `count` of each row.
+    ordered = np.sort(ohlc, axis=2)
+    low = np.take_along_axis(ordered, np.maximum(count - 1, 0)[..., None] // 2, axis=2)[..., 0]
+    high = np.take_along_axis(ordered, (count // 2)[..., None].clip(max=ohlc.shape[2] - 1), axis=2)[..., 0]
+    deviations = np.where(missing, 0, ohlc - mean[..., None])
+    variance = np.divide((deviations * deviations).sum(axis=2), count - 1, out=np.full(count.shape, np.nan),
+                         where=count > 1)
+    out[:, :, 0] = mean
+    out[:, :, 1] = np.where(count > 0, (low + high) / 2, np.nan)
+    out[:, :, 2] = np.sqrt(variance)
+    out[:, :, 3] = variance
+
+
+# panel is a (tickers, days, len(panel_fields)) float64 array in chronological
+# order. Shorter histories are left-aligned and padded with NaN at the end; the
+# padded positions of the output are meaningless and should be dropped. Gaps
+# are handled as in clean_data.add_features: NaN prices give NaN returns, the
+# cumulative return skips them, and a NaN only affects the rolling windows
+# that contain it.
+def compute_panel_features(panel, window=20, out=None):
+    tickers, days, _ = panel.shape
+    if out is None:
+        out = np.empty((tickers, days, len(feature_columns)))
+    close = panel[:, :, 3]
+
+    pct = out[:, :, 0]
+    pct[:, 0] = np.nan
+    np.divide(close[:, 1:], close[:, :-1], out=pct[:, 1:])
+    pct[:, 1:] -= 1
+
+    cumulative = out[:, :, 1]
+    cumulative[:, 0] = np.nan
+    growth = pct[:, 1:] + 1
+    gaps = np.isnan(growth)
+    growth[gaps] = 1
+    np.cumprod(growth, axis=1, out=cumulative[:, 1:])
+    cumulative[:, 1:][gaps] = np.nan
+
+    rolling_mean_std(close, window, out[:, :, 2], out[:, :, 3])
+    ohlc_stats(panel[:, :, :4], out[:, :, 4:8])
+    return out
+
+
+def stack_panel(frames):
+    days = max(len(df) for df in frames)
+    panel = np.full((len(frames), days, len(panel_fields)), np.nan)
+    for i, df in enumerate(frames):
+        for j, field in enumerate(panel_fields):
+            panel[i, :len(df), j] = df[field].to_numpy()
+    return panel
+
+
+# Batched engine: one kernel pass for every frame, returned as new frames with
+# the same columns clean_data.add_features produces.
+def add_panel_features(frames, window=20):
+    features = compute_panel_features(stack_panel(frames), window)
+    return [pd.concat([df, pd.DataFrame(features[i, :len(df)], columns=feature_columns, index=df.index)], axis=1)
+            for i, df in enumerate(frames)]
+
+
+# Single-frame engine, in place like clean_data.add_features.
+def add_features(df, window=20):
+    features = compute_panel_features(stack_panel([df]), window)[0]
+    for j, col in enumerate(feature_columns):
+        df[col] = features[:, j]
+    return df
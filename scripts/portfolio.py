@@ -0,0 +1,332 @@
+import threading
+import numpy as np
+import pandas as pd
+from storage import load_since
+
+
+columns = ['timestamp', 'daily_pct_change', 'cumulative_return']
+# Rolling statistics cover the last `window` rows of the panel; a ticker needs
+# `min_bars` returns inside it to get a volatility or correlations.
+window = 60
+min_bars = 20
+periods_per_year = 252
+
+
+def same_value(a, b):
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+# Gram matrix, column sums and counts of a block of returns, with missing
+# returns counted as zero. `signs` (+1/-1 per row) lets one product add some
+# rows and subtract others.
+def window_sums(block, signs=None):
+    valid = ~np.isnan(block)
+    filled = np.where(valid, block, 0.0)
+    if signs is None:
+        return filled.T @ filled, filled.sum(axis=0), valid.sum(axis=0)
+    return filled.T @ (filled * signs[:, None]), signs @ filled, signs.astype('int64') @ valid
+
+
+# Equal-weight return of the tickers with a return on each row, rebalanced
+# every bar. A row where no ticker has one is flat.
+def row_means(block):
+    valid = ~np.isnan(block)
+    counts = valid.sum(axis=1)
+    totals = np.where(valid, block, 0.0).sum(axis=1)
+    return np.divide(totals, counts, out=np.zeros(len(block)), where=counts > 0)
+
+
+# Cross-ticker analytics over an aligned returns panel: one row per timestamp
+# of any ticker, one column per ticker, NaN where a ticker has no return.
+#
+# update() re-checks every ticker's data version. Changed tickers are re-read,
+# in one batch, from their last known bar on. When that bar's cumulative return (a product over
+# the whole history before it) is unchanged, only the rows after it are new;
+# if every ticker's new rows come after the panel's last row, they are
+# appended, updating the window sums and the equity curve instead of
+# recomputing them. Anything else rebuilds the panel, re-reading only the
+# tickers whose history changed.
+#
+# The rolling covariance is kept as sums over the window, with missing returns
+# counted as zero: the Gram matrix of the returns, their column sums and each
+# ticker's number of returns. Appended rows add their outer products and the
+# rows leaving the window subtract theirs; the sums are recomputed from the
+# window every `window` appended rows so that rounding does not accumulate.
+class PortfolioAnalytics:
+    def __init__(self, reader=load_since, window=window, min_bars=min_bars):
+        self.reader = reader
+        self.window = window
+        self.min_bars = min_bars
+        self.versions = {}
+        self.last = {}
+        self.tickers = []
+        self.index = {}
+        self.rows = 0
+        self.days = np.empty(0, dtype='int64')
+        self.returns = np.empty((0, 0))
+        self.present = np.empty((0, 0), dtype=bool)
+        self.portfolio_returns = np.empty(0)
+        self.equity = np.empty(0)
+        self.gram = np.empty((0, 0))
+        self.sums = np.empty(0)
+        self.counts = np.empty(0, dtype='int64')
+        self.appended = 0
+        self.revision = 0
+        self.builds = 0
+        self.appends = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    # Timestamps (ns), returns and cumulative returns of each ticker in
+    # `starts` from its start on. Tickers without bars there are left out.
+    def read(self, starts):
+        if not starts:
+            return {}
+        self.reads += len(starts)
+        df = self.reader(starts, columns)
+        if df.empty:
+            return {}
+        tickers = df['ticker'].to_numpy()
+        timestamps = df['timestamp'].to_numpy().astype('datetime64[ns]').astype('int64')
+        returns = df['daily_pct_change'].to_numpy(dtype='float64')
+        cumulative = df['cumulative_return'].to_numpy(dtype='float64')
+        # Rows come grouped by ticker.
+        bounds = np.concatenate([[0], np.flatnonzero(tickers[1:] != tickers[:-1]) + 1, [len(df)]])
+        return {tickers[lo]: (timestamps[lo:hi], returns[lo:hi], cumulative[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])}
+
+    # Brings the panel up to date with `tickers` at the versions `versioner`
+    # gives, and returns the revision, which changes with every update.
+    def update(self, tickers, versioner):
+        with self.lock:
+            versions = {}
+            for ticker in tickers:
+                version = versioner(ticker)
+                if version is not None:
+                    versions[ticker] = version
+            changed = [ticker for ticker in versions if versions[ticker] != self.versions.get(ticker)]
+            removed = set(self.versions) - set(versions)
+            if not changed and not removed:
+                return self.revision
+
+            since_last = self.read({ticker: pd.Timestamp(self.last[ticker][0]) for ticker in changed if ticker in self.last})
+            tails = {}
+            for ticker, tail in since_last.items():
+                last_ts, last_cumulative = self.last[ticker]
+                if tail[0][0] == last_ts and same_value(tail[2][0], last_cumulative):
+                    tails[ticker] = tuple(values[1:] for values in tail)
+            full = self.read({ticker: None for ticker in changed if ticker not in tails})
+            dropped = removed | (set(changed) - set(tails) - set(full))
+            for ticker in dropped:
+                self.last.pop(ticker, None)
+            for ticker, data in list(tails.items()) + list(full.items()):
+                if len(data[0]):
+                    self.last[ticker] = (data[0][-1], data[2][-1])
+            self.versions = versions
+
+            last_day = self.days[self.rows - 1] if self.rows else None
+            if (not dropped and not full and last_day is not None
+                    and all(not len(tail[0]) or tail[0][0] > last_day for tail in tails.values())):
+                self.append(tails)
+            else:
+                self.rebuild([ticker for ticker in versions if ticker in self.last], tails, full)
+            self.revision += 1
+            return self.revision
+
+    def allocate(self, rows, tickers):
+        self.days = np.empty(rows, dtype='int64')
+        self.returns = np.full((rows, tickers), np.nan)
+        self.present = np.zeros((rows, tickers), dtype=bool)
+        self.portfolio_returns = np.empty(rows)
+        self.equity = np.empty(rows)
+
+    # Grows the row capacity by a quarter at a time, so appending a row does
+    # not copy the panel.
+    def reserve(self, rows):
+        if rows <= len(self.days):
+            return
+        days, returns, present = self.days, self.returns, self.present
+        portfolio_returns, equity = self.portfolio_returns, self.equity
+        self.allocate(rows + rows // 4 + self.window, len(self.tickers))
+        self.days[:self.rows] = days[:self.rows]
+        self.returns[:self.rows] = returns[:self.rows]
+        self.present[:self.rows] = present[:self.rows]
+        self.portfolio_returns[:self.rows] = portfolio_returns[:self.rows]
+        self.equity[:self.rows] = equity[:self.rows]
+
+    def rebuild(self, tickers, tails, full):
+        timestamps, returns = [], []
+        for ticker in tickers:
+            if ticker in full:
+                ticker_timestamps, ticker_returns = full[ticker][:2]
+            else:
+                j = self.index[ticker]
+                rows = self.present[:self.rows, j]
+                ticker_timestamps = self.days[:self.rows][rows]
+                ticker_returns = self.returns[:self.rows, j][rows]
+                if ticker in tails:
+                    ticker_timestamps = np.concatenate([ticker_timestamps, tails[ticker][0]])
+                    ticker_returns = np.concatenate([ticker_returns, tails[ticker][1]])
+            timestamps.append(ticker_timestamps)
+            returns.append(ticker_returns)
+
+        self.tickers = list(tickers)
+        self.index = {ticker: j for j, ticker in enumerate(self.tickers)}
+        all_timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype='int64')
+        days = np.unique(all_timestamps)
+        self.rows = len(days)
+        self.allocate(self.rows + self.window, len(self.tickers))
+        self.days[:self.rows] = days
+        positions = np.searchsorted(days, all_timestamps)
+        columns = np.repeat(np.arange(len(self.tickers)), [len(t) for t in timestamps])
+        self.returns[positions, columns] = np.concatenate(returns) if returns else np.empty(0)
+        self.present[positions, columns] = True
+
+        panel = self.returns[:self.rows]
+        self.portfolio_returns[:self.rows] = row_means(panel)
+        self.equity[:self.rows] = np.cumprod(1.0 + self.portfolio_returns[:self.rows])
+        self.recompute_window()
+        self.builds += 1
+
+    def append(self, tails):
+        days = np.unique(np.concatenate([tail[0] for tail in tails.values()]))
+        start, added = self.rows, len(days)
+        if not added:
+            return
+        self.reserve(start + added)
+        self.days[start:start + added] = days
+        for ticker, (timestamps, returns, _) in tails.items():
+            if len(timestamps):
+                j = self.index[ticker]
+                positions = start + np.searchsorted(days, timestamps)
+                self.returns[positions, j] = returns
+                self.present[positions, j] = True
+        self.rows += added
+
+        block = self.returns[start:self.rows]
+        self.portfolio_returns[start:self.rows] = row_means(block)
+        previous = self.equity[start - 1] if start else 1.0
+        self.equity[start:self.rows] = previous * np.cumprod(1.0 + self.portfolio_returns[start:self.rows])
+
+        self.appended += added
+        if self.appended >= self.window:
+            self.recompute_window()
+        else:
+            # The rows entering the window are added and those leaving it
+            # subtracted in one product.
+            leaving = np.arange(max(0, start - self.window), max(0, self.rows - self.window))
+            entering = np.arange(start, self.rows)
+            signs = np.concatenate([np.ones(len(entering)), -np.ones(len(leaving))])
+            gram, sums, counts = window_sums(self.returns[np.concatenate([entering, leaving])], signs)
+            self.gram += gram
+            self.sums += sums
+            self.counts += counts
+        self.appends += 1
+
+    def recompute_window(self):
+        self.gram, self.sums, self.counts = window_sums(self.returns[max(0, self.rows - self.window):self.rows])
+        self.appended = 0
+
+    def window_rows(self):
+        return min(self.rows, self.window)
+
+    # Covariances of the tickers at `positions` with those at `others` over
+    # the window, NaN for tickers with fewer than min_bars returns in it.
+    def covariances(self, positions, others):
+        n = self.window_rows()
+        if n < 2:
+            return np.full((len(positions), len(others)), np.nan)
+        cov = (self.gram[np.ix_(positions, others)] - np.outer(self.sums[positions], self.sums[others]) / n) / (n - 1)
+        cov[self.counts[positions] < self.min_bars, :] = np.nan
+        cov[:, self.counts[others] < self.min_bars] = np.nan
+        return cov
+
+    def deviations(self, positions):
+        n = self.window_rows()
+        if n < 2:
+            return np.full(len(positions), np.nan)
+        variance = (self.gram[positions, positions] - self.sums[positions] ** 2 / n) / (n - 1)
+        deviation = np.sqrt(np.clip(variance, 0.0, None))
+        deviation[(self.counts[positions] < self.min_bars) | (deviation == 0)] = np.nan
+        return deviation
+
+    def positions(self, tickers):
+        return np.arange(len(self.tickers)) if tickers is None else np.array([self.index[t] for t in tickers], dtype='int64')
+
+    def covariance(self, tickers=None):
+        with self.lock:
+            positions = self.positions(tickers)
+            labels = [self.tickers[j] for j in positions]
+            return pd.DataFrame(self.covariances(positions, positions), index=labels, columns=labels)
+
+    def correlation(self, tickers=None):
+        with self.lock:
+            positions = self.positions(tickers)
+            labels = [self.tickers[j] for j in positions]
+            deviation = self.deviations(positions)
+            corr = np.clip(self.covariances(positions, positions) / np.outer(deviation, deviation), -1.0, 1.0)
+            return pd.DataFrame(corr, index=labels, columns=labels)
+
+    # Correlations of `ticker` with every other ticker over the window, highest
+    # first.
+    def correlations_with(self, ticker):
+        with self.lock:
+            everyone = np.arange(len(self.tickers))
+            j = self.index[ticker]
+            deviation = self.deviations(everyone)
+            corr = np.clip(self.covariances(np.array([j]), everyone)[0] / (deviation[j] * deviation), -1.0, 1.0)
+            corr = pd.Series(corr, index=self.tickers, name='correlation').drop(ticker)
+            return corr.dropna().sort_values(ascending=False)
+
+    # Cumulative return at the last bar (the pipeline's cumulative_return) and
+    # annualized volatility over the window of every ticker, best cumulative
+    # return first. Ranks are 1 for the highest return and the highest
+    # volatility.
+    def rankings(self):
+        with self.lock:
+            everyone = np.arange(len(self.tickers))
+            df = pd.DataFrame({
+                'ticker': self.tickers,
+                'cumulative_return': np.array([self.last[ticker][1] for ticker in self.tickers], dtype='float64'),
+                'volatility': self.deviations(everyone) * np.sqrt(periods_per_year),
+            })
+        df['return_rank'] = df['cumulative_return'].rank(ascending=False, method='min').astype('int64')
+        df['volatility_rank'] = df['volatility'].rank(ascending=False, method='min').astype('Int64')
+        return df.sort_values(['return_rank', 'ticker']).reset_index(drop=True)
+
+    def equity_curve(self):
+        with self.lock:
+            return pd.DataFrame({
+                'timestamp': self.days[:self.rows].astype('datetime64[ns]'),
+                'portfolio_return': self.portfolio_returns[:self.rows].copy(),
+                'equity': self.equity[:self.rows].copy(),
+            })
+
+    # Correlation of `ticker` with the equal-weight portfolio over a window
+    # ending at each row, from running sums.
+    def rolling_correlation(self, ticker):
+        with self.lock:
+            n, rows = self.window, self.rows
+            if rows < n:
+                return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'correlation': pd.Series(dtype='float64')})
+            x = self.returns[:rows, self.index[ticker]]
+            valid = ~np.isnan(x)
+            x = np.where(valid, x, 0.0)
+            p = self.portfolio_returns[:rows]
+            timestamps = self.days[n - 1:rows].astype('datetime64[ns]')
+
+        def rolling(values):
+            running = np.concatenate([[0.0], np.cumsum(values)])
+            return running[n:] - running[:-n]
+
+        sx, sp = rolling(x), rolling(p)
+        cov = rolling(x * p) - sx * sp / n
+        var_x = np.clip(rolling(x * x) - sx * sx / n, 0.0, None)
+        var_p = np.clip(rolling(p * p) - sp * sp / n, 0.0, None)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.clip(cov / np.sqrt(var_x * var_p), -1.0, 1.0)
+        corr[rolling(valid.astype('float64')) < self.min_bars] = np.nan
+        return pd.DataFrame({'timestamp': timestamps, 'correlation': corr})
+
+    def stats(self):
+        return {'tickers': len(self.tickers), 'rows': self.rows, 'revision': self.revision,
+                'builds': self.builds, 'appends': self.appends, 'reads': self.reads}
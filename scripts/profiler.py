@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+profile_path = 'profiles'
+profile_file = os.path.join(profile_path, 'stages.jsonl')
+
+_active = []
+
+
+# Records wall time, CPU time, rows/sec and, with trace_memory, the tracemalloc
+# peak of each stage. Stages nest: a stage opened inside another is named
+# '<outer>.<inner>' and its memory peak also counts towards the outer one.
+class StageProfiler:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.stack = []
+        self.started_tracing = False
+
+    def __enter__(self):
+        _active.append(self)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        _active.remove(self)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': f"{self.stack[-1]['stage']}.{name}" if self.stack else name, 'rows': rows}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]['max_memory'] = max(self.stack[-1]['max_memory'], peak)
+            tracemalloc.reset_peak()
+            record['start_memory'] = record['max_memory'] = current
+        self.stack.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            self.stack.pop()
+            record['peak_memory'] = None
+            if tracing:
+                record['max_memory'] = max(record['max_memory'], tracemalloc.get_traced_memory()[1])
+                record['peak_memory'] = record['max_memory'] - record['start_memory']
+                if self.stack:
+                    self.stack[-1]['max_memory'] = max(self.stack[-1]['max_memory'], record['max_memory'])
+                del record['start_memory'], record['max_memory']
+            rows = record['rows']
+            record['rows_per_sec'] = rows / record['wall'] if rows and record['wall'] > 0 else None
+            self.records.append(record)
+
+    # Total wall time of the given top-level stages, over the records from
+    # index `since` on.
+    def wall(self, *names, since=0):
+        return sum(r['wall'] for r in self.records[since:] if r['stage'] in names)
+
+
+# One record per stage name, in order of first appearance: wall, CPU and rows
+# are summed and the memory peak is the largest. Used for stages entered once
+# per chunk.
+def combine_records(records):
+    combined = {}
+    for record in records:
+        total = combined.get(record['stage'])
+        if total is None:
+            combined[record['stage']] = dict(record)
+            continue
+        total['wall'] += record['wall']
+        total['cpu'] += record['cpu']
+        if record['rows'] is not None:
+            total['rows'] = (total['rows'] or 0) + record['rows']
+        if record['peak_memory'] is not None:
+            total['peak_memory'] = max(total['peak_memory'] or 0, record['peak_memory'])
+    for total in combined.values():
+        total['rows_per_sec'] = total['rows'] / total['wall'] if total['rows'] and total['wall'] > 0 else None
+    return list(combined.values())
+
+
+def active_profiler():
+    return _active[-1] if _active else None
+
+
+# The active profiler, or a new one for the duration of the block.
+@contextmanager
+def profiling(trace_memory=False):
+    if _active:
+        yield _active[-1]
+    else:
+        with StageProfiler(trace_memory) as profiler:
+            yield profiler
+
+
+# Runs the decorated function under profiling(), so it can read its own stage
+# timings from active_profiler().
+def with_profiler(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with profiling():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# Times a block into the active profiler; outside of one it is measured and
+# dropped.
+@contextmanager
+def stage(name, rows=None):
+    with (active_profiler() or StageProfiler()).stage(name, rows) as record:
+        yield record
+
+
+# Decorator form of stage(); `rows` maps the call's result to its row count.
+def profiled(name, rows=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record['rows'] = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def _proc_status_mb(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# Peak resident set size of the process in MB. On Linux the peak can be reset
+# through /proc/self/clear_refs, which gives per-ticker peaks inside a worker;
+# elsewhere it is the peak since the process started.
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    peak = _proc_status_mb('VmHWM:')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    return _proc_status_mb('VmRSS:')
+
+
+def run_id():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+# Appends one JSON line per stage record, tagged with `fields` (run id,
+# ticker, ...).
+def write_records(records, path=profile_file, **fields):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(''.join(json.dumps({**fields, **record}) + '\n' for record in records))
+
+
+def read_records(path=profile_file):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,25 @@
+import os
+import hmac
+
+
+# The refresh endpoints of the API and the dashboard drop server caches, so
+# an open one lets anyone who can reach the port force cold rebuilds. Their
+# caller is scheduler.py: with a shared token in the refresh_token environment
+# variable it must be sent in the X-Refresh-Token header, and without one only
+# callers on the loopback interface are accepted.
+token_variable = 'refresh_token'
+token_header = 'X-Refresh-Token'
+loopback_addresses = {'127.0.0.1', '::1'}
+
+
+def refresh_allowed(request):
+    token = os.getenv(token_variable)
+    if token:
+        return hmac.compare_digest(request.headers.get(token_header, '').encode(), token.encode())
+    return request.remote_addr in loopback_addresses
+
+
+# Headers scheduler.py sends with its refresh requests.
+def token_headers():
+    token = os.getenv(token_variable)
+    return {token_header: token} if token else {}
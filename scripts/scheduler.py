@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import clean_data
+import batch_model
+import storage
+import feature_store
+import timeseries_db
+from feature_store import load_summary_index, write_summary_index
+from profiler import StageProfiler, profile_path, run_id, write_records
+from refresh_auth import token_headers
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+record_file = os.path.join(clean_data.state_path, 'pipeline.json')
+run_log_file = os.path.join(profile_path, 'runs.jsonl')
+metrics_file = 'metrics.json'
+hash_block = 1024 * 1024
+
+# Sources whose code decides each stage's output: editing one makes the stage
+# stale for every ticker.
+stage_code = {
+    'clean': ['clean_data.py', 'panel_kernel.py', 'csv_blocks.py', 'feature_store.py', 'timeseries_db.py', 'profiler.py'],
+    'model': ['clean_data.py'],
+    'batch_model': ['batch_model.py'],
+}
+# Options that change what the clean stage writes (--stream and --incremental
+# do not: they produce the same output).
+clean_options = ['engine', 'low_memory']
+model_columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume', '20_day_moving_avg', 'rolling_volatility']
+
+# The API and the dashboard drop the caches of the tickers a run rewrote.
+notify_urls = ['http://127.0.0.1:5000/api/cache/refresh', 'http://127.0.0.1:8050/refresh']
+notify_timeout = 2
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(hash_block), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def combined_hash(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+# Size, mtime and content hash of `path` (None when it does not exist). The
+# content is only re-read when the size or mtime differ from `known`.
+def fingerprint(path, known=None):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': file_hash(path)}
+
+
+def code_hashes():
+    return {name: combined_hash([file_hash(os.path.join(script_dir, f)) for f in files])
+            for name, files in stage_code.items()}
+
+
+def load_records(path=record_file):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_records(records, path=record_file):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(records, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def cleaned_file(stock_name):
+    return os.path.join(clean_data.output_path, f'cleaned_{stock_name}{clean_data.file_suffix}')
+
+
+def model_file(stock_name):
+    return os.path.join(clean_data.model_path, f'{stock_name}_stock_price_predictor.pkl')
+
+
+# Version stamps of the clean stage's outputs besides the cleaned CSV: the
+# ticker's bars in the database and its feature-store partitions (None when
+# missing). Both change whenever they are written.
+def store_versions(stock_name):
+    versions = {'database': timeseries_db.data_version(stock_name), 'feature store': None}
+    if os.path.isdir(feature_store.ticker_dir(stock_name)):
+        versions['feature store'] = feature_store.data_version(stock_name)
+    return {name: None if version is None else version[0] for name, version in versions.items()}
+
+
+# Why the clean stage whose last run is `record` must run again for its stores,
+# or None. Records from before the stores were tracked are only checked for
+# missing stores.
+def stores_reason(record, versions):
+    for name, version in versions.items():
+        if version is None:
+            return f'{name} missing'
+        if 'stores' in record and record['stores'].get(name) != version:
+            return f'{name} modified'
+    return None
+
+
+# Why a stage whose last run is `record` must run again, or None when it is
+# up to date: its inputs changed (named after the first input that differs) or
+# its output is missing or was modified since.
+def stale_reason(record, inputs, output_path):
+    if record is None:
+        return 'no previous run'
+    changed = [name for name in inputs if record['inputs'].get(name) != inputs[name]]
+    if changed:
+        return f'{changed[0]} changed'
+    output = fingerprint(output_path, record['output'])
+    if output is None:
+        return 'output missing'
+    if output['hash'] != record['output']['hash']:
+        return 'output modified'
+    return None
+
+
+# Runs in a worker process.
+def clean_stage(stock_name, file, options):
+    _, _, metrics, summary = clean_data.process_chunk(
+        [(stock_name, file)], options['incremental'], options['timeout'], options['engine'], train=False,
+        low_memory=options['low_memory'], stream_chunk_mb=options['stream_chunk_mb'])[0]
+    return metrics, summary
+
+
+# Runs in a worker process: refits one ticker's model on its stored features.
+def model_stage(stock_name):
+    with StageProfiler() as profiler:
+        mse = clean_data.train_predictive_model(storage.load_features(stock_name, model_columns), stock_name)
+    return mse, profiler.records
+
+
+class Scheduler:
+    def __init__(self, files, options, workers=None, force=False, batch_train=False):
+        self.files = files
+        self.options = options
+        self.workers = workers
+        self.force = force
+        self.batch_train = batch_train
+        self.records = load_records()
+        self.code = code_hashes()
+        self.run = run_id()
+        self.log = []
+        self.changed = set()
+        self.metrics = {}
+        self.summaries = {}
+        self.failed = set()
+
+    def note(self, stock_name, stage, action, reason, seconds=None):
+        entry = {'ticker': stock_name, 'stage': stage, 'action': action, 'reason': reason}
+        if seconds is not None:
+            entry['seconds'] = round(seconds, 3)
+        self.log.append(entry)
+        print(f"{stock_name} {stage}: {action} ({reason})")
+
+    def clean_inputs(self, stock_name):
+        raw = fingerprint(os.path.join(clean_data.input_path, self.files[stock_name]),
+                          self.records.get(stock_name, {}).get('raw'))
+        self.records.setdefault(stock_name, {})['raw'] = raw
+        return {'raw data': raw['hash'], 'clean code': self.code['clean'],
+                'options': combined_hash({k: self.options[k] for k in clean_options})}
+
+    def model_inputs(self, stock_name):
+        return {'cleaned data': self.records[stock_name]['clean']['output']['hash'], 'model code': self.code['model']}
+
+    def plan_clean(self, stock_name, inputs):
+        record = self.records[stock_name].get('clean')
+        reason = stale_reason(record, inputs, cleaned_file(stock_name))
+        if reason is None:
+            reason = stores_reason(record, store_versions(stock_name))
+        return 'forced' if self.force else reason
+
+    def plan_model(self, stock_name):
+        if self.batch_train:
+            return None
+        if stock_name in self.failed:
+            self.note(stock_name, 'model', 'skipped', 'clean failed')
+            return None
+        record = self.records[stock_name]
+        reason = stale_reason(record.get('model'), self.model_inputs(stock_name), model_file(stock_name))
+        if self.force:
+            reason = 'forced'
+        if reason is None:
+            self.note(stock_name, 'model', 'skipped', 'cleaned data unchanged')
+        return reason
+
+    def finish_clean(self, stock_name, inputs, result, seconds):
+        metrics, summary = result
+        self.metrics[self.files[stock_name]] = metrics
+        write_records(metrics.get('stages', []), run=self.run, ticker=stock_name,
+                      incremental=self.options['incremental'])
+        if metrics.get('processing_status') == 'Failed':
+            self.failed.add(stock_name)
+            self.note(stock_name, 'clean', 'failed', metrics.get('error_message'), seconds)
+            return False
+        output = fingerprint(cleaned_file(stock_name))
+        previous = self.records[stock_name].get('clean')
+        self.records[stock_name]['clean'] = {'inputs': inputs, 'output': output, 'stores': store_versions(stock_name)}
+        self.summaries[stock_name] = summary
+        if previous is None or previous['output']['hash'] != output['hash']:
+            self.changed.add(stock_name)
+        return True
+
+    def finish_model(self, stock_name, inputs, result):
+        mse, records = result
+        write_records(records, run=self.run, ticker=stock_name)
+        self.metrics.setdefault(self.files[stock_name], {})['model_mse'] = mse
+        self.records[stock_name]['model'] = {'inputs': inputs, 'output': fingerprint(model_file(stock_name))}
+        self.changed.add(stock_name)
+
+    # Each ticker's model is submitted as soon as its clean stage is done (or
+    # found up to date), so independent tickers never wait on each other. A
+    # rerun whose cleaned output hashes the same as before leaves the model
+    # alone.
+    def execute(self):
+        pending = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            def submit(stock_name, stage, inputs, reason, fn, *args):
+                pending[executor.submit(fn, *args)] = (stock_name, stage, inputs, reason, time.perf_counter())
+
+            def schedule_model(stock_name):
+                reason = self.plan_model(stock_name)
+                if reason is not None:
+                    submit(stock_name, 'model', self.model_inputs(stock_name), reason, model_stage, stock_name)
+
+            for stock_name, file in sorted(self.files.items()):
+                inputs = self.clean_inputs(stock_name)
+                reason = self.plan_clean(stock_name, inputs)
+                if reason is None:
+                    self.note(stock_name, 'clean', 'skipped', 'raw data unchanged')
+                    schedule_model(stock_name)
+                else:
+                    submit(stock_name, 'clean', inputs, reason, clean_stage, stock_name, file, self.options)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stock_name, stage, inputs, reason, started = pending.pop(future)
+                    seconds = time.perf_counter() - started
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.failed.add(stock_name)
+                        self.note(stock_name, stage, 'failed', str(e) or type(e).__name__, seconds)
+                        continue
+                    if stage == 'clean':
+                        if self.finish_clean(stock_name, inputs, result, seconds):
+                            self.note(stock_name, 'clean', 'ran', reason, seconds)
+                            schedule_model(stock_name)
+                    else:
+                        self.finish_model(stock_name, inputs, result)
+                        self.note(stock_name, 'model', 'ran', reason, seconds)
+                    save_records(self.records)
+
+    # The batched fit covers every ticker, so it reruns when any ticker's
+    # cleaned data changed.
+    def run_batch_model(self):
+        cleaned = {s: r['clean']['output']['hash'] for s, r in self.records.items() if s in self.files and 'clean' in r}
+        inputs = {'cleaned data': combined_hash(cleaned), 'model code': self.code['batch_model']}
+        record = self.records.get('_batch')
+        reason = 'forced' if self.force else stale_reason(record, inputs, batch_model.model_index_file)
+        if reason is None:
+            self.note('*', 'batch_model', 'skipped', 'cleaned data unchanged')
+            return
+        started = time.perf_counter()
+        models = batch_model.train_all(sorted(self.files))
+        for stock_name, file in self.files.items():
+            if stock_name in models:
+                self.metrics.setdefault(file, {})['model_mse'] = models[stock_name]['mse']
+        self.records['_batch'] = {'inputs': inputs, 'output': fingerprint(batch_model.model_index_file)}
+        self.changed.update(models)
+        self.note('*', 'batch_model', 'ran', reason, time.perf_counter() - started)
+
+    # Tickers whose raw file is gone are dropped from the records and the
+    # summary index, as a full clean_data.py run would.
+    def remove_missing(self):
+        for stock_name in [s for s in self.records if s != '_batch' and s not in self.files]:
+            del self.records[stock_name]
+            self.changed.add(stock_name)
+            self.note(stock_name, 'clean', 'removed', 'raw file deleted')
+
+    # Skipped tickers keep their previous entries in metrics.json and the
+    # summary index.
+    def write_outputs(self):
+        metrics = {}
+        if os.path.exists(metrics_file):
+            with open(metrics_file, 'r') as f:
+                metrics = json.load(f)
+        metrics = {file: m for file, m in metrics.items() if file in self.files.values()}
+        for file, file_metrics in self.metrics.items():
+            metrics[file] = {**metrics.get(file, {}), **file_metrics}
+        with open(metrics_file, 'w') as f:
+            json.dump(metrics, f)
+        summary_index = {k: v for k, v in load_summary_index().items() if k in self.files}
+        summary_index.update(self.summaries)
+        write_summary_index(summary_index)
+
+    def notify(self, urls):
+        if not self.changed:
+            return
+        body = json.dumps({'tickers': sorted(self.changed)}).encode()
+        for url in urls:
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json',
+                                                                      **token_headers()})
+            try:
+                with urllib.request.urlopen(request, timeout=notify_timeout) as response:
+                    print(f"Notified {url}: {json.loads(response.read())}")
+            except (urllib.error.URLError, OSError) as e:
+                print(f"Could not notify {url} ({getattr(e, 'reason', e)})")
+
+    def run_all(self, urls):
+        os.makedirs(clean_data.model_path, exist_ok=True)
+        self.remove_missing()
+        self.execute()
+        if self.batch_train:
+            self.run_batch_model()
+        save_records(self.records)
+        self.write_outputs()
+        write_records(self.log, path=run_log_file, run=self.run)
+        ran = sum(entry['action'] == 'ran' for entry in self.log)
+        skipped = sum(entry['action'] == 'skipped' for entry in self.log)
+        print(f"Run {self.run}: {ran} stages ran, {skipped} skipped, {len(self.failed)} tickers failed")
+        self.notify(urls)
+        return self.log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rerun only the stale stages of the pipeline, ticker by ticker.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, default=None, help='per-ticker time limit of the clean stage')
+    parser.add_argument('--engine', choices=['pandas', 'numpy'], default='pandas')
+    parser.add_argument('--low-memory', action='store_true')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--chunk-mb', type=float, default=clean_data.stream_chunk_mb)
+    parser.add_argument('--incremental', action='store_true',
+                        help='clean stale tickers from their saved state instead of from scratch')
+    parser.add_argument('--batch-train', action='store_true',
+                        help='one batched fit of every ticker instead of a model stage per ticker')
+    parser.add_argument('--force', action='store_true', help='rerun every stage')
+    parser.add_argument('--notify', nargs='*', default=notify_urls,
+                        help='refresh endpoints of the running API and dashboard (none to skip)')
+    args = parser.parse_args()
+
+    options = {'engine': args.engine, 'low_memory': args.low_memory, 'incremental': args.incremental,
+               'timeout': args.timeout, 'stream_chunk_mb': args.chunk_mb if args.stream else None}
+    scheduler = Scheduler(clean_data.discover_files(), options, workers=args.workers, force=args.force,
+                          batch_train=args.batch_train)
+    scheduler.run_all(args.notify)
@@ -0,0 +1,324 @@
+import os
+import sys
+import mmap
+import time
+import bisect
+import signal
+import socket
+import argparse
+import importlib
+import threading
+import traceback
+import numpy as np
+from werkzeug.exceptions import HTTPException
+from werkzeug.serving import make_server, WSGIRequestHandler
+from werkzeug.wsgi import ClosingIterator
+import shared_frames
+
+
+# What can be served: module, attribute of its Flask app, default port.
+targets = {
+    'api': ('app', 'app', 5000),
+    'dashboard': ('dashboard', 'app.server', 8050),
+}
+shared_dir = 'shared_frames'
+preload_tickers = 20
+check_interval = 2.0
+# Seconds a stopping worker is given to finish its in-flight requests.
+graceful_timeout = 30.0
+# Rewritten at the end of every clean_data.py, scheduler.py and batch_model.py
+# run: a change starts a rolling reload.
+watched_files = ['cleaned_data/summary_index.json', 'models/coefficients.json', 'state/pipeline.json']
+latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+# Request counters in an anonymous shared mapping created before the workers
+# are forked, so /metrics in any worker reports all of them. Each worker only
+# writes its own slot; slot 0 holds the totals of workers that have exited, so
+# the counters never go down across reloads.
+class SharedMetrics:
+    def __init__(self, endpoints, slots):
+        self.endpoints = list(endpoints) + ['other']
+        self.index = {endpoint: i for i, endpoint in enumerate(self.endpoints)}
+        shapes = [('int64', (slots, len(self.endpoints), len(latency_buckets) + 1)),
+                  ('float64', (slots, len(self.endpoints))),
+                  ('int64', (slots,)),
+                  ('int64', (2,))]
+        self.buffer = mmap.mmap(-1, sum(8 * int(np.prod(shape)) for _, shape in shapes))
+        arrays, offset = [], 0
+        for dtype, shape in shapes:
+            arrays.append(np.frombuffer(self.buffer, dtype, int(np.prod(shape)), offset).reshape(shape))
+            offset += arrays[-1].nbytes
+        self.counts, self.sums, self.in_flight, self.totals = arrays
+        self.slots = slots
+        self.slot = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            self.in_flight[self.slot] += 1
+
+    def observe(self, endpoint, seconds):
+        i = self.index.get(endpoint, len(self.endpoints) - 1)
+        with self.lock:
+            self.counts[self.slot, i, bisect.bisect_left(latency_buckets, seconds)] += 1
+            self.sums[self.slot, i] += seconds
+            self.in_flight[self.slot] -= 1
+
+    # Called by the master once the worker in `slot` has exited.
+    def retire(self, slot):
+        self.counts[0] += self.counts[slot]
+        self.sums[0] += self.sums[slot]
+        self.counts[slot] = 0
+        self.sums[slot] = 0
+        self.in_flight[slot] = 0
+
+    # Prometheus text format.
+    def render(self):
+        counts = self.counts.sum(axis=0).cumsum(axis=1)
+        sums = self.sums.sum(axis=0)
+        lines = ['# HELP http_request_duration_seconds Time from receiving a request to sending the end of its response.',
+                 '# TYPE http_request_duration_seconds histogram']
+        for i, endpoint in enumerate(self.endpoints):
+            if counts[i, -1] == 0:
+                continue
+            for le, count in zip([str(b) for b in latency_buckets] + ['+Inf'], counts[i]):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {count}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {sums[i]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {counts[i, -1]}')
+        lines += ['# HELP serving_requests_in_flight Requests being handled by all workers.',
+                  '# TYPE serving_requests_in_flight gauge',
+                  f'serving_requests_in_flight {self.in_flight.sum()}',
+                  '# HELP serving_workers Worker processes serving requests.',
+                  '# TYPE serving_workers gauge',
+                  f'serving_workers {self.totals[1]}',
+                  '# HELP serving_reloads_total Rolling reloads of the workers.',
+                  '# TYPE serving_reloads_total counter',
+                  f'serving_reloads_total {self.totals[0]}']
+        return '\n'.join(lines) + '\n'
+
+
+# Times every request by the endpoint it routes to, until the last byte of a
+# (possibly streamed) body is sent, and answers /metrics.
+class Instrumented:
+    def __init__(self, flask_app, metrics):
+        self.flask_app = flask_app
+        self.metrics = metrics
+
+    def endpoint(self, environ):
+        try:
+            return self.flask_app.url_map.bind_to_environ(environ).match()[0]
+        except HTTPException:
+            return 'other'
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/metrics':
+            body = self.metrics.render().encode()
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+        endpoint = self.endpoint(environ)
+        started = time.perf_counter()
+        self.metrics.begin()
+        try:
+            body = self.flask_app(environ, start_response)
+        except BaseException:
+            self.metrics.observe(endpoint, time.perf_counter() - started)
+            raise
+        return ClosingIterator(body, lambda: self.metrics.observe(endpoint, time.perf_counter() - started))
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def load_target(name):
+    module, attribute, _ = targets[name]
+    obj = importlib.import_module(module)
+    for part in attribute.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+
+# Writes the shared frames of the first `count` tickers, so that workers map
+# them instead of each building them on its first request.
+def preload(count):
+    import storage
+    for ticker in storage.list_tickers()[:count]:
+        version = storage.data_version(ticker)
+        if version is not None:
+            shared_frames.load(ticker, version[0], lambda: storage.load_features(ticker))
+
+
+def data_stamp(paths):
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return stamp
+
+
+# Pre-fork master: binds the socket, forks the workers (which accept on it
+# directly), restarts workers that die, and replaces all of them on SIGHUP or
+# when a watched file changes. A reload starts each new worker before stopping
+# the old one, and a stopping worker finishes its in-flight requests first, so
+# no request is refused or cut off.
+class Arbiter:
+    def __init__(self, wsgi, host, port, workers, metrics, preload_count=preload_tickers, watched=watched_files):
+        self.wsgi = wsgi
+        self.host = host
+        self.port = port
+        self.size = workers
+        self.metrics = metrics
+        self.preload_count = preload_count
+        self.watched = watched
+        self.workers = {}
+        self.retiring = set()
+        self.stopping = False
+        self.reload_reason = None
+        self.socket = None
+
+    def free_slot(self):
+        used = set(self.workers.values())
+        return next((slot for slot in range(1, self.metrics.slots) if slot not in used), None)
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.metrics.slot = slot
+                self.metrics.lock = threading.Lock()
+                self.serve()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = slot
+        self.metrics.totals[1] = len(self.workers) - len(self.retiring)
+
+    # Runs in the worker.
+    def serve(self):
+        for signum in (signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_IGN)
+        server = make_server(self.host, self.port, self.wsgi, threaded=True, request_handler=QuietHandler,
+                             fd=self.socket.fileno())
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        server.serve_forever()
+        deadline = time.monotonic() + graceful_timeout
+        while self.metrics.in_flight[self.metrics.slot] > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    # Preloading opens database connections, which must not be inherited by
+    # the workers, so it runs in a child of its own.
+    def preload(self):
+        if shared_frames.shared_path is None or not self.preload_count:
+            return
+        pid = os.fork()
+        if pid == 0:
+            try:
+                preload(self.preload_count)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.workers.pop(pid, None)
+            if slot is None:
+                continue
+            self.metrics.retire(slot)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif not self.stopping:
+                print(f"Worker {pid} exited with status {status}, restarting")
+                self.spawn(slot)
+            self.metrics.totals[1] = len(self.workers) - len(self.retiring)
+
+    def reload(self):
+        old = [pid for pid in self.workers if pid not in self.retiring]
+        # Wait for the previous reload's workers to drain when there are not
+        # enough free slots to run both generations.
+        if len(self.workers) + len(old) >= self.metrics.slots:
+            return
+        print(f"Reloading {len(old)} workers ({self.reload_reason})")
+        self.reload_reason = None
+        self.preload()
+        for pid in old:
+            self.spawn(self.free_slot())
+            self.retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+        self.metrics.totals[0] += 1
+        self.metrics.totals[1] = len(self.workers) - len(self.retiring)
+
+    def request_reload(self, reason):
+        self.reload_reason = reason
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        signal.signal(signal.SIGHUP, lambda *_: self.request_reload('SIGHUP'))
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.preload()
+        for _ in range(self.size):
+            self.spawn(self.free_slot())
+        print(f"Serving on http://{self.host}:{self.port} with {self.size} workers (master pid {os.getpid()})")
+        stamp, checked = data_stamp(self.watched), time.monotonic()
+        while not self.stopping:
+            time.sleep(0.1)
+            self.reap()
+            if time.monotonic() - checked > check_interval:
+                current, checked = data_stamp(self.watched), time.monotonic()
+                if current != stamp:
+                    stamp = current
+                    self.request_reload('data changed')
+            if self.reload_reason is not None:
+                self.reload()
+
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+        self.socket.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API or the dashboard with pre-forked worker processes.')
+    parser.add_argument('target', choices=list(targets))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help='default: 5000 for the API, 8050 for the dashboard')
+    parser.add_argument('--shared-dir', default=shared_dir, help='directory of the memory-mapped frames')
+    parser.add_argument('--no-shared', action='store_true', help='every worker loads its own copy of the frames')
+    parser.add_argument('--preload', type=int, default=preload_tickers,
+                        help='tickers whose shared frames are written before the workers start')
+    args = parser.parse_args()
+
+    if not args.no_shared:
+        shared_frames.shared_path = args.shared_dir
+    flask_app = load_target(args.target)
+    metrics = SharedMetrics(sorted({rule.endpoint for rule in flask_app.url_map.iter_rules()}), 3 * args.workers + 1)
+    arbiter = Arbiter(Instrumented(flask_app, metrics), args.host, args.port or targets[args.target][2],
+                      args.workers, metrics, args.preload)
+    arbiter.run()
+    sys.exit(0)
@@ -0,0 +1,49 @@
+import os
+import glob
+import hashlib
+import pyarrow as pa
+
+
+# Directory of the memory-mapped frames, set by serve.py. When None, load()
+# just builds the frame in the calling process.
+shared_path = None
+
+
+def frame_file(key, version, root):
+    digest = hashlib.blake2b(str(version).encode(), digest_size=8).hexdigest()
+    return os.path.join(root, str(key), f'{digest}.arrow')
+
+
+# Uncompressed Arrow IPC with NaN kept as a value rather than a null, so that
+# every column maps back into pandas without a copy.
+def write_frame(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.table({col: pa.array(df[col].to_numpy(), from_pandas=False) for col in df.columns})
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    # Older versions go; workers that still map them keep their pages until
+    # they drop the frame.
+    for old in glob.glob(os.path.join(os.path.dirname(path), '*.arrow')):
+        if old != path:
+            os.remove(old)
+
+
+def read_frame(path):
+    # The buffers keep the map open for as long as the frame lives.
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+# The frame of `key` at `version`, memory-mapped from the shared directory.
+# The first process to ask builds it and writes the file; the others map the
+# same pages from the page cache instead of holding their own copies. The
+# frame is read-only.
+def load(key, version, build):
+    if shared_path is None:
+        return build()
+    path = frame_file(key, version, shared_path)
+    if not os.path.exists(path):
+        write_frame(build(), path)
+    return read_frame(path)
@@ -0,0 +1,40 @@
+import pandas as pd
+import feature_store
+import timeseries_db
+
+
+# Readers of the cleaned bars: the database when the ticker has been loaded
+# into it, the feature store otherwise (histories cleaned before the database
+# existed). The functions have feature_store's contracts.
+def in_database(ticker):
+    return timeseries_db.data_version(ticker) is not None
+
+
+def list_tickers():
+    return sorted(set(timeseries_db.list_tickers()) | set(feature_store.list_tickers()))
+
+
+def data_version(ticker):
+    return timeseries_db.data_version(ticker) or feature_store.data_version(ticker)
+
+
+def load_features(ticker, columns=None, start=None, end=None):
+    if in_database(ticker):
+        return timeseries_db.load_features(ticker, columns, start, end)
+    return feature_store.load_features(ticker, columns, start, end)
+
+
+# Same contract as timeseries_db.load_since; tickers outside the database are
+# read from the feature store one at a time.
+def load_since(starts, columns=None):
+    in_db = {ticker: start for ticker, start in starts.items() if in_database(ticker)}
+    frames = [timeseries_db.load_since(in_db, columns)] if in_db else []
+    for ticker, start in starts.items():
+        if ticker not in in_db:
+            df = feature_store.load_features(ticker, columns, start)
+            if df is not None and not df.empty:
+                df.insert(0, 'ticker', ticker)
+                frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['ticker'] + list(columns or []))
+    return pd.concat(frames, ignore_index=True)
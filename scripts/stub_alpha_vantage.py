@@ -0,0 +1,77 @@
+import os
+import json
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+# Local stand-in for the Alpha Vantage TIME_SERIES_DAILY CSV endpoint. It serves
+# data/<T>_TATA_data.csv files newest first, trims `compact` requests to 100
+# bars and can inject the API's failure modes: HTTP 5xx, 200 JSON rate-limit
+# notes and unknown-symbol errors.
+compact_rows = 100
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    data_dir = 'data'
+    error_rate = 0.0
+    note_rate = 0.0
+    requests = []
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        type(self).requests.append(query)
+        if random.random() < self.error_rate:
+            return self._send(503, b'Service Unavailable', 'text/plain')
+        if random.random() < self.note_rate:
+            note = {'Note': 'Our standard API call frequency is 5 calls per minute.'}
+            return self._send(200, json.dumps(note).encode(), 'application/json')
+
+        path = os.path.join(self.data_dir, f"{query.get('symbol', '')}_TATA_data.csv")
+        if query.get('function') != 'TIME_SERIES_DAILY' or not os.path.exists(path):
+            error = {'Error Message': 'Invalid API call. Please retry or visit the documentation.'}
+            return self._send(200, json.dumps(error).encode(), 'application/json')
+
+        with open(path, 'r') as f:
+            header, *rows = f.read().splitlines()
+        rows.sort(reverse=True)
+        if query.get('outputsize', 'compact') == 'compact':
+            rows = rows[:compact_rows]
+        body = '\r\n'.join([header] + rows).encode() + b'\r\n'
+        self._send(200, body, 'application/x-download')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, data_dir='data', error_rate=0.0, note_rate=0.0):
+    handler = type('Handler', (StubHandler,), {
+        'data_dir': data_dir, 'error_rate': error_rate, 'note_rate': note_rate, 'requests': []
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/query'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve data/*_TATA_data.csv like the Alpha Vantage CSV endpoint.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--note-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.data_dir, args.error_rate, args.note_rate)
+    print(f"Stub Alpha Vantage endpoint at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
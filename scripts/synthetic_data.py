@@ -0,0 +1,68 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+
+price_columns = ['open', 'high', 'low', 'close', 'volume']
+
+
+# Geometric random walk of daily bars, oldest first. `missing_rate` blanks that
+# share of the OHLCV cells and `duplicate_rate` repeats that share of the rows,
+# like the gaps and repeated bars of the real feeds. `freq` sets the bar
+# spacing, e.g. 'min' for intraday histories longer than the calendar allows
+# in business days.
+def synthetic_ohlcv(days, seed, missing_rate=0.0, duplicate_rate=0.0, start='2000-01-03', freq='B'):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=days, freq=freq),
+        'open': close * (1 + rng.normal(0, 0.002, days)),
+        'high': close * (1 + np.abs(rng.normal(0, 0.005, days))),
+        'low': close * (1 - np.abs(rng.normal(0, 0.005, days))),
+        'close': close,
+        'volume': rng.integers(1_000_000, 20_000_000, days),
+    })
+    if missing_rate > 0:
+        df[price_columns] = df[price_columns].mask(rng.random((days, len(price_columns))) < missing_rate)
+    if duplicate_rate > 0:
+        repeated = np.flatnonzero(rng.random(days) < duplicate_rate)
+        df = df.iloc[np.sort(np.concatenate([np.arange(days), repeated]), kind='stable')].reset_index(drop=True)
+    return df
+
+
+# Formatted like a TIME_SERIES_DAILY CSV download: newest first, dates as text
+# (with the time of day for intraday bars).
+def to_raw_feed(df):
+    df = df.iloc[::-1].copy()
+    intraday = (df['timestamp'] != df['timestamp'].dt.normalize()).any()
+    df['timestamp'] = df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S' if intraday else '%Y-%m-%d')
+    return df
+
+
+def ticker_names(tickers):
+    return [f'SYN{i:05d}' for i in range(tickers)]
+
+
+def write_universe(tickers, days, path='data', missing_rate=0.0, duplicate_rate=0.0, seed=0, freq='B'):
+    os.makedirs(path, exist_ok=True)
+    names = ticker_names(tickers)
+    for i, name in enumerate(names):
+        df = synthetic_ohlcv(days, seed + i, missing_rate, duplicate_rate, freq=freq)
+        to_raw_feed(df).to_csv(os.path.join(path, f'{name}_TATA_data.csv'), index=False)
+    return names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write N tickers x M days of synthetic raw feeds.')
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=252 * 10)
+    parser.add_argument('--missing-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--freq', default='B', help="bar spacing, e.g. 'min' for intraday bars")
+    parser.add_argument('--output', default='data')
+    args = parser.parse_args()
+    names = write_universe(args.tickers, args.days, args.output, args.missing_rate, args.duplicate_rate, args.seed,
+                           args.freq)
+    print(f"Wrote {len(names)} tickers x {args.days} days to {args.output}/")
@@ -0,0 +1,592 @@
+import os
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from itertools import repeat
+from contextlib import contextmanager
+import pandas as pd
+
+
+db_file = 'stocks.db'
+export_path = 'cleaned_data'
+
+int_columns = ['volume']
+insert_batch_rows = 50_000
+fetch_chunk_rows = 5_000
+pool_size = 8
+# Writers from the pipeline's worker processes queue on SQLite's write lock.
+busy_timeout = 300
+
+# Bars are keyed and clustered on (ticker, timestamp), so a ticker's date range
+# is one contiguous index scan. Timestamps are stored as integer nanoseconds.
+# Feature columns are added as they first appear. `days` rolls the bars up per
+# ticker and epoch day (first and last bar, and the min, max and sum of every
+# column) and is rebuilt from the first day a write touched, so aggregations
+# over a whole history read a row per day instead of a row per bar. `tickers`
+# holds a version that every write bumps, used as the cache key of the readers.
+# Scaled columns are not stored: `scaled_columns` names each one's base column
+# and `scalers` holds a ticker's centre and scale, and readers derive them as
+# (base - centre) / scale. They are whole-history scalers, so storing their
+# output would mean rewriting every bar of a ticker whenever bars are appended.
+schema = """
+CREATE TABLE IF NOT EXISTS bars (
+    ticker TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (ticker, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS days (
+    ticker TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    first_ts INTEGER NOT NULL,
+    last_ts INTEGER NOT NULL,
+    PRIMARY KEY (ticker, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tickers (
+    ticker TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scaled_columns (
+    name TEXT PRIMARY KEY,
+    base TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scalers (
+    ticker TEXT NOT NULL,
+    name TEXT NOT NULL,
+    centre REAL NOT NULL,
+    scale REAL NOT NULL,
+    PRIMARY KEY (ticker, name)
+) WITHOUT ROWID;
+"""
+
+# Labels of the resample rules app.py accepts, the same as pandas' resample:
+# the day for 'D' and the last day of the week (ending Sunday), month, quarter
+# or year otherwise. `{s}` is the start of the bar's day in epoch seconds.
+period_labels = {
+    'D': "date({s}, 'unixepoch')",
+    'W': "date({s}, 'unixepoch', 'weekday 0')",
+    'ME': "date({s}, 'unixepoch', 'start of month', '+1 month', '-1 day')",
+    'QE': "date({s}, 'unixepoch', 'start of month', "
+          "'+' || (3 - (CAST(strftime('%m', {s}, 'unixepoch') AS INTEGER) - 1) % 3) || ' months', '-1 day')",
+    'YE': "date({s}, 'unixepoch', 'start of year', '+1 year', '-1 day')",
+}
+
+# Names of the calendar periods downsample.period_totals groups by.
+period_names = {
+    'D': "date({s}, 'unixepoch')",
+    'W': "date({s}, 'unixepoch', 'weekday 0', '-6 days') || '/' || date({s}, 'unixepoch', 'weekday 0')",
+    'M': "strftime('%Y-%m', {s}, 'unixepoch')",
+    'Q': "strftime('%Y', {s}, 'unixepoch') || 'Q' || ((CAST(strftime('%m', {s}, 'unixepoch') AS INTEGER) + 2) / 3)",
+    'Y': "strftime('%Y', {s}, 'unixepoch')",
+}
+
+# Aggregations first group the bars by epoch day with integer arithmetic
+# (rounded down before 1970 too), so the calendar functions above run once
+# per day rather than once per bar.
+day_ns = 86_400_000_000_000
+rollups = ['min', 'max', 'sum']
+epoch_day = f'timestamp / {day_ns} - (timestamp % {day_ns} < 0)'
+seconds = 'day * 86400'
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def connect(path=db_file, readonly=False):
+    conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+    if readonly:
+        conn.execute('PRAGMA query_only=ON')
+    else:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(schema)
+    return conn
+
+
+# Up to `size` read connections shared between threads; a thread holds one for
+# the duration of a `with pool.connection()` block. In WAL mode readers do not
+# block each other or the pipeline's writes.
+class ConnectionPool:
+    def __init__(self, path=db_file, size=pool_size):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                conn = None
+                if self.opened < self.size:
+                    conn = connect(self.path, readonly=True)
+                    self.opened += 1
+            if conn is None:
+                conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+# Connections must not cross a fork: a child process starts with no pools and
+# leaves the ones it inherited (still in use by the parent) untouched.
+def forget_pools():
+    global pools_lock
+    forked_pools.extend(pools.values())
+    pools.clear()
+    pools_lock = threading.Lock()
+
+
+forked_pools = []
+os.register_at_fork(after_in_child=forget_pools)
+
+
+def pool(path=db_file):
+    with pools_lock:
+        if path not in pools:
+            pools[path] = ConnectionPool(path)
+        return pools[path]
+
+
+def table_columns(conn):
+    return [row[1] for row in conn.execute('PRAGMA table_info(bars)')][2:]
+
+
+# {scaled column: base column}. Databases written before scaled columns
+# existed have none (and no table until the next write).
+def scaled_columns(conn):
+    try:
+        return dict(conn.execute('SELECT name, base FROM scaled_columns'))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def reader_columns(conn):
+    available = table_columns(conn)
+    return available + [col for col in scaled_columns(conn) if col not in available]
+
+
+# The columns a reader can select, timestamp first.
+def bar_columns(path=db_file):
+    with pool(path).connection() as conn:
+        return ['timestamp'] + reader_columns(conn)
+
+
+def rollup_column(how, col):
+    return quote(f'{how}({col})')
+
+
+def add_columns(conn, df):
+    existing = set(table_columns(conn))
+    for col in df.columns:
+        if col not in existing and col != 'timestamp':
+            kind = 'INTEGER' if col in int_columns else 'REAL'
+            conn.execute(f'ALTER TABLE bars ADD COLUMN {quote(col)} {kind}')
+            for how in rollups:
+                conn.execute(f'ALTER TABLE days ADD COLUMN {rollup_column(how, col)} {kind}')
+
+
+def to_nanoseconds(timestamps):
+    return pd.to_datetime(timestamps).dt.as_unit('ns').astype('int64')
+
+
+# Bulk writer for one ticker. Everything written between enter and exit is one
+# transaction: readers see the previous version until it commits. With
+# `replace` the ticker's rows are deleted first (a full rebuild); otherwise
+# rows are upserted on (ticker, timestamp). `scalers` maps scaled columns to
+# (base column, centre, scale): those columns are dropped from the written
+# bars and the ticker's scalers replaced, so existing bars are not touched.
+class BarWriter:
+    def __init__(self, ticker, replace=True, path=db_file, batch_rows=insert_batch_rows, scalers=None):
+        self.ticker = ticker
+        self.replace = replace
+        self.path = path
+        self.batch_rows = batch_rows
+        self.scalers = scalers
+        self.conn = None
+        self.since = None
+
+    def __enter__(self):
+        self.conn = connect(self.path)
+        self.conn.execute('BEGIN IMMEDIATE')
+        if self.replace:
+            self.conn.execute('DELETE FROM bars WHERE ticker = ?', (self.ticker,))
+        return self
+
+    def write(self, df):
+        if self.scalers:
+            df = df.drop(columns=[col for col in self.scalers if col in df.columns])
+        add_columns(self.conn, df)
+        columns = [col for col in df.columns if col != 'timestamp']
+        names = ', '.join(['ticker', 'timestamp'] + [quote(col) for col in columns])
+        updates = ', '.join(f'{quote(col)} = excluded.{quote(col)}' for col in columns)
+        sql = (f"INSERT INTO bars ({names}) VALUES ({', '.join('?' * (len(columns) + 2))}) "
+               f"ON CONFLICT (ticker, timestamp) DO " + (f'UPDATE SET {updates}' if updates else 'NOTHING'))
+        timestamps = to_nanoseconds(df['timestamp']).tolist()
+        if timestamps:
+            self.since = min(timestamps) if self.since is None else min(self.since, min(timestamps))
+        values = [df[col].tolist() for col in columns]
+        for start in range(0, len(df), self.batch_rows):
+            end = start + self.batch_rows
+            self.conn.executemany(sql, zip(repeat(self.ticker), timestamps[start:end], *[v[start:end] for v in values]))
+
+    # Rebuilds the ticker's `days` rows from the first day written to (all of
+    # them after a replace).
+    def roll_up(self):
+        if not self.replace and self.since is None:
+            return
+        first_day = -2 ** 63 // day_ns if self.replace else self.since // day_ns
+        self.conn.execute('DELETE FROM days WHERE ticker = ? AND day >= ?', (self.ticker, first_day))
+        columns = table_columns(self.conn)
+        names = ['ticker', 'day', 'first_ts', 'last_ts'] + [rollup_column(how, col) for col in columns for how in rollups]
+        aggregates = ['MIN(timestamp)', 'MAX(timestamp)'] + [f'{how.upper()}({quote(col)})' for col in columns for how in rollups]
+        self.conn.execute(f"INSERT INTO days ({', '.join(names)}) SELECT ?, {epoch_day} AS day, {', '.join(aggregates)} "
+                          f"FROM bars WHERE ticker = ? AND timestamp >= ? GROUP BY day",
+                          (self.ticker, self.ticker, max(first_day * day_ns, -2 ** 63)))
+
+    def store_scalers(self):
+        if self.scalers is None and not self.replace:
+            return
+        self.conn.execute('DELETE FROM scalers WHERE ticker = ?', (self.ticker,))
+        for name, (base, centre, scale) in (self.scalers or {}).items():
+            self.conn.execute('INSERT INTO scaled_columns VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET base = excluded.base',
+                              (name, base))
+            self.conn.execute('INSERT INTO scalers VALUES (?, ?, ?, ?)', (self.ticker, name, centre, scale))
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is not None:
+                self.conn.execute('ROLLBACK')
+                return
+            self.roll_up()
+            self.store_scalers()
+            rows = self.conn.execute('SELECT COUNT(*) FROM bars WHERE ticker = ?', (self.ticker,)).fetchone()[0]
+            self.conn.execute(
+                'INSERT INTO tickers VALUES (?, 1, ?, ?) ON CONFLICT (ticker) DO UPDATE SET '
+                'version = version + 1, updated_at = excluded.updated_at, rows = excluded.rows',
+                (self.ticker, time.time(), rows))
+            self.conn.execute('COMMIT')
+        finally:
+            self.conn.close()
+
+
+def write_bars(df, ticker, replace=True, path=db_file, scalers=None):
+    with BarWriter(ticker, replace, path, scalers=scalers) as writer:
+        writer.write(df)
+
+
+def list_tickers(path=db_file):
+    if not os.path.exists(path):
+        return []
+    with pool(path).connection() as conn:
+        return [row[0] for row in conn.execute('SELECT ticker FROM tickers ORDER BY ticker')]
+
+
+# Same contract as feature_store.data_version: (version, last modified time)
+# or None when the ticker is not in the database.
+def data_version(ticker, path=db_file):
+    if not os.path.exists(path):
+        return None
+    with pool(path).connection() as conn:
+        row = conn.execute('SELECT version, updated_at FROM tickers WHERE ticker = ?', (ticker,)).fetchone()
+    if row is None:
+        return None
+    return f'db-{row[0]}-{row[1]:.6f}', row[1]
+
+
+# {scaled column: (base column, centre, scale)} of a ticker; empty when it has
+# no scalers or is not in the database.
+def load_scalers(ticker, path=db_file):
+    if not os.path.exists(path):
+        return {}
+    with pool(path).connection() as conn:
+        return ticker_scalers(conn, ticker)
+
+
+# (first timestamp, last timestamp, rows) of a ticker in the database.
+def ticker_extent(ticker, path=db_file):
+    with pool(path).connection() as conn:
+        first, last, rows = conn.execute(
+            'SELECT (SELECT MIN(timestamp) FROM bars WHERE ticker = ?), (SELECT MAX(timestamp) FROM bars WHERE ticker = ?), '
+            'rows FROM tickers WHERE ticker = ?', (ticker, ticker, ticker)).fetchone()
+    return pd.Timestamp(first), pd.Timestamp(last), rows
+
+
+def to_frame(cursor, rows=None):
+    df = pd.DataFrame(cursor.fetchall() if rows is None else rows, columns=[d[0] for d in cursor.description])
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'), unit='ns')
+    return df
+
+
+def range_filter(ticker, start=None, end=None, column='timestamp'):
+    sql, params = ['ticker = ?'], [ticker]
+    if start is not None:
+        sql.append(f'{column} >= ?')
+        params.append(int(pd.Timestamp(start).as_unit('ns').value))
+    if end is not None:
+        sql.append(f'{column} <= ?')
+        params.append(int(pd.Timestamp(end).as_unit('ns').value))
+    return ' AND '.join(sql), params
+
+
+# {scaled column: (base column, centre, scale)} for the ticker.
+def ticker_scalers(conn, ticker):
+    scaled = scaled_columns(conn)
+    if not scaled:
+        return {}
+    return {name: (scaled[name], centre, scale) for name, centre, scale in
+            conn.execute('SELECT name, centre, scale FROM scalers WHERE ticker = ?', (ticker,))}
+
+
+# A scaled column is selected as its base column (and as itself when it is
+# also stored, for tickers without scalers), and derived by scale_columns.
+def select_list(conn, columns):
+    available = table_columns(conn)
+    scaled = scaled_columns(conn)
+    columns = reader_columns(conn) if columns is None else [col for col in columns if col != 'timestamp']
+    selected = []
+    for col in columns:
+        if col in available:
+            selected.append(col)
+        if col in scaled and scaled[col] in available:
+            selected.append(scaled[col])
+    return ', '.join(['timestamp'] + [quote(col) for col in dict.fromkeys(selected)])
+
+
+# Derives the scaled columns among `columns` (all of them for None) for the
+# rows of `tickers` (told apart by the ticker column when there are several)
+# and drops the base columns only read for them.
+def scale_columns(conn, df, tickers, columns):
+    scaled = {col: base for col, base in scaled_columns(conn).items()
+              if (columns is None or col in columns) and base in df.columns}
+    if not scaled:
+        return df
+    scalers = {}
+    for ticker, name, centre, scale in conn.execute(
+            f"SELECT ticker, name, centre, scale FROM scalers WHERE ticker IN ({', '.join('?' * len(tickers))})",
+            list(tickers)):
+        scalers.setdefault(name, {})[ticker] = (centre, scale)
+    for col, base in scaled.items():
+        by_ticker = scalers.get(col)
+        if not by_ticker:
+            continue
+        if 'ticker' in df.columns:
+            centre = df['ticker'].map({ticker: p[0] for ticker, p in by_ticker.items()})
+            scale = df['ticker'].map({ticker: p[1] for ticker, p in by_ticker.items()})
+            derived = (df[base].astype('float64') - centre) / scale
+            df[col] = derived.where(centre.notna(), df[col]) if col in df.columns else derived
+        else:
+            centre, scale = by_ticker[tickers[0]]
+            df[col] = (df[base].astype('float64') - centre) / scale
+    if columns is not None:
+        df = df.drop(columns=[base for base in scaled.values() if base not in columns])
+    return df
+
+
+# Same contract as feature_store.load_features: an indexed range scan of the
+# ticker's bars between `start` and `end` (inclusive), oldest first.
+def load_features(ticker, columns=None, start=None, end=None, path=db_file):
+    where, params = range_filter(ticker, start, end)
+    with pool(path).connection() as conn:
+        df = to_frame(conn.execute(f'SELECT {select_list(conn, columns)} FROM bars WHERE {where} ORDER BY timestamp',
+                                   params))
+        df = scale_columns(conn, df, [ticker], columns)
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    return df
+
+
+# load_features for many tickers: the bars of each ticker in `starts` from its
+# start (None for all of them), in one frame with a ticker column, grouped by
+# ticker and oldest first. The queries share a connection and their rows are
+# turned into a single frame, which is most of the cost of a short read.
+def load_since(starts, columns=None, path=db_file):
+    rows, cursor = [], None
+    with pool(path).connection() as conn:
+        select = select_list(conn, columns)
+        for ticker, start in starts.items():
+            where, params = range_filter(ticker, start)
+            cursor = conn.execute(f'SELECT ticker, {select} FROM bars WHERE {where} ORDER BY timestamp', params)
+            rows.extend(cursor.fetchall())
+        if cursor is None:
+            return pd.DataFrame(columns=['ticker'] + list(columns or []))
+        df = scale_columns(conn, to_frame(cursor, rows), list(starts), columns)
+    if columns is not None:
+        df = df[['ticker'] + [col for col in columns if col in df.columns]]
+    return df
+
+
+# The bars from `start` to `end` plus the one on either side, so a zoomed line
+# chart runs to the edges of the window.
+def load_window(ticker, columns, start, end, path=db_file):
+    where, params = range_filter(ticker, start, end)
+    before, before_params = range_filter(ticker, end=pd.Timestamp(start) - pd.Timedelta(1, 'ns'))
+    after, after_params = range_filter(ticker, start=pd.Timestamp(end) + pd.Timedelta(1, 'ns'))
+    with pool(path).connection() as conn:
+        select = select_list(conn, columns)
+        sql = (f'SELECT * FROM (SELECT {select} FROM bars WHERE {before} ORDER BY timestamp DESC LIMIT 1) '
+               f'UNION ALL SELECT * FROM (SELECT {select} FROM bars WHERE {where}) '
+               f'UNION ALL SELECT * FROM (SELECT {select} FROM bars WHERE {after} ORDER BY timestamp LIMIT 1) '
+               f'ORDER BY timestamp')
+        return scale_columns(conn, to_frame(conn.execute(sql, before_params + params + after_params)), [ticker], columns)
+
+
+# OHLC resampling in the database: one row per non-empty period, labelled like
+# pandas' resample(rule), with each column aggregated by `aggregations`
+# ('first', 'last', 'max', 'min' or 'sum'). 'first' and 'last' are the first
+# and last non-null value of the period, each found by a short index scan
+# from the period's edge. Without a date range the days come from the rollup.
+# A scaled column is aggregated as its base column and scaled afterwards,
+# which its (increasing) scaler commutes with except for 'sum'.
+def resample_bars(ticker, rule, aggregations, start=None, end=None, cursor=None, limit=None, path=db_file):
+    where, params = range_filter(ticker, start, end)
+    rolled = start is None and end is None
+    label = f"CAST(strftime('%s', {period_labels[rule].format(s=seconds)}) AS INTEGER) * 1000000000"
+    daily = (['day', 'first_ts', 'last_ts'] if rolled else
+             [f'{epoch_day} AS day', 'MIN(timestamp) AS first_ts', 'MAX(timestamp) AS last_ts'])
+    grouped = [f'{label} AS period', 'MIN(first_ts) AS first_ts', 'MAX(last_ts) AS last_ts']
+    selected = ['period AS timestamp']
+    edge_params = []
+    with pool(path).connection() as conn:
+        scalers = ticker_scalers(conn, ticker)
+        for i, (col, how) in enumerate(aggregations.items()):
+            if col in scalers and how == 'sum':
+                raise ValueError(f'{col} is scaled and cannot be summed')
+            source = scalers[col][0] if col in scalers else col
+            if how in ('first', 'last'):
+                order = 'ASC' if how == 'first' else 'DESC'
+                selected.append(f'(SELECT {quote(source)} FROM bars WHERE ticker = ? AND timestamp BETWEEN first_ts AND last_ts '
+                                f'AND {quote(source)} IS NOT NULL ORDER BY timestamp {order} LIMIT 1) AS {quote(col)}')
+                edge_params.append(ticker)
+            else:
+                aggregate = rollup_column(how, source) if rolled else f'{how.upper()}({quote(source)})'
+                daily.append(f'{aggregate} AS c{i}')
+                grouped.append(f'COALESCE(SUM(c{i}), 0) AS c{i}' if how == 'sum' else f'{how.upper()}(c{i}) AS c{i}')
+                selected.append(f'c{i} AS {quote(col)}')
+        days = f'days WHERE {where}' if rolled else f'bars WHERE {where} GROUP BY day'
+        sql = (f"WITH d AS (SELECT {', '.join(daily)} FROM {days}), "
+               f"g AS (SELECT {', '.join(grouped)} FROM d GROUP BY period) SELECT {', '.join(selected)} FROM g")
+        params = params + edge_params
+        if cursor is not None:
+            sql += ' WHERE period >= ?'
+            params.append(int(pd.Timestamp(cursor).as_unit('ns').value))
+        sql += ' ORDER BY period'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        df = to_frame(conn.execute(sql, params))
+    for col in aggregations:
+        if col in scalers:
+            _, centre, scale = scalers[col]
+            df[col] = (df[col].astype('float64') - centre) / scale
+    return df
+
+
+def page_query(conn, ticker, columns, start, end, cursor, limit):
+    if cursor is not None:
+        start = cursor if start is None else max(pd.Timestamp(start), pd.Timestamp(cursor))
+    where, params = range_filter(ticker, start, end)
+    sql = f'SELECT {select_list(conn, columns)} FROM bars WHERE {where} ORDER BY timestamp'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+
+def project(df, columns):
+    return df if columns is None else df[[col for col in columns if col in df.columns]]
+
+
+# Like load_features with a cursor and a row limit pushed into the query.
+def page_bars(ticker, columns=None, start=None, end=None, cursor=None, limit=None, path=db_file):
+    with pool(path).connection() as conn:
+        sql, params = page_query(conn, ticker, columns, start, end, cursor, limit)
+        df = scale_columns(conn, to_frame(conn.execute(sql, params)), [ticker], columns)
+    return project(df, columns)
+
+
+# page_bars as frames of at most `chunk_rows` bars, fetched as they are
+# consumed, so a long page is never in memory whole. At least one frame is
+# yielded, empty for an empty page. The pooled connection is held until the
+# generator finishes or is closed.
+def iter_bars(ticker, columns=None, start=None, end=None, cursor=None, limit=None, chunk_rows=fetch_chunk_rows,
+              path=db_file):
+    with pool(path).connection() as conn:
+        sql, params = page_query(conn, ticker, columns, start, end, cursor, limit)
+        result = conn.execute(sql, params)
+        rows = result.fetchmany(chunk_rows)
+        while True:
+            yield project(scale_columns(conn, to_frame(result, rows), [ticker], columns), columns)
+            rows = result.fetchmany(chunk_rows)
+            if not rows:
+                break
+
+
+# Timestamp of the bar `offset` bars into page_bars' page, or None: the cursor
+# of the next page, found without reading the page.
+def bar_at(ticker, start=None, end=None, cursor=None, offset=0, path=db_file):
+    with pool(path).connection() as conn:
+        sql, params = page_query(conn, ticker, ['timestamp'], start, end, cursor, 1)
+        row = conn.execute(sql + ' OFFSET ?', params + [offset]).fetchone()
+    return None if row is None else pd.Timestamp(row[0])
+
+
+# downsample.period_totals computed in the database: `column` summed over the
+# finest calendar period that yields at most `max_buckets` groups.
+def period_totals(ticker, column, max_buckets=24, path=db_file):
+    days = f"WITH d AS (SELECT day, {rollup_column('sum', column)} AS total FROM days WHERE ticker = ?) "
+    names = {period: name.format(s=seconds) for period, name in period_names.items()}
+    with pool(path).connection() as conn:
+        counts = conn.execute(days + 'SELECT ' + ', '.join(f'COUNT(DISTINCT {name})' for name in names.values())
+                              + ' FROM d', (ticker,)).fetchone()
+        period = next((p for p, count in zip(names, counts) if count <= max_buckets), 'Y')
+        cursor = conn.execute(days + f'SELECT {names[period]} AS period, COALESCE(SUM(total), 0) FROM d '
+                              f'GROUP BY 1 ORDER BY MIN(day)', (ticker,))
+        return pd.DataFrame(cursor.fetchall(), columns=['period', column])
+
+
+# The cleaned CSV of a ticker, as clean_data.py writes it, from the database.
+def export_csv(ticker, output=export_path, path=db_file):
+    df = load_features(ticker, path=path)
+    os.makedirs(output, exist_ok=True)
+    output_file = os.path.join(output, f'cleaned_{ticker}_TATA_data.csv')
+    df.to_csv(output_file, index=False)
+    return output_file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load the feature store into the database or export it as CSV.')
+    parser.add_argument('command', choices=['load', 'export'])
+    parser.add_argument('tickers', nargs='*', help='default: every ticker in the source')
+    parser.add_argument('--db', default=db_file)
+    parser.add_argument('--output', default=export_path, help='directory of the exported CSVs')
+    args = parser.parse_args()
+
+    # Loads from the cleaned CSVs where they exist: the Parquet store keeps
+    # features in float32.
+    if args.command == 'load':
+        import feature_store
+        for ticker in args.tickers or feature_store.list_tickers():
+            csv_file = os.path.join(feature_store.csv_path, f'cleaned_{ticker}_TATA_data.csv')
+            if os.path.exists(csv_file):
+                df = pd.read_csv(csv_file, parse_dates=['timestamp'])
+            else:
+                df = feature_store.load_features(ticker)
+            write_bars(df, ticker, path=args.db)
+            print(f"Loaded {ticker} into {args.db}")
+    else:
+        for ticker in args.tickers or list_tickers(args.db):
+            print(f"Exported {ticker} to {export_csv(ticker, args.output, args.db)}")
@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import timeseries_db
+import synthetic_data
+
+
+# The pipeline reads and writes relative to the working directory (data/,
+# cleaned_data/, feature_store/, stocks.db); each test gets its own. The
+# database pools are keyed by that relative path, so they are dropped too.
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    timeseries_db.forget_pools()
+    yield tmp_path
+    timeseries_db.forget_pools()
+
+
+def write_raw(bars, ticker, path='data'):
+    os.makedirs(path, exist_ok=True)
+    file = f'{ticker}_TATA_data.csv'
+    synthetic_data.to_raw_feed(bars).to_csv(os.path.join(path, file), index=False)
+    return file
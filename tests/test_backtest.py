@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import backtest
+
+
+# Each fold refitted from scratch with lstsq on the same scaled design.
+def lstsq_errors(x, y, min_train, step):
+    mean = x[:min_train].mean(axis=0)
+    scale = x[:min_train].std(axis=0)
+    scale[scale == 0] = 1.0
+    design = np.column_stack([np.ones(len(x)), (x - mean) / scale])
+    errors = []
+    for end in range(min_train, len(x), step):
+        beta = np.linalg.lstsq(design[:end], y[:end], rcond=None)[0]
+        errors.append(design[end:end + step] @ beta - y[end:end + step])
+    return np.concatenate(errors)
+
+
+# OHLC-like columns: high an exact copy of open, low and the moving average
+# within 1e-8 of close, on a price level far from zero.
+def collinear_features(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 1e4 + 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = close * (1 + rng.normal(0, 1e-9, n))
+    x = np.column_stack([open_, open_, close * (1 - 1e-10 * np.abs(rng.normal(size=n))),
+                         rng.integers(1_000_000, 20_000_000, n).astype('float64'),
+                         close * (1 + rng.normal(0, 1e-8, n)), rng.random(n)])
+    return x, close
+
+
+def well_conditioned_features(n, seed):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, 6))
+    return x, x @ rng.normal(size=6) + rng.normal(size=n)
+
+
+@pytest.mark.parametrize('features', [collinear_features, well_conditioned_features])
+@pytest.mark.parametrize('step', [1, 5, 37])
+def test_walk_forward_matches_lstsq(features, step):
+    x, y = features(600, seed=step)
+    ends, fold_mse, errors = backtest.walk_forward(x, y, backtest.min_train_rows, step)
+    expected = lstsq_errors(x, y, backtest.min_train_rows, step)
+    assert len(ends) == len(fold_mse) == -(-(len(x) - backtest.min_train_rows) // step)
+    np.testing.assert_allclose(errors, expected, rtol=0, atol=1e-9 * np.abs(y).max())
@@ -0,0 +1,26 @@
+import numpy as np
+import batch_model
+
+
+def test_blocks_bound_the_padded_rows(monkeypatch):
+    monkeypatch.setattr(batch_model, 'block_rows', 1000)
+    monkeypatch.setattr(batch_model, 'block_tickers', 4)
+    lengths = [10, 5000, 300, 300, 300, 400, 20, 10, 10, 10, 10]
+    blocks = list(batch_model.blocks(lengths))
+    assert sorted(i for block in blocks for i in block) == list(range(len(lengths)))
+    for block in blocks:
+        assert len(block) <= 4
+        assert len(block) == 1 or len(block) * max(lengths[i] for i in block) <= 1000
+
+
+def test_blocked_fit_matches_lstsq(monkeypatch):
+    monkeypatch.setattr(batch_model, 'block_rows', 2500)
+    rng = np.random.default_rng(0)
+    xs = [rng.normal(size=(n, 6)) for n in [30, 2000, 45, 2000, 700]]
+    ys = [x @ rng.normal(size=6) + rng.normal(size=len(x)) for x in xs]
+    for rows in batch_model.blocks([len(x) for x in xs]):
+        coefficients, _ = batch_model.fit_block([xs[i] for i in rows], [ys[i] for i in rows])
+        for i, fitted in zip(rows, coefficients):
+            train, _ = batch_model.split_indices(len(xs[i]))
+            design = np.column_stack([np.ones(len(train)), xs[i][train]])
+            np.testing.assert_allclose(fitted, np.linalg.lstsq(design, ys[i][train], rcond=None)[0], atol=1e-10)
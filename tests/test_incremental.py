@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+import pytest
+import clean_data
+import feature_store
+import timeseries_db
+from synthetic_data import synthetic_ohlcv
+from conftest import write_raw
+
+
+def process(file, incremental=False):
+    [(_, _, metrics, _)] = clean_data.process_chunk([(file.split('_')[0], file)], incremental=incremental, train=False)
+    assert metrics['processing_status'] == 'Success', metrics.get('error_message')
+    return metrics
+
+
+def outputs(ticker, file):
+    csv = pd.read_csv(os.path.join(clean_data.output_path, f'cleaned_{file}'), parse_dates=['timestamp'])
+    return csv, timeseries_db.load_features(ticker), feature_store.load_features(ticker)
+
+
+# Same history cleaned in one full run, and in a full run followed by an
+# incremental one (or two) that add the newer bars.
+@pytest.mark.parametrize('splits', [[260], [200, 290]])
+def test_incremental_matches_full_recompute(workdir, monkeypatch, splits):
+    ticker = 'SYN00000'
+    bars = synthetic_ohlcv(300, seed=3, missing_rate=0.01)
+
+    (workdir / 'full').mkdir()
+    monkeypatch.chdir(workdir / 'full')
+    file = write_raw(bars, ticker)
+    process(file)
+    full = outputs(ticker, file)
+
+    timeseries_db.forget_pools()
+    (workdir / 'incremental').mkdir()
+    monkeypatch.chdir(workdir / 'incremental')
+    write_raw(bars.iloc[:splits[0]], ticker)
+    process(file)
+    for end in splits[1:] + [len(bars)]:
+        write_raw(bars.iloc[:end], ticker)
+        assert process(file, incremental=True)['new_rows'] > 0
+    incremental = outputs(ticker, file)
+
+    for name, a, b, rtol in zip(['csv', 'database', 'feature store'], full, incremental, [1e-9, 1e-9, 1e-6]):
+        assert list(a.columns) == list(b.columns), name
+        pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=rtol, atol=1e-9, check_dtype=False, obj=name)
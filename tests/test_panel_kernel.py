@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import clean_data
+import panel_kernel
+from synthetic_data import synthetic_ohlcv
+from conftest import write_raw
+
+columns = panel_kernel.feature_columns
+
+
+def assert_features_match(expected, actual, rtol=1e-9):
+    expected, actual = expected[columns].to_numpy(), actual[columns].to_numpy()
+    np.testing.assert_array_equal(np.isnan(expected), np.isnan(actual))
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=1e-9)
+
+
+# Gaps are left in: each NaN must only reach the windows that contain it.
+def test_kernel_matches_pandas_features_with_gaps():
+    df = synthetic_ohlcv(700, seed=1, missing_rate=0.02)
+    df.loc[5:8, ['open', 'high', 'low', 'close']] = np.nan
+    assert_features_match(clean_data.add_features(df.copy()), panel_kernel.add_features(df.copy()))
+
+
+def test_panel_of_uneven_histories_matches_per_ticker_features():
+    frames = [synthetic_ohlcv(days, seed, missing_rate=0.01) for seed, days in enumerate([30, 400, 19, 250])]
+    for df, featured in zip(frames, panel_kernel.add_panel_features(frames)):
+        assert_features_match(clean_data.add_features(df.copy()), featured)
+
+
+def test_clean_and_process_matches_pandas_engine(workdir):
+    file = write_raw(synthetic_ohlcv(600, seed=2, missing_rate=0.02, duplicate_rate=0.01), 'SYN00000')
+    expected, _ = clean_data.clean_and_process_data(file)
+    actual, _ = clean_data.clean_and_process_data(file, engine='numpy')
+    assert list(actual.columns) == list(expected.columns)
+    assert_features_match(expected, actual)
+
+
+# Long, high-priced and trending, with a gap: the rolling std must not lose
+# precision to the price level or to the length of the history.
+def test_rolling_std_is_stable_on_long_high_priced_series():
+    n = 3 * panel_kernel.block_days + 123
+    rng = np.random.default_rng(0)
+    close = 1e6 + 5.0 * np.arange(n) + np.cumsum(rng.normal(0, 0.1, n))
+    close[5000] = np.nan
+    panel = np.repeat(close[None, :, None], len(panel_kernel.panel_fields), axis=2)
+    std = panel_kernel.compute_panel_features(panel)[0, :, 3]
+
+    windows = sliding_window_view(close, 20)
+    expected = np.concatenate([np.full(19, np.nan), windows.std(axis=1, ddof=1)])
+    np.testing.assert_array_equal(np.isnan(std), np.isnan(expected))
+    np.testing.assert_allclose(std, expected, rtol=1e-7)
+    assert np.isnan(std[5000:5020]).all() and not np.isnan(std[5020])
@@ -0,0 +1,26 @@
+import pytest
+import app
+
+
+@pytest.fixture
+def client(workdir):
+    return app.app.test_client()
+
+
+def refresh(client, address='127.0.0.1', token=None):
+    headers = {} if token is None else {'X-Refresh-Token': token}
+    return client.post('/api/cache/refresh', json={}, headers=headers, environ_base={'REMOTE_ADDR': address})
+
+
+def test_without_a_token_only_loopback_may_refresh(client, monkeypatch):
+    monkeypatch.delenv('refresh_token', raising=False)
+    assert refresh(client).status_code == 200
+    assert refresh(client, '::1').status_code == 200
+    assert refresh(client, '10.0.0.5').status_code == 403
+
+
+def test_with_a_token_it_must_match(client, monkeypatch):
+    monkeypatch.setenv('refresh_token', 'shared')
+    assert refresh(client, '10.0.0.5', 'shared').status_code == 200
+    assert refresh(client).status_code == 403
+    assert refresh(client, token='other').status_code == 403
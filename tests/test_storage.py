@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+import app
+import clean_data
+import downsample
+import feature_store
+import storage
+import timeseries_db
+from synthetic_data import synthetic_ohlcv
+from conftest import write_raw
+
+tickers = ['SYN00000', 'SYN00001']
+
+
+# Two tickers cleaned by the pipeline into the CSVs, the feature store and the
+# database; returns the cleaned frames.
+@pytest.fixture
+def cleaned(workdir):
+    frames = {}
+    for seed, ticker in enumerate(tickers):
+        file = write_raw(synthetic_ohlcv(900, seed, missing_rate=0.01), ticker)
+        frames[ticker], _ = clean_data.clean_and_process_data(file)
+    return {ticker: df.reset_index(drop=True) for ticker, df in frames.items()}
+
+
+def assert_same(expected, actual, rtol=1e-12):
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                  check_exact=False, check_dtype=False, rtol=rtol, atol=rtol)
+
+
+def test_back_ends_return_the_cleaned_frame(cleaned):
+    for ticker, df in cleaned.items():
+        assert storage.in_database(ticker)
+        assert_same(df, timeseries_db.load_features(ticker))
+        assert_same(df, storage.load_features(ticker))
+        assert_same(df, feature_store.load_features(ticker), rtol=1e-6)
+    assert storage.list_tickers() == tickers
+
+
+def test_range_and_column_reads_match_slicing(cleaned):
+    df = cleaned[tickers[0]]
+    start, end = df['timestamp'].iloc[100], df['timestamp'].iloc[400]
+    columns = ['timestamp', 'close', 'normalized_close', 'scaled_volume']
+    expected = df[(df['timestamp'] >= start) & (df['timestamp'] <= end)][columns]
+    assert_same(expected, timeseries_db.load_features(tickers[0], columns, start, end))
+    assert_same(expected, feature_store.load_features(tickers[0], columns, start, end), rtol=1e-6)
+    assert_same(expected, pd.concat(timeseries_db.iter_bars(tickers[0], columns, start, end, chunk_rows=64)))
+
+    since = timeseries_db.load_since({ticker: start for ticker in tickers}, columns)
+    for ticker, rows in since.groupby('ticker', sort=False):
+        frame = cleaned[ticker]
+        assert_same(frame[frame['timestamp'] >= start][columns], rows[columns])
+
+
+# The API's query paths: the database's indexed scans and GROUP BY against the
+# pandas slicing and resampling of the whole frame.
+@pytest.mark.parametrize('args', [
+    {'resample': 'W'},
+    {'resample': 'M', 'columns': 'open,close,volume,scaled_volume'},
+    {'resample': 'D', 'start': '2000-06-01', 'end': '2001-03-15', 'limit': '40'},
+    {'resample': 'Q', 'cursor': '2001-01-01'},
+    {'columns': 'close,normalized_close', 'start': '2000-02-01', 'limit': '100'},
+    {'cursor': '2002-05-06', 'limit': '7'},
+])
+def test_database_queries_match_pandas(cleaned, args):
+    ticker = tickers[1]
+    columns = timeseries_db.bar_columns()
+    query = app.parse_query(args, columns)
+    expected, expected_cursor = app.query_frame(cleaned[ticker], query)
+    actual, cursor = app.query_database(ticker, columns, query)
+    assert cursor == expected_cursor
+    assert list(actual.columns) == list(expected.columns)
+    assert_same(expected, actual, rtol=1e-9)
+
+
+def test_database_period_totals_match_pandas(cleaned):
+    for ticker, df in cleaned.items():
+        expected = downsample.period_totals(df, 'volume')
+        actual = timeseries_db.period_totals(ticker, 'volume')
+        assert actual['period'].tolist() == expected['period'].tolist()
+        np.testing.assert_array_equal(actual['volume'].to_numpy(), expected['volume'].to_numpy())